@@ -1,9 +1,7 @@
 import os
+import time
 import asyncio
-import datetime
 import logging
-from github import Github
-from langchain_core.documents import Document
 
 # --- Import our custom modules ---
 from llm_clients import (
@@ -13,27 +11,59 @@ from llm_clients import (
     get_summarizer_chain,
     get_creator_chain
 )
-from vector_store import get_retriever, add_docs_to_store
+from vector_store import get_embeddings, get_vector_store, aget_vector_store, add_kb_entry_to_store, repo_file_path
+from kb_store import get_kb_store
+from diff_parser import parse_diff, summarize_diff, DiffSummary
+from diff_budget import (
+    estimate_tokens,
+    split_for_analysis,
+    trim_diff,
+    map_reduce_analysis,
+    ANALYZER_TOKEN_BUDGET,
+    REWRITER_DIFF_TOKEN_BUDGET
+)
+from pipeline import StageGraph, SkipStage
+from warmup import WarmUp
+from stream_relay import relay_stream
+from symbol_index import symbols_in_diff
+from github_pr import create_docs_pr, GITHUB_API_TOKEN
+from metrics import (
+    AGENT_RUNS,
+    AGENT_RUN_SECONDS,
+    AGENT_RUNS_IN_FLIGHT,
+    STAGE_SECONDS,
+    STAGE_SKIPS,
+    RETRIEVAL_K,
+    RETRIEVAL_SCORE
+)
+
+# --- Global "AI" Components ---
+# Loaded in the background by `warmup` (started from main.py), so the server accepts requests
+# immediately; webhooks that arrive earlier wait in the job queue until warm-up finishes.
+vector_db, analyzer_chain, rewriter_chain, creator_chain, summarizer_chain = None, None, None, None, None
+
+
+def _load_vector_store():
+    global vector_db
+    vector_db = get_vector_store() # Default namespace's index; other repositories' load on first use
 
-# --- Load GitHub Token ---
-GITHUB_API_TOKEN = os.getenv("GITHUB_API_TOKEN")
 
-# --- Initialize Global "AI" Components ---
-try:
-    print("Warming up AI components...")
-    retriever = get_retriever()
+def _load_chains():
+    global analyzer_chain, rewriter_chain, creator_chain, summarizer_chain
     analyzer_chain = get_analyzer_chain()
     rewriter_chain = get_rewriter_chain()
     creator_chain = get_creator_chain()
     summarizer_chain = get_summarizer_chain()
-    print("✅ AI components are ready.")
-except Exception as e:
-    print(f"🔥 FATAL ERROR: Failed to initialize AI components: {e}")
-    retriever, analyzer_chain, rewriter_chain, creator_chain, summarizer_chain = None, None, None, None, None
 
-# --- GitHub PR Creation Logic (Synchronous) ---
+
+warmup = WarmUp()
+warmup.component("embeddings", get_embeddings)
+warmup.component("vector_store", _load_vector_store, deps=("embeddings",))
+warmup.component("llm_chains", _load_chains)
+
+
 def _create_github_pr_sync(logger, repo_name, pr_number, pr_title, pr_body, source_files, new_content):
-    """Creates a new branch, updates files, and opens a pull request. (BLOCKING)"""
+    """Commits all updated files to a new branch in one commit and opens a pull request. (BLOCKING)"""
     # Get a logger instance within the thread to ensure it's configured
     logger = logging.getLogger(__name__)
 
@@ -41,68 +71,20 @@ def _create_github_pr_sync(logger, repo_name, pr_number, pr_title, pr_body, sour
         return "Error: GITHUB_API_TOKEN not set."
 
     try:
-        # 1. Authenticate and get repo
-        g = Github(GITHUB_API_TOKEN)
-        repo = g.get_repo(repo_name)
-        
-        # 2. Get the default branch (e.g., 'main')
-        default_branch = repo.get_branch(repo.default_branch)
-        
-        # 3. Create a new branch name
-        new_branch_name = f"ai-docs-fix-pr-{pr_number}"
-        
-        # 4. Create the new branch from the default branch
-        try:
-            repo.create_git_ref(
-                ref=f"refs/heads/{new_branch_name}",
-                sha=default_branch.commit.sha
-            )
-        except Exception as e:
-            if "Reference already exists" in str(e):
-                logger.info(f"Branch '{new_branch_name}' already exists. Proceeding...")
-            else:
-                raise e
-
-        # 5. Update the files
-        commit_message = f"docs: AI-generated updates for PR #{pr_number}"
-        
-        files_updated_count = 0
-        for file_path in source_files:
-            try:
-                # Get the file to get its SHA (required for update)
-                contents = repo.get_contents(file_path, ref=default_branch.name)
-                
-                # Update the file on the *new branch*
-                repo.update_file(
-                    path=contents.path,
-                    message=commit_message,
-                    content=new_content, # Using the full AI rewrite
-                    sha=contents.sha,
-                    branch=new_branch_name
-                )
-                logger.info(f"Successfully updated file: {file_path}")
-                files_updated_count += 1
-            except Exception as e:
-                if "409" in str(e):
-                    logger.error(f"GitHub 409 Conflict Error for file {file_path}. This is likely a race condition from another agent run. The file on the server has changed since this agent started.", exc_info=True)
-            except Exception as e:
-                logger.warning(f"Failed to update file {file_path}: {e}. Skipping...")
-
-        # 6. Create the Pull Request
-        if files_updated_count == 0:
-            logger.warning("No files were successfully updated, skipping PR creation.")
-            return "Error: No files were updated, so no PR was created."
-
-        pr = repo.create_pull(
-            title=pr_title,
-            body=pr_body,
-            head=new_branch_name,
-            base=repo.default_branch  # The branch to merge into
+        pr_url = create_docs_pr(
+            repo_name=repo_name,
+            branch_name=f"ai-docs-fix-pr-{pr_number}",
+            pr_title=pr_title,
+            pr_body=pr_body,
+            commit_message=f"docs: AI-generated updates for PR #{pr_number}",
+            files={file_path: new_content for file_path in source_files}, # Using the full AI rewrite
         )
-        
-        print(f"Successfully created PR: {pr.html_url}")
-        return pr.html_url
+        print(f"Successfully created PR: {pr_url}")
+        return pr_url
 
+    except ValueError as e:
+        logger.warning("No files were successfully updated, skipping PR creation.")
+        return f"Error: {e}"
     except Exception as e:
         logger.error(f"Error creating GitHub PR: {e}", exc_info=True)
         return f"Error: {e}"
@@ -119,209 +101,325 @@ async def create_github_pr_async(*args, **kwargs):
     return pr_url
 
 # --- NEW: Knowledge Base Update Logic ---
-async def update_knowledge_base(logger, broadcaster, new_documentation: str):
-    """Appends the newly generated documentation to the central knowledge base."""
-    knowledge_base_path = os.path.join(os.path.dirname(__file__), 'data', '@Knowledge_base.md')
-    
+async def update_knowledge_base(logger, broadcaster, new_documentation: str, key: str = None, metadata: dict = None):
+    """
+    Appends the newly generated documentation to the KB store. An entry with the same
+    `key` supersedes the previous one; identical content is not stored twice.
+    Returns the stored entry, or None if nothing was stored.
+    """
     try:
         await broadcaster("log-step", "Updating central knowledge base...")
-        
-        # Create a formatted entry with a timestamp
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        update_entry = (
-            f"\n\n---\n\n"
-            f"### AI-Generated Update ({timestamp})\n\n"
-            f"{new_documentation}\n"
-        )
-        
-        # Append to the file asynchronously
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, lambda: 
-            _append_to_file_sync(knowledge_base_path, update_entry)
-        )
-        await broadcaster("log-step", "✅ Knowledge base updated.")
+        record = await asyncio.to_thread(get_kb_store().append, new_documentation, key, metadata)
+        if record is None:
+            await broadcaster("log-step", "Knowledge base already has this update. Skipping.")
+        elif record["superseded"]:
+            await broadcaster("log-step", "✅ Knowledge base updated (replaced an older entry for the same files).")
+        else:
+            await broadcaster("log-step", "✅ Knowledge base updated.")
+        return record
     except Exception as e:
         logger.error(f"Failed to update knowledge base: {e}", exc_info=True)
         await broadcaster("log-error", f"Could not update knowledge base: {e}")
-
-def _append_to_file_sync(file_path: str, content: str):
-    """Synchronous file append operation."""
-    with open(file_path, "a", encoding="utf-8") as f:
-        f.write(content)
+        return None
 
 def _extract_changed_lines(git_diff: str) -> str:
-    """A helper to extract only the added/modified lines from a git diff."""
-    changed_lines = []
-    for line in git_diff.split('\n'):
-        # We only care about lines that were added.
-        if line.startswith('+') and not line.startswith('+++'):
-            changed_lines.append(line[1:]) # Remove the '+'
-    
-    return "\n".join(changed_lines)
+    """
+    A helper to extract only the changed lines from a git diff, per file.
+    Ignored files (lockfiles, generated, vendored) and whitespace/comment/docstring-only
+    changes are dropped locally, so they never reach the analyzer.
+    """
+    return summarize_diff(parse_diff(git_diff.split('\n'))).concise_diff
+
+def _relevant_files(git_diff: str) -> list:
+    """Parses a diff into the per-file diffs that survive the local filter."""
+    return DiffSummary(list(parse_diff(git_diff.split('\n')))).relevant
 
 # --- Updated Core Agent Logic ---
 
-async def run_agent_analysis(logger, broadcaster, git_diff: str, pr_title: str, repo_name: str, pr_number: str, user_name: str):
-    """This is the main 'brain' of the agent. It runs the full analysis-retrieval-rewrite pipeline."""
-    
-    if not retriever:
+class AgentNotReadyError(RuntimeError):
+    """Raised when a run arrives before the AI components have loaded."""
+
+
+async def run_agent_analysis(logger, broadcaster, git_diff: str, pr_title: str, repo_name: str, pr_number: str, user_name: str, concise_diff: str = None):
+    """
+    This is the main 'brain' of the agent. It runs the full analysis-retrieval-rewrite pipeline.
+    `concise_diff` can be passed in when the added lines were already extracted while streaming the diff.
+
+    The steps are expressed as a StageGraph, so stages that don't depend on each other
+    (the dashboard summary, and the KB update / PR creation once the new documentation
+    exists) run concurrently. Per-stage timings are logged at the end and, with the
+    run's outcome and duration, exported as metrics.
+
+    Raises if the run fails or the AI components are not ready, so the job queue retries it.
+    """
+    start = time.perf_counter()
+
+    def record(outcome: str):
+        AGENT_RUNS.inc(outcome=outcome)
+        AGENT_RUN_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+
+    try:
+        with AGENT_RUNS_IN_FLIGHT.track_in_progress():
+            outcome = await _run_agent_analysis(logger, broadcaster, git_diff, pr_title, repo_name, pr_number, user_name, concise_diff)
+    except Exception:
+        record("error")
+        raise
+    record(outcome)
+    if outcome == "not_ready":
+        raise AgentNotReadyError("Agent AI components are not ready.")
+
+async def _run_agent_analysis(logger, broadcaster, git_diff: str, pr_title: str, repo_name: str, pr_number: str, user_name: str, concise_diff: str = None) -> str:
+    """Runs the pipeline for run_agent_analysis() and returns the outcome label for metrics. Re-raises errors."""
+    if not (vector_db and analyzer_chain):
         print("Agent failed: AI components are not initialized.")
         await broadcaster("log-error", "Error: Agent AI components are not ready.")
-        return
+        return "not_ready"
 
     try:
-        # --- Step 1: Analyze the code diff ---
         # --- TOKEN OPTIMIZATION: Analyze only the changed lines ---
-        concise_diff = _extract_changed_lines(git_diff)
+        if concise_diff is None:
+            concise_diff = _extract_changed_lines(git_diff)
         if not concise_diff:
             await broadcaster("log-skip", "No functional code changes detected in diff.")
-            return
+            return "no_changes"
 
         await broadcaster("log-step", f"Analyzing diff for PR: '{pr_title}'...")
-        analysis = await analyzer_chain.ainvoke({"git_diff": concise_diff})
-        analysis_summary = analysis.get('analysis_summary', 'No analysis summary provided.')
-        
+
+        # Each repository has its own index namespace; loading a cold one happens off the event loop.
+        store = await aget_vector_store(repo_name)
+
+        # --- TOKEN BUDGET: Large diffs are analyzed in chunks and trimmed for the writers ---
+        analysis_chunks, diff_files = None, None
+        prompt_diff, rewriter_diff = concise_diff, git_diff
+        if estimate_tokens(concise_diff) > ANALYZER_TOKEN_BUDGET or estimate_tokens(git_diff) > REWRITER_DIFF_TOKEN_BUDGET:
+            diff_files = await asyncio.to_thread(_relevant_files, git_diff)
+            if estimate_tokens(concise_diff) > ANALYZER_TOKEN_BUDGET:
+                analysis_chunks = split_for_analysis(diff_files, ANALYZER_TOKEN_BUDGET)
+                prompt_diff = trim_diff(diff_files, ANALYZER_TOKEN_BUDGET, concise=True)
+            rewriter_diff = trim_diff(diff_files, REWRITER_DIFF_TOKEN_BUDGET)
+
+        graph = StageGraph()
+
+        # --- Step 1: Analyze the code diff ---
+        @graph.stage("analyze")
+        async def analyze():
+            if not analysis_chunks:
+                return await analyzer_chain.ainvoke({"git_diff": concise_diff})
+            # Map-reduce: analyze each chunk concurrently, then merge into one verdict.
+            await broadcaster("log-step", f"Large diff: analyzing {len(analysis_chunks)} chunks in parallel...")
+            return await map_reduce_analysis(analyzer_chain, analysis_chunks)
+
         # --- NEW: Generate the clean, human-readable log message ---
-        human_readable_summary = await summarizer_chain.ainvoke({
-            "user_name": user_name,
-            "analysis_summary": analysis_summary,
-            "git_diff": concise_diff # Use the concise diff here as well
-        })
-        # Broadcast the clean summary instead of the raw analysis
-        await broadcaster("log-summary", human_readable_summary)
+        # It only feeds the dashboard, so it runs alongside the rest of the pipeline.
+        @graph.stage("summarize", deps=("analyze",))
+        async def summarize(analysis):
+            # A failed summary must not fail (and so retry) a run whose PR may already be open.
+            try:
+                human_readable_summary = await summarizer_chain.ainvoke({
+                    "user_name": user_name,
+                    "analysis_summary": analysis.get('analysis_summary', 'No analysis summary provided.'),
+                    "git_diff": prompt_diff # Use the concise diff here as well
+                })
+            except Exception as e:
+                logger.error(f"Summarizer failed for PR #{pr_number} ({repo_name}): {e}")
+                await broadcaster("log-error", "Could not summarize the change; continuing without a summary.")
+                return None
+            # Broadcast the clean summary instead of the raw analysis
+            await broadcaster("log-summary", human_readable_summary)
+
+        # --- Parse the changed files once; retrieval and the KB update both use them ---
+        @graph.stage("changed_files")
+        async def changed_files():
+            if diff_files is not None:
+                return diff_files
+            return await asyncio.to_thread(_relevant_files, git_diff)
 
         # --- Step 2: Gatekeeping ---
-        if not analysis.get('is_functional_change', False):
-            await broadcaster("log-skip", "Trivial change detected. No doc update needed.")
-            return
+        @graph.stage("gate", deps=("analyze",))
+        async def gate(analysis):
+            if not analysis.get('is_functional_change', False):
+                await broadcaster("log-skip", "Trivial change detected. No doc update needed.")
+                raise SkipStage()
+            return analysis.get('analysis_summary', 'No analysis summary provided.')
 
         # --- Step 3: Retrieve relevant old docs ---
-        await broadcaster("log-step", "Functional change. Searching for relevant docs...")
-        # Use `aget_relevant_documents` which returns scores with FAISS
-        docs_with_scores = await retriever.vectorstore.asimilarity_search_with_relevance_scores(
-            analysis_summary, k=5
-        )
-        
-        # FIX: Correctly unpack the list of (Document, score) tuples
-        retrieved_docs = [doc for doc, _ in docs_with_scores]
-        scores = [score for _, score in docs_with_scores]
-        
-        # Calculate confidence score (highest similarity)
-        confidence_score = max(scores) if scores else 0.0
-        confidence_percent = f"{confidence_score * 100:.1f}%"
-
-        await broadcaster("log-step", f"Found {len(retrieved_docs)} relevant doc snippets. Confidence: {confidence_percent}")
-
-        # --- CORE LOGIC CHANGE: Always generate, but decide between "Create" and "Update" ---
-        confidence_threshold = float(os.getenv("CONFIDENCE_THRESHOLD", 0.2))
-        pr_body_note = ""
-
-        if not retrieved_docs or confidence_score < confidence_threshold:
-            # CREATE MODE: No relevant docs found or confidence is too low.
-            await broadcaster("log-step", "Low confidence or no docs found. Switching to 'Create Mode'...")
-            new_documentation = await creator_chain.ainvoke({
-                "analysis_summary": analysis_summary,
-                "git_diff": concise_diff # Use the concise diff
-            })
-            raw_paths = [os.path.join('data', 'Knowledge_Base.md')]
-            if confidence_score > 0:
-                pr_body_note = f"**⚠️ Low Confidence Warning:** This documentation was generated with a low confidence score of {confidence_percent}. Please review carefully."
-        else:
-            # UPDATE MODE: High confidence, proceed with rewriting.
-            await broadcaster("log-step", "Relevant docs found. Generating updates with LLM...")
-            old_docs_context = format_docs_for_context(retrieved_docs)
-            new_documentation = await rewriter_chain.ainvoke({
-                "analysis_summary": analysis_summary,
-                "old_docs_context": old_docs_context,
-                "git_diff": git_diff # The rewriter gets the full diff for context
-            })
-            raw_paths = list(set([doc.metadata.get('source') for doc in retrieved_docs]))
-        
-        await broadcaster("log-step", "✅ New documentation generated.")
-        
+        @graph.stage("retrieve", deps=("gate", "changed_files"))
+        async def retrieve(analysis_summary, files):
+            await broadcaster("log-step", "Functional change. Searching for relevant docs...")
+            # Docs that name a changed function or class are found by symbol lookup first.
+            # They count as exact matches (score 1.0); the search only fills the remaining slots.
+            symbols = symbols_in_diff(files)
+            symbol_docs = await asyncio.to_thread(store.docs_for_symbols, symbols, 5) if symbols else []
+            if symbol_docs:
+                await broadcaster("log-step", f"{len(symbol_docs)} doc snippets reference changed symbols ({', '.join(symbols[:5])}).")
+            docs_with_scores = [(doc, 1.0) for doc in symbol_docs]
+            if len(symbol_docs) < 5:
+                # Search the repository's in-memory index; it already includes chunks added by earlier runs.
+                # Dense and BM25 results are fused, so exact identifiers from the diff are found too.
+                found = {doc.page_content for doc in symbol_docs}
+                searched = await store.asearch_with_relevance_scores(analysis_summary, k=5)
+                docs_with_scores += [(doc, score) for doc, score in searched if doc.page_content not in found][:5 - len(symbol_docs)]
+            
+            # FIX: Correctly unpack the list of (Document, score) tuples
+            retrieved_docs = [doc for doc, _ in docs_with_scores]
+            scores = [score for _, score in docs_with_scores]
+            
+            # Calculate confidence score (highest similarity)
+            confidence_score = max(scores) if scores else 0.0
+            confidence_percent = f"{confidence_score * 100:.1f}%"
+
+            RETRIEVAL_K.observe(len(retrieved_docs))
+            if scores:
+                RETRIEVAL_SCORE.observe(confidence_score, rank="top")
+            for score in scores:
+                RETRIEVAL_SCORE.observe(score, rank="all")
+
+            await broadcaster("log-step", f"Found {len(retrieved_docs)} relevant doc snippets. Confidence: {confidence_percent}")
+            return retrieved_docs, confidence_score
+
+        # --- Step 4: Generate the documentation ---
+        @graph.stage("generate", deps=("gate", "retrieve"))
+        async def generate(analysis_summary, retrieval):
+            retrieved_docs, confidence_score = retrieval
+            confidence_percent = f"{confidence_score * 100:.1f}%"
+
+            # --- CORE LOGIC CHANGE: Always generate, but decide between "Create" and "Update" ---
+            confidence_threshold = float(os.getenv("CONFIDENCE_THRESHOLD", 0.2))
+            pr_body_note = ""
+
+            if not retrieved_docs or confidence_score < confidence_threshold:
+                # CREATE MODE: No relevant docs found or confidence is too low.
+                await broadcaster("log-step", "Low confidence or no docs found. Switching to 'Create Mode'...")
+                new_documentation = await relay_stream(creator_chain.astream({
+                    "analysis_summary": analysis_summary,
+                    "git_diff": prompt_diff # Use the concise diff
+                }), broadcaster, label="New documentation")
+                raw_paths = [os.path.join('data', 'Knowledge_Base.md')]
+                if confidence_score > 0:
+                    pr_body_note = f"**⚠️ Low Confidence Warning:** This documentation was generated with a low confidence score of {confidence_percent}. Please review carefully."
+            else:
+                # UPDATE MODE: High confidence, proceed with rewriting.
+                await broadcaster("log-step", "Relevant docs found. Generating updates with LLM...")
+                old_docs_context = format_docs_for_context(retrieved_docs)
+                new_documentation = await relay_stream(rewriter_chain.astream({
+                    "analysis_summary": analysis_summary,
+                    "old_docs_context": old_docs_context,
+                    "git_diff": rewriter_diff # The rewriter gets the full diff (within budget) for context
+                }), broadcaster, label="Updated documentation")
+                raw_paths = list(set([doc.metadata.get('source') for doc in retrieved_docs]))
+            
+            await broadcaster("log-step", "✅ New documentation generated.")
+            return {
+                "new_documentation": new_documentation,
+                "raw_paths": raw_paths,
+                "confidence_percent": confidence_percent,
+                "pr_body_note": pr_body_note,
+            }
+
         # --- Step 5: Update the Knowledge Base ---
         # The agent now "remembers" what it wrote by adding it to the central guide.
-        await update_knowledge_base(logger, broadcaster, new_documentation)
+        # A newer update for the same repo and changed files replaces the older entry.
+        @graph.stage("knowledge_base", deps=("generate", "changed_files"))
+        async def append_knowledge_base(generated, files):
+            paths = sorted(f.path for f in files)
+            return await update_knowledge_base(
+                logger, broadcaster, generated["new_documentation"],
+                key=f"{repo_name}:{','.join(paths)}" if paths else None,
+                metadata={"repo": repo_name, "pr_number": pr_number, "files": paths},
+            )
 
         # --- Step 6: Incrementally update the vector store (EFFICIENT) ---
-        await broadcaster("log-step", "Incrementally updating vector store with new knowledge...")
-        new_doc = Document(page_content=new_documentation, metadata={"source": os.path.join('data', 'Knowledge_Base.md')})
-        await asyncio.to_thread(add_docs_to_store, [new_doc])
-        await broadcaster("log-step", "✅ Knowledge base is now up-to-date.")
-
-        # --- Step 7: Package the results for the PR ---
-        
-        # --- THIS IS THE FIX: Use the `raw_paths` determined in the Create/Update logic ---
-        source_files = []
-        for path in raw_paths:
-            # 1. Fix Windows slashes
-            fixed_path = path.replace("\\", "/") 
-            
-            # 2. Add the 'backend/' prefix (since docs are in 'backend/data/')
-            if not fixed_path.startswith("backend/"):
-                fixed_path = f"backend/{fixed_path}"
-                
-            source_files.append(fixed_path)
-        
-        print(f"Identified source files to update: {source_files}")
-
-        
-        pr_data = {
-            "new_content": new_documentation,
-            "source_files": source_files,
-            "pr_title": f"docs: AI update for '{pr_title}' (PR #{pr_number})",
-            "pr_body": (f"This is an AI-generated documentation update for PR #{pr_number}, originally authored by **@{user_name}**.\n\n"
-                        f"**Confidence Score:** {confidence_percent}\n\n"
-                        f"{pr_body_note}\n\n"
-                        f"**Original PR:** '{pr_title}'\n**AI Analysis:** {analysis_summary}")
-        }
-
-        # --- Step 8: Create the GitHub PR ---
-        await broadcaster("log-step", "Attempting to create GitHub pull request...")
-        
-        try:
-            pr_url = await create_github_pr_async(
-                repo_name=repo_name,
-                logger=logger,
-                pr_number=pr_number,
-                pr_title=pr_data["pr_title"],
-                pr_body=pr_data["pr_body"],
-                source_files=pr_data["source_files"],
-                new_content=pr_data["new_content"]
-            )
+        @graph.stage("vector_store", deps=("knowledge_base",))
+        async def add_to_vector_store(record):
+            if record is None:
+                raise SkipStage()
+            await broadcaster("log-step", "Incrementally updating vector store with new knowledge...")
+            await asyncio.to_thread(add_kb_entry_to_store, record)
+            await broadcaster("log-step", "✅ Knowledge base is now up-to-date.")
+
+        # --- Steps 7-9: Package the results, create the PR and log the outcome ---
+        @graph.stage("pull_request", deps=("gate", "generate"))
+        async def open_pull_request(analysis_summary, generated):
+            await _open_docs_pr(logger, broadcaster, generated, analysis_summary, pr_title, repo_name, pr_number, user_name)
 
-            if "Error" in pr_url:
-                # Don't broadcast noisy errors to the frontend
-                result_message = f"Agent failed during PR creation. Reason: {pr_url}"
-            else:
-                result_message = f"Successfully created documentation PR: {pr_url}"
-                await broadcaster("log-action", f"✅ Successfully created PR: {pr_url}")
-
-        except Exception as e:
-            result_message = f"Agent failed during PR creation with error: {e}"
-            # Log the exception traceback for debugging
-            logger.error(f"Agent failed for PR #{pr_number} ({repo_name}) with error: {e}", exc_info=True)
-
-        # --- Step 9: Log the final result ---
-        if "Successfully" in result_message:
-            # On success, log the specific format you requested.
-            log_entry = (
-                f"This is an AI-generated documentation update for PR #{pr_number}, "
-                f"originally authored by @{user_name}.\n"
-                f"Original PR: '{pr_title}' AI Analysis: {analysis_summary}"
-            )
-            logger.info(log_entry)
-        else:
-            # On failure, log a simpler error message for clarity.
-            logger.error(
-                f"AGENT FAILED for PR #{pr_number} ({repo_name}). Reason: {result_message}"
-            )
+        try:
+            await graph.run()
+        finally:
+            for stage, seconds in graph.timings.items():
+                STAGE_SECONDS.observe(seconds, stage=stage)
+            for stage in graph.skipped:
+                STAGE_SKIPS.inc(stage=stage)
+            logger.info(f"Stage timings for PR #{pr_number} ({repo_name}): {graph.format_timings()}")
+            await broadcaster("log-step", f"⏱️ Stage timings: {graph.format_timings()}")
+        return "trivial" if "gate" in graph.skipped else "completed"
 
     except Exception as e:
         # Catch all other exceptions and log them without crashing or flooding the UI
         logger.error(f"Agent failed for PR #{pr_number} ({repo_name}) with error: {e}", exc_info=True)
         await broadcaster("log-skip", f"An unexpected error occurred. See server logs for details.")
-        return
+        raise
+
+async def _open_docs_pr(logger, broadcaster, generated: dict, analysis_summary: str, pr_title: str, repo_name: str, pr_number: str, user_name: str):
+    """Packages the generated documentation into a PR, creates it, and logs the final result."""
+    # --- Step 7: Package the results for the PR ---
+    
+    # --- THIS IS THE FIX: Use the `raw_paths` determined in the Create/Update logic ---
+    # Chunk sources are local paths; map them to the files' paths in the target repository.
+    source_files = [repo_file_path(path, repo_name) for path in generated["raw_paths"]]
+    
+    print(f"Identified source files to update: {source_files}")
+
+    
+    pr_data = {
+        "new_content": generated["new_documentation"],
+        "source_files": source_files,
+        "pr_title": f"docs: AI update for '{pr_title}' (PR #{pr_number})",
+        "pr_body": (f"This is an AI-generated documentation update for PR #{pr_number}, originally authored by **@{user_name}**.\n\n"
+                    f"**Confidence Score:** {generated['confidence_percent']}\n\n"
+                    f"{generated['pr_body_note']}\n\n"
+                    f"**Original PR:** '{pr_title}'\n**AI Analysis:** {analysis_summary}")
+    }
+
+    # --- Step 8: Create the GitHub PR ---
+    await broadcaster("log-step", "Attempting to create GitHub pull request...")
+    
+    try:
+        pr_url = await create_github_pr_async(
+            repo_name=repo_name,
+            logger=logger,
+            pr_number=pr_number,
+            pr_title=pr_data["pr_title"],
+            pr_body=pr_data["pr_body"],
+            source_files=pr_data["source_files"],
+            new_content=pr_data["new_content"]
+        )
+
+        if "Error" in pr_url:
+            # Don't broadcast noisy errors to the frontend
+            result_message = f"Agent failed during PR creation. Reason: {pr_url}"
+        else:
+            result_message = f"Successfully created documentation PR: {pr_url}"
+            await broadcaster("log-action", f"✅ Successfully created PR: {pr_url}")
+
+    except Exception as e:
+        result_message = f"Agent failed during PR creation with error: {e}"
+        # Log the exception traceback for debugging
+        logger.error(f"Agent failed for PR #{pr_number} ({repo_name}) with error: {e}", exc_info=True)
+
+    # --- Step 9: Log the final result ---
+    if "Successfully" in result_message:
+        # On success, log the specific format you requested.
+        log_entry = (
+            f"This is an AI-generated documentation update for PR #{pr_number}, "
+            f"originally authored by @{user_name}.\n"
+            f"Original PR: '{pr_title}' AI Analysis: {analysis_summary}"
+        )
+        logger.info(log_entry)
+    else:
+        # On failure, log a simpler error message for clarity.
+        logger.error(
+            f"AGENT FAILED for PR #{pr_number} ({repo_name}). Reason: {result_message}"
+        )
 
 # --- Self-Test ---
 if __name__ == "__main__":
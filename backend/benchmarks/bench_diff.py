@@ -0,0 +1,19 @@
+from harness import measure, result
+from fakes import make_diff
+
+
+def run(sizes_mb: list, repeat: int) -> list:
+    """Times the local diff filter (parse, classify, concise diff) on multi-MB diffs."""
+    from agent_logic import _extract_changed_lines
+
+    results = []
+    for size_mb in sizes_mb:
+        git_diff = make_diff(int(size_mb * 1024 * 1024))
+        concise = _extract_changed_lines(git_diff)
+        stats = measure(lambda: _extract_changed_lines(git_diff), repeat=repeat)
+        results.append(result(
+            "extract_changed_lines", {"diff_mb": size_mb}, stats,
+            mb_per_s=round(len(git_diff) / 1024 / 1024 / stats["median_s"], 1),
+            concise_ratio=round(len(concise) / len(git_diff), 3),
+        ))
+    return results
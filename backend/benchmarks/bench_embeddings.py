@@ -0,0 +1,70 @@
+import os
+import time
+import random
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from harness import summarize_timings, result
+from fakes import paragraph
+
+# Unlike the other groups this one runs the real embedding models, downloaded on first use.
+# The quantized ONNX model stays in the backend's ONNX_MODEL_DIR, so later runs don't re-quantize it.
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def _embed_in_fresh_process(backend: str, texts: list, batch_size: int) -> dict:
+    # Runs in its own process, so peak RSS is this backend's alone.
+    os.environ["EMBEDDING_BATCH_SIZE"] = str(batch_size)
+    from embedding_backends import make_embeddings
+
+    baseline_mb = _peak_rss_mb()
+    start = time.perf_counter()
+    embeddings = make_embeddings(backend)
+    embeddings.embed_documents(texts[:batch_size])  # warm-up
+    load_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    return {
+        "seconds": time.perf_counter() - start,
+        "load_seconds": load_seconds,
+        "model_rss_mb": _peak_rss_mb() - baseline_mb,
+        "peak_rss_mb": _peak_rss_mb(),
+        "vectors": vectors,
+    }
+
+
+def run_backends(num_chunks: int, batch_size: int = 64) -> list:
+    """
+    Embeds `num_chunks` chunk-sized paragraphs with each embeddings backend, each in a
+    fresh process: chunks per second, load time and resident memory, plus the cosine
+    agreement of every other backend with the reference (huggingface).
+    """
+    from embedding_backends import BACKENDS, cosine_agreement
+
+    rng = random.Random(7)
+    texts = [paragraph(rng) for _ in range(num_chunks)]
+    results, reference = [], None
+    for backend in BACKENDS:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                run = pool.submit(_embed_in_fresh_process, backend, texts, batch_size).result()
+            except Exception as e:
+                print(f"  {'embed_documents':<28} {'backend=' + backend:<32} skipped: {e}")
+                continue
+        extra = {
+            "chunks_per_s": round(num_chunks / run["seconds"], 1),
+            "load_s": round(run["load_seconds"], 2),
+            "model_rss_mb": round(run["model_rss_mb"], 1),
+            "peak_rss_mb": round(run["peak_rss_mb"], 1),
+        }
+        if backend == "huggingface":
+            reference = run["vectors"]
+        elif reference is not None:
+            agreement = cosine_agreement(reference, run["vectors"])
+            extra.update(cosine_min=agreement["min"], cosine_mean=agreement["mean"])
+        results.append(result("embed_documents", {"backend": backend, "chunks": num_chunks, "batch": batch_size},
+                              summarize_timings([run["seconds"]]), **extra))
+    return results
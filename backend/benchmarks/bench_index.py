@@ -0,0 +1,85 @@
+import time
+import numpy as np
+from harness import summarize_timings, result
+from fakes import EMBEDDING_DIM
+
+NUM_QUERIES = 200
+K = 10
+# Query-time settings swept per index type: more lists/candidates scanned = higher recall, slower.
+NPROBE_SWEEP = [1, 4, 16, 64]
+EF_SEARCH_SWEEP = [16, 64, 256]
+
+
+def _clustered_vectors(num_vectors: int, dim: int = EMBEDDING_DIM, seed: int = 0) -> tuple:
+    """
+    Unit vectors scattered around random topic centers, like real document embeddings
+    (uniformly random vectors have no neighbourhoods for an approximate index to find).
+    Queries are perturbed copies of corpus vectors.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(num_vectors // 100, 1), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), num_vectors)]
+    vectors += 0.5 * rng.standard_normal((num_vectors, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.choice(num_vectors, NUM_QUERIES, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+
+def _search(index, queries: np.ndarray) -> tuple:
+    """Searches one query at a time (as the agent does). Returns (labels, timing stats)."""
+    index.search(queries[:5], K)
+    labels, samples = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, found = index.search(query[None, :], K)
+        samples.append(time.perf_counter() - start)
+        labels.append(found[0])
+    return np.array(labels), summarize_timings(samples)
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return round(float(np.mean([len(set(f) & set(t)) / K for f, t in zip(found, truth)])), 4)
+
+
+def run_index_types(sizes: list) -> list:
+    """
+    Builds every index type vector_index supports at each corpus size and reports build
+    time, memory, and recall@10 against the exact (flat) index together with per-query
+    latency, across a sweep of nprobe (IVF) and efSearch (HNSW).
+    """
+    import vector_index
+
+    results = []
+    for num_vectors in sizes:
+        vectors, queries = _clustered_vectors(num_vectors)
+        truth = None
+        for index_type in vector_index.INDEX_TYPES:
+            start = time.perf_counter()
+            index = vector_index.new_index(vectors, index_type, min_vectors=0)
+            index.add(vectors)
+            build_s = time.perf_counter() - start
+            info = vector_index.describe(index, with_size=True)
+            params = {"vectors": num_vectors, "type": index_type}
+            results.append(result("index_build", params, summarize_timings([build_s]),
+                                  mb=round(info["bytes"] / 1024 / 1024, 1)))
+
+            if index_type in ("ivf_flat", "ivf_pq"):
+                sweep = [("nprobe", value) for value in NPROBE_SWEEP if value <= info["nlist"]]
+            elif index_type == "hnsw":
+                sweep = [("ef_search", value) for value in EF_SEARCH_SWEEP]
+            else:
+                sweep = [(None, None)]
+            for setting, value in sweep:
+                if setting:
+                    vector_index.configure_search(index, **{setting: value})
+                found, stats = _search(index, queries)
+                if truth is None:  # "flat" comes first in INDEX_TYPES
+                    truth = found
+                search_params = {**params, setting: value} if setting else params
+                results.append(result("index_search", search_params, stats,
+                                      recall_at_10=_recall(found, truth),
+                                      qps=round(1 / stats["mean_s"])))
+            del index
+    return results
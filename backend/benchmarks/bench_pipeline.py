@@ -0,0 +1,104 @@
+import random
+import asyncio
+import logging
+import time
+import itertools
+from langchain_core.documents import Document
+from harness import measure, ameasure, result, quiet, summarize_timings
+from fakes import FakeChain, make_diff, paragraph
+
+
+def run_format_docs(doc_counts: list, repeat: int) -> list:
+    from llm_clients import format_docs_for_context
+
+    rng = random.Random(3)
+    results = []
+    for count in doc_counts:
+        docs = [Document(page_content=paragraph(rng), metadata={"source": f"data/doc_{i}.md"}) for i in range(count)]
+        stats = measure(lambda: format_docs_for_context(docs), repeat=repeat * 20)
+        results.append(result("format_docs_for_context", {"docs": count}, stats))
+    return results
+
+
+def run_agent_pipeline(diff_sizes_kb: list, repeat: int) -> list:
+    """
+    Times run_agent_analysis() end to end with instant fake chains and a stubbed PR call,
+    i.e. the orchestration, diff handling, retrieval and KB/index updates around the LLM.
+    """
+    import agent_logic
+    import vector_store
+
+    agent_logic.vector_db = vector_store.get_vector_store()  # whatever index the earlier benchmarks left resident
+    counter = itertools.count()
+    agent_logic.analyzer_chain = FakeChain({"is_functional_change": True, "analysis_summary": "Functional change: updated the pipeline."})
+    agent_logic.summarizer_chain = FakeChain("Updated the pipeline.")
+    agent_logic.rewriter_chain = FakeChain(lambda inputs: f"# Updated docs {next(counter)}\n\n" + inputs["analysis_summary"])
+    agent_logic.creator_chain = FakeChain(lambda inputs: f"# New docs {next(counter)}\n\n" + inputs["analysis_summary"])
+
+    async def fake_create_pr(**kwargs):
+        return "https://github.com/example/repo/pull/1"
+    agent_logic.create_github_pr_async = fake_create_pr
+
+    async def broadcaster(event_type, data):
+        pass
+
+    logger = logging.getLogger("benchmarks")
+    logger.setLevel(logging.WARNING)
+
+    async def measure_all():
+        results = []
+        for size_kb in diff_sizes_kb:
+            git_diff = make_diff(size_kb * 1024, seed=size_kb)
+
+            async def run_once():
+                with quiet():
+                    await agent_logic.run_agent_analysis(
+                        logger, broadcaster, git_diff=git_diff, pr_title="Benchmark",
+                        repo_name="example/repo", pr_number="1", user_name="bench",
+                    )
+            agent_logic.analyzer_chain.calls = 0
+            stats = await ameasure(run_once, repeat=repeat)
+            results.append(result("run_agent_analysis", {"diff_kb": size_kb, "llm": "fake"}, stats,
+                                  analyzer_calls_per_run=agent_logic.analyzer_chain.calls // (repeat + 1)))
+        return results
+
+    return asyncio.run(measure_all())
+
+
+def run_stream_relay(repeat: int, words: int = 600, first_token_seconds: float = 0.05,
+                     chunk_seconds: float = 0.002) -> list:
+    """
+    Time until generated docs first reach the dashboard, for a fake model with a fixed
+    first-token latency: waiting for the whole document (ainvoke) vs relaying the stream.
+    """
+    from stream_relay import relay_stream
+
+    document = paragraph(random.Random(5), chars=words * 6)
+    chain = FakeChain(document, latency=first_token_seconds, chunk_latency=chunk_seconds)
+
+    async def measure_mode(streamed: bool):
+        first, total, events = [], [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            sent = []
+
+            async def broadcaster(event_type, data):
+                sent.append(time.perf_counter() - start)
+
+            if streamed:
+                text = await relay_stream(chain.astream({}), broadcaster, label="Benchmark")
+            else:
+                text = "".join([chunk async for chunk in chain.astream({})])
+                await broadcaster("log-step", text)
+            assert text == document
+            first.append(sent[0])
+            total.append(time.perf_counter() - start)
+            events.append(len(sent))
+        return result("generate_first_output", {"mode": "astream" if streamed else "ainvoke", "words": words},
+                      summarize_timings(first), total_ms=round(summarize_timings(total)["median_s"] * 1000, 1),
+                      events=max(events))
+
+    async def measure_all():
+        return [await measure_mode(False), await measure_mode(True)]
+
+    return asyncio.run(measure_all())
@@ -0,0 +1,103 @@
+import os
+import glob
+import time
+import random
+import shutil
+from langchain_core.documents import Document
+from harness import measure, summarize_timings, result, quiet, use_stub_embeddings
+from fakes import write_corpus, paragraph
+
+NUM_QUERIES = 50
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return value, time.perf_counter() - start
+
+
+def _build(num_chunks: int):
+    """Writes a corpus of `num_chunks` chunks and runs create_vector_store() cold, then warm."""
+    import vector_store
+
+    for path in glob.glob(os.path.join("data", "synthetic_*.md")):
+        os.remove(path)
+    corpus_bytes = write_corpus("data", num_chunks)
+    use_stub_embeddings(f"embedding_cache_{num_chunks}.db")
+
+    runs = {}
+    for label in ("cold", "warm"):  # warm: every chunk is an embedding-cache hit
+        shutil.rmtree(vector_store.INDEX_PATH, ignore_errors=True)
+        with quiet():
+            db, seconds = _timed(vector_store.create_vector_store)
+        if db is None:
+            raise RuntimeError(f"create_vector_store() failed for {num_chunks} chunks")
+        runs[label] = (db, seconds)
+    return runs, corpus_bytes
+
+
+def _query_latencies(search, queries: list) -> dict:
+    for query in queries[:5]:
+        search(query)
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        samples.append(time.perf_counter() - start)
+    return summarize_timings(samples)
+
+
+def run_build_and_search(sizes: list) -> list:
+    """Times index builds at each corpus size, then search latency on the index just built."""
+    import vector_store
+
+    rng = random.Random(1)
+    queries = [paragraph(rng, chars=120) for _ in range(NUM_QUERIES)]
+    results = []
+    for num_chunks in sizes:
+        runs, corpus_bytes = _build(num_chunks)
+        for label, (db, seconds) in runs.items():
+            chunks = db.index.ntotal
+            results.append(result(
+                "create_vector_store", {"chunks": num_chunks, "cache": label},
+                summarize_timings([seconds]),
+                chunks_per_s=round(chunks / seconds), corpus_mb=round(corpus_bytes / 1024 / 1024, 1),
+            ))
+
+        store = vector_store.ResidentVectorStore(runs["warm"][0])
+        stats = _query_latencies(lambda q: store.similarity_search_with_relevance_scores(q, k=5), queries)
+        results.append(result("similarity_search", {"chunks": num_chunks, "k": 5}, stats))
+        stats = _query_latencies(lambda q: store.max_marginal_relevance_search(q, k=5, fetch_k=20), queries)
+        results.append(result("mmr_search", {"chunks": num_chunks, "k": 5, "fetch_k": 20}, stats))
+        stats = _query_latencies(lambda q: store.hybrid_search_with_relevance_scores(q, k=5, fetch_k=20), queries)
+        results.append(result("hybrid_search", {"chunks": num_chunks, "k": 5, "fetch_k": 20}, stats))
+        del runs, store
+    return results
+
+
+def run_add_docs(base_chunks: int, batch_sizes: list, repeat: int) -> list:
+    """Times add_docs_to_store() (split + embed + in-memory add) against a resident index."""
+    import vector_store
+
+    for path in glob.glob(os.path.join("data", "synthetic_*.md")):
+        os.remove(path)
+    write_corpus("data", base_chunks)
+    use_stub_embeddings("embedding_cache_add.db")
+    shutil.rmtree(vector_store.INDEX_PATH, ignore_errors=True)
+    with quiet():
+        db = vector_store.create_vector_store()
+    # No flusher: measures the in-memory path.
+    vector_store._registry.put(vector_store.DEFAULT_NAMESPACE, vector_store.ResidentVectorStore(db))
+
+    rng = random.Random(2)
+    results = []
+    for batch_size in batch_sizes:
+        def add_batch():
+            docs = [Document(page_content="\n\n".join(paragraph(rng) for _ in range(3)),
+                             metadata={"source": "data/benchmark.md"}) for _ in range(batch_size)]
+            with quiet():
+                vector_store.add_docs_to_store(docs)
+        stats = measure(add_batch, repeat=repeat)
+        results.append(result("add_docs_to_store", {"base_chunks": base_chunks, "docs": batch_size}, stats,
+                              docs_per_s=round(batch_size / stats["median_s"])))
+    return results
@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import random
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_DIM = 384  # same as all-MiniLM-L6-v2
+
+_WORDS = (
+    "agent analyzer branch cache chunk commit config context diff docs endpoint event "
+    "feature file function handler index knowledge latency model module parser pipeline "
+    "prompt queue request response retriever schema search server stream summary token "
+    "update user vector webhook worker"
+).split()
+
+
+class StubEmbeddings(Embeddings):
+    """
+    Deterministic, offline embeddings: each text maps to a fixed unit vector seeded by its
+    hash. Costs microseconds per text, so timings reflect the code around the model.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def _embed(self, text: str) -> list:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        vector /= np.linalg.norm(vector)
+        return vector.tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self._embed(text)
+
+
+class FakeChain:
+    """
+    Stands in for an LLM chain. `response` is returned as-is, or called with the inputs
+    if it is callable. An optional `latency` simulates the model's response time. When
+    streamed, `latency` is the time to the first chunk and `chunk_latency` the gap between
+    chunks of `chunk_words` words.
+    """
+
+    def __init__(self, response, latency: float = 0.0, chunk_latency: float = 0.0, chunk_words: int = 4):
+        self.response = response
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.chunk_words = chunk_words
+        self.calls = 0
+
+    def _respond(self, inputs):
+        self.calls += 1
+        return self.response(inputs) if callable(self.response) else self.response
+
+    def invoke(self, inputs, *args, **kwargs):
+        return self._respond(inputs)
+
+    async def ainvoke(self, inputs, *args, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(inputs)
+
+    async def astream(self, inputs, *args, **kwargs):
+        words = str(self._respond(inputs)).split(" ")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for i in range(0, len(words), self.chunk_words):
+            if i and self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+            yield " ".join(words[i:i + self.chunk_words]) + (" " if i + self.chunk_words < len(words) else "")
+
+
+# --- Synthetic Data ---
+
+def paragraph(rng: random.Random, chars: int = 900) -> str:
+    words, size = [], 0
+    while size < chars:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words).capitalize() + "."
+
+
+def write_corpus(directory: str, num_chunks: int, paragraphs_per_file: int = 1000, seed: int = 0) -> int:
+    """
+    Writes Markdown files that split into roughly `num_chunks` chunks (one ~900-char
+    paragraph per chunk with the default splitter). Returns the number of bytes written.
+    """
+    rng = random.Random(seed)
+    written = 0
+    for file_index in range(0, num_chunks, paragraphs_per_file):
+        count = min(paragraphs_per_file, num_chunks - file_index)
+        text = f"# Synthetic Doc {file_index}\n\n" + "\n\n".join(paragraph(rng) for _ in range(count))
+        with open(f"{directory}/synthetic_{file_index:07d}.md", "w", encoding="utf-8") as f:
+            f.write(text)
+        written += len(text)
+    return written
+
+
+def make_diff(target_bytes: int, lines_per_hunk: int = 40, hunks_per_file: int = 8, seed: int = 0) -> str:
+    """A synthetic multi-file unified diff of about `target_bytes`, mixing code and comment changes."""
+    rng = random.Random(seed)
+    out, size, file_index = [], 0, 0
+    while size < target_bytes:
+        path = f"src/module_{file_index}.py"
+        header = [f"diff --git a/{path} b/{path}", "index 1111111..2222222 100644", f"--- a/{path}", f"+++ b/{path}"]
+        out.extend(header)
+        size += sum(len(line) + 1 for line in header)
+        for hunk_index in range(hunks_per_file):
+            start = hunk_index * 100 + 1
+            out.append(f"@@ -{start},{lines_per_hunk} +{start},{lines_per_hunk} @@ def handler_{hunk_index}():")
+            # Each line below adds one old-side and one new-side line, so the header counts hold.
+            for line_index in range(lines_per_hunk):
+                words = " ".join(rng.choice(_WORDS) for _ in range(6))
+                if line_index % 4 == 0:
+                    pair = [f"-    value = compute('{words}')", f"+    value = compute_v2('{words}')"]
+                elif line_index % 4 == 1:
+                    pair = [f"-    # {words}", f"+    # {words} (updated)"]
+                else:
+                    pair = [f"     call('{words}')"]
+                out.extend(pair)
+                size += sum(len(line) + 1 for line in pair)
+        file_index += 1
+    return "\n".join(out)
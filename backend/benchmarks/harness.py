@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+import contextlib
+import io
+import warnings
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+def prepare_offline_env(workdir: str):
+    """
+    Points every on-disk path the backend uses (index, KB store, caches, job queue) into
+    `workdir` and makes it the working directory, so benchmarks never touch real data
+    and never reach the network. Must run before any backend module is imported.
+    """
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    os.environ["KB_PATH"] = os.path.join(workdir, "data", "kb")
+    os.environ["KB_EXPORT_PATH"] = os.path.join(workdir, "data", "@Knowledge_base.md")
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(workdir, "embedding_cache.db")
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm_cache.db")
+    os.environ["JOB_QUEUE_PATH"] = os.path.join(workdir, "agent_jobs.db")
+    os.environ["VECTOR_STORE_ROOT"] = workdir
+    os.chdir(workdir)
+    # Stub vectors are random, so LangChain warns about negative relevance scores; that is expected here.
+    warnings.filterwarnings("ignore", message="Relevance scores must be between")
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+    # A non-empty guide, so create_vector_store() never calls the seeder chain.
+    with open(os.path.join("data", "Knowledge_Base.md"), "w", encoding="utf-8") as f:
+        f.write("# Benchmark Project\n\n" + "This guide exists so the knowledge base is not seeded. " * 4)
+
+
+def use_stub_embeddings(cache_name: str = "embedding_cache.db"):
+    """
+    Makes vector_store use the deterministic stub embedder behind a fresh embedding
+    cache file, so a build after this call starts cold. Returns the CachedEmbeddings.
+    """
+    import vector_store
+    from embedding_cache import CachedEmbeddings
+    from fakes import StubEmbeddings
+
+    if os.path.exists(cache_name):
+        os.remove(cache_name)
+    vector_store._embeddings = CachedEmbeddings(StubEmbeddings(), "stub-embeddings", path=cache_name)
+    return vector_store._embeddings
+
+
+def install_offline_backend():
+    """
+    Prepares the backend for in-process benchmarks: stub embeddings, and a tiny resident
+    vector store so importing agent_logic (which loads the store on import) stays offline.
+    """
+    import vector_store
+    from langchain_core.documents import Document
+
+    embeddings = use_stub_embeddings()
+    db = vector_store._build_db([Document(page_content="placeholder")], ["placeholder"], embeddings,
+                                index_path="placeholder_index")
+    store = vector_store.ResidentVectorStore(db, index_path="placeholder_index")
+    vector_store._registry.put(vector_store.DEFAULT_NAMESPACE, store)
+
+
+def release_workdir():
+    """Checkpoints the KB store now, so its exit hook doesn't write into a deleted workdir."""
+    import atexit
+    import kb_store
+
+    if kb_store._store is not None:
+        kb_store._store.checkpoint()
+        atexit.unregister(kb_store._store.checkpoint)
+
+
+@contextlib.contextmanager
+def quiet():
+    """Swallows the backend's progress prints while a benchmark runs."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def summarize_timings(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min_s": ordered[0],
+        "median_s": statistics.median(ordered),
+        "mean_s": statistics.fmean(ordered),
+        "p95_s": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "max_s": ordered[-1],
+    }
+
+
+def measure(fn, repeat: int = 5, warmup: int = 1) -> dict:
+    """Calls `fn()` `warmup` times untimed, then `repeat` times timed."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize_timings(samples)
+
+
+async def ameasure(coro_fn, repeat: int = 5, warmup: int = 1) -> dict:
+    """Async version of measure(): awaits `coro_fn()` on the running loop."""
+    for _ in range(warmup):
+        await coro_fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await coro_fn()
+        samples.append(time.perf_counter() - start)
+    return summarize_timings(samples)
+
+
+def result(name: str, params: dict, stats: dict, **extra) -> dict:
+    entry = {"name": name, "params": params, "stats": stats, **extra}
+    median = stats.get("median_s")
+    label = ", ".join(f"{k}={v}" for k, v in params.items())
+    shown = f"{median * 1000:.3f} ms" if median is not None else ""
+    details = " ".join(f"{k}={v}" for k, v in extra.items())
+    print(f"  {name:<28} {label:<32} {shown:>14}  {details}")
+    return entry
+
+
+def run_metadata(mode: str) -> dict:
+    try:
+        commit = subprocess.run(["git", "-C", BACKEND_DIR, "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True, timeout=10).stdout.strip()
+    except Exception:
+        commit = ""
+    return {
+        "commit": commit or "unknown",
+        "mode": mode,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_results(results: list, meta: dict, path: str = None) -> str:
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{meta['timestamp'].replace(':', '')}-{meta['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+    return path
+
+
+def _result_key(entry: dict) -> tuple:
+    return entry["name"], json.dumps(entry["params"], sort_keys=True)
+
+
+def compare(baseline_path: str, current: list, threshold: float = 1.2) -> int:
+    """
+    Prints the median-time ratio of each benchmark against a baseline results file.
+    Returns the number of regressions (ratio above `threshold`).
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {_result_key(entry): entry for entry in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"\nComparison against {baseline_path} (median, regression threshold {threshold:.2f}x):")
+    for entry in current:
+        old = baseline.get(_result_key(entry))
+        if not old or not old["stats"].get("median_s") or not entry["stats"].get("median_s"):
+            continue
+        ratio = entry["stats"]["median_s"] / old["stats"]["median_s"]
+        flag = "REGRESSION" if ratio > threshold else ("faster" if ratio < 1 / threshold else "")
+        regressions += ratio > threshold
+        params = ", ".join(f"{k}={v}" for k, v in entry["params"].items())
+        print(f"  {entry['name']:<28} {params:<32} {ratio:6.2f}x  {flag}")
+    return regressions
+
@@ -0,0 +1,110 @@
+"""
+Offline micro-benchmarks for the agent's hot paths.
+
+Everything runs in-process against a throwaway working directory, with fake LLM chains
+and a deterministic stub embedder, so no API keys or network access are needed and the
+real index, KB and caches are never touched. The opt-in `embed` group is the exception:
+it runs the real embedding models. Results are written as JSON so runs from different
+commits can be compared.
+
+Usage (from the backend directory):
+  python benchmarks/run.py                      # default sizes (index builds up to 100k chunks)
+  python benchmarks/run.py --quick              # small sizes, for a fast sanity check
+  python benchmarks/run.py --full               # adds 1M-chunk builds and 20 MB diffs (needs lots of RAM)
+  python benchmarks/run.py --only diff,search   # a subset: diff, build, search, index, add, format, pipeline, stream
+  python benchmarks/run.py --only index         # recall/latency of each FAISS index type
+  python benchmarks/run.py --only embed         # throughput/memory of each embeddings backend (real models)
+  python benchmarks/run.py --compare benchmarks/results/<older>.json
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+
+from harness import (
+    prepare_offline_env, install_offline_backend, release_workdir, run_metadata, write_results, compare
+)
+
+MODES = {
+    "quick": {"diff_mb": [1], "chunks": [1000], "index_vectors": [10000], "add_base": 1000, "pipeline_kb": [50], "embed_chunks": 200, "repeat": 3},
+    "default": {"diff_mb": [1, 5], "chunks": [1000, 10000, 100000], "index_vectors": [100000], "add_base": 10000, "pipeline_kb": [50, 1024], "embed_chunks": 1000, "repeat": 5},
+    "full": {"diff_mb": [1, 5, 20], "chunks": [1000, 10000, 100000, 1000000], "index_vectors": [100000, 1000000], "add_base": 100000, "pipeline_kb": [50, 1024], "embed_chunks": 5000, "repeat": 5},
+}
+GROUPS = ["diff", "build", "search", "index", "add", "format", "pipeline", "stream", "embed"]
+# Groups that load the real embedding models (downloaded on first use) only run when asked for.
+DEFAULT_GROUPS = [group for group in GROUPS if group != "embed"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks for the Doc-Ops agent.")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--quick", action="store_true", help="small sizes only")
+    size.add_argument("--full", action="store_true", help="include 1M-chunk builds and 20 MB diffs")
+    parser.add_argument("--only", default=",".join(DEFAULT_GROUPS), help=f"comma-separated subset of: {', '.join(GROUPS)}")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="a previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    parser.add_argument("--keep-workdir", action="store_true", help="don't delete the temporary working directory")
+    args = parser.parse_args()
+
+    mode = "quick" if args.quick else "full" if args.full else "default"
+    config = MODES[mode]
+    groups = [group.strip() for group in args.only.split(",") if group.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown benchmark groups: {', '.join(sorted(unknown))}")
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    workdir = tempfile.mkdtemp(prefix="docsmith-bench-")
+    prepare_offline_env(workdir)
+    install_offline_backend()
+
+    # Imported after the environment is prepared: these import the backend modules.
+    import bench_diff
+    import bench_vector_store
+    import bench_index
+    import bench_pipeline
+    import bench_embeddings
+
+    meta = run_metadata(mode)
+    print(f"Running {mode} benchmarks at commit {meta['commit']} (workdir: {workdir})")
+    results = []
+    try:
+        if "diff" in groups:
+            results += bench_diff.run(config["diff_mb"], config["repeat"])
+        if "build" in groups or "search" in groups:
+            for entry in bench_vector_store.run_build_and_search(config["chunks"]):
+                if entry["name"] == "create_vector_store" and "build" in groups:
+                    results.append(entry)
+                elif entry["name"] != "create_vector_store" and "search" in groups:
+                    results.append(entry)
+        if "index" in groups:
+            results += bench_index.run_index_types(config["index_vectors"])
+        if "add" in groups:
+            results += bench_vector_store.run_add_docs(config["add_base"], [1, 10, 100], config["repeat"])
+        if "format" in groups:
+            results += bench_pipeline.run_format_docs([5, 20, 100], config["repeat"])
+        if "pipeline" in groups:
+            results += bench_pipeline.run_agent_pipeline(config["pipeline_kb"], config["repeat"])
+        if "stream" in groups:
+            results += bench_pipeline.run_stream_relay(config["repeat"])
+        if "embed" in groups:
+            results += bench_embeddings.run_backends(config["embed_chunks"])
+    finally:
+        release_workdir()
+        os.chdir(os.path.dirname(workdir))
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    path = write_results(results, meta, output)
+    print(f"\nWrote {len(results)} results to {path}")
+    if baseline:
+        regressions = compare(baseline, results, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
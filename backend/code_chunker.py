@@ -0,0 +1,104 @@
+import os
+import ast
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter, Language
+
+# --- Configuration ---
+# A function or class longer than this is split further (a class into its methods,
+# a function at statement boundaries); every part keeps the qualified name.
+CODE_CHUNK_MAX_CHARS = int(os.getenv("CODE_CHUNK_MAX_CHARS", 2000))
+
+
+def _python_splitter():
+    return RecursiveCharacterTextSplitter.from_language(
+        Language.PYTHON, chunk_size=CODE_CHUNK_MAX_CHARS, chunk_overlap=100
+    )
+
+
+def _start_line(node: ast.AST) -> int:
+    """First line of a definition, including its decorators."""
+    return min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+
+
+def _is_definition(node: ast.AST) -> bool:
+    return isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+
+
+class _Chunker:
+    """Walks one module's AST and emits a chunk per function, method or class."""
+
+    def __init__(self, lines: list, metadata: dict):
+        self.lines = lines
+        self.metadata = metadata
+        self.chunks = []
+
+    def _text(self, start: int, end: int) -> str:
+        return "".join(self.lines[start - 1:end])
+
+    def _start(self, node: ast.AST) -> int:
+        """A definition's first line, including decorators and the comment block right above it."""
+        start = _start_line(node)
+        while start > 1 and self.lines[start - 2].lstrip().startswith("#"):
+            start -= 1
+        return start
+
+    def _emit(self, text: str, start: int, end: int, symbol: str = None, kind: str = "module"):
+        if all(not line.strip() or line.lstrip().startswith("#") for line in text.splitlines()):
+            return
+        metadata = {**self.metadata, "kind": kind, "start_line": start, "end_line": end}
+        if symbol:
+            metadata["symbol"] = symbol
+        if len(text) <= CODE_CHUNK_MAX_CHARS:
+            self.chunks.append(Document(page_content=text, metadata=metadata))
+            return
+        parts = _python_splitter().split_text(text)
+        for i, part in enumerate(parts):
+            self.chunks.append(Document(page_content=part, metadata={**metadata, "part": i}))
+
+    def emit_gaps(self, body: list, start: int, end: int, scope: str = None):
+        """Emits the lines between definitions (imports, constants, class attributes) as one chunk per run."""
+        cursor = start
+        for node in body:
+            if _is_definition(node):
+                node_start = self._start(node)
+                if node_start > cursor:
+                    self._emit(self._text(cursor, node_start - 1), cursor, node_start - 1, scope, "class" if scope else "module")
+                cursor = node.end_lineno + 1
+        if end >= cursor:
+            self._emit(self._text(cursor, end), cursor, end, scope, "class" if scope else "module")
+
+    def visit(self, body: list, scope: str = None):
+        for node in body:
+            if not _is_definition(node):
+                continue
+            name = f"{scope}.{node.name}" if scope else node.name
+            start, end = self._start(node), node.end_lineno
+            text = self._text(start, end)
+            if isinstance(node, ast.ClassDef):
+                if len(text) <= CODE_CHUNK_MAX_CHARS:
+                    self._emit(text, start, end, name, "class")
+                else:
+                    # Too big for one chunk: the class header and attributes, then each method.
+                    self.emit_gaps(node.body, start, end, name)
+                    self.visit(node.body, name)
+            else:
+                self._emit(text, start, end, name, "method" if scope else "function")
+
+
+def split_python_source(source: str, metadata: dict) -> list:
+    """
+    Splits Python source along its syntax tree: one chunk per top-level function or class
+    (large classes per method), plus chunks for the module-level code between them.
+    Each chunk's metadata has the qualified `symbol` name, its `kind` and its line range.
+    Returns None if the source does not parse, so the caller can fall back to plain splitting.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    lines = source.splitlines(keepends=True)
+    chunker = _Chunker(lines, metadata)
+    chunker.emit_gaps(tree.body, 1, len(lines))
+    chunker.visit(tree.body)
+    chunker.chunks.sort(key=lambda doc: (doc.metadata["start_line"], doc.metadata.get("part", 0)))
+    return chunker.chunks
@@ -0,0 +1,118 @@
+import os
+import asyncio
+
+# --- Configuration ---
+ANALYZER_TOKEN_BUDGET = int(os.getenv("ANALYZER_TOKEN_BUDGET", 8000))
+REWRITER_DIFF_TOKEN_BUDGET = int(os.getenv("REWRITER_DIFF_TOKEN_BUDGET", 12000))
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv("ANALYSIS_MAX_CONCURRENCY", 4))
+
+# Rough average for code and English with Gemini's tokenizer; good enough for budgeting.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _split_lines(text: str, budget: int) -> list:
+    """Last resort for a single hunk over budget: cut it at line boundaries."""
+    pieces, current, used = [], [], 0
+    for line in text.split("\n"):
+        cost = estimate_tokens(line)
+        if current and used + cost > budget:
+            pieces.append("\n".join(current))
+            current, used = [], 0
+        current.append(line)
+        used += cost
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def _file_blocks(file_diff, budget: int, concise: bool) -> list:
+    """A file's text as one block, or as hunk groups (each with the file header) if it is over budget."""
+    header, hunks = file_diff.split_hunks(concise=concise)
+    whole = "\n".join([header] + hunks)
+    if estimate_tokens(whole) <= budget:
+        return [whole]
+
+    blocks, group = [], []
+    hunk_budget = max(budget - estimate_tokens(header), 1)
+    pieces = [piece for hunk in hunks for piece in (
+        [hunk] if estimate_tokens(hunk) <= hunk_budget else _split_lines(hunk, hunk_budget)
+    )]
+    for piece in pieces:
+        if group and estimate_tokens("\n".join([header] + group + [piece])) > budget:
+            blocks.append("\n".join([header] + group))
+            group = []
+        group.append(piece)
+    if group:
+        blocks.append("\n".join([header] + group))
+    return blocks
+
+
+def split_for_analysis(files: list, budget: int = ANALYZER_TOKEN_BUDGET) -> list:
+    """
+    Packs the concise diffs of `files` into chunks of at most `budget` tokens, splitting
+    by file first and by hunk group only for files that don't fit on their own.
+    """
+    chunks, current = [], []
+    for file_diff in files:
+        for block in _file_blocks(file_diff, budget, concise=True):
+            if current and estimate_tokens("\n".join(current + [block])) > budget:
+                chunks.append("\n".join(current))
+                current = []
+            current.append(block)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def trim_diff(files: list, budget: int, concise: bool = False) -> str:
+    """
+    Returns the diff of `files` cut down to `budget` tokens at file or hunk boundaries,
+    with a note listing what was left out.
+    """
+    kept, used, omitted = [], 0, []
+    for file_diff in files:
+        blocks = _file_blocks(file_diff, budget, concise)
+        taken = 0
+        for block in blocks:
+            cost = estimate_tokens(block)
+            if used + cost > budget:
+                break
+            kept.append(block)
+            used += cost
+            taken += 1
+        if taken < len(blocks):
+            omitted.append(file_diff.path if taken == 0 else f"{file_diff.path} (partial)")
+    if omitted:
+        kept.append(f"# ... diff trimmed to fit the token budget; omitted: {', '.join(omitted)}")
+    return "\n".join(kept)
+
+
+async def map_reduce_analysis(analyzer_chain, chunks: list, max_concurrency: int = ANALYSIS_MAX_CONCURRENCY) -> dict:
+    """
+    Runs the analyzer on each chunk with bounded concurrency, then reduces the results:
+    the change is functional if any chunk is, and the summary combines the distinct
+    summaries of the functional chunks (or of all chunks if none is functional).
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def analyze_chunk(chunk: str):
+        async with semaphore:
+            return await analyzer_chain.ainvoke({"git_diff": chunk})
+
+    analyses = await asyncio.gather(*(analyze_chunk(chunk) for chunk in chunks))
+
+    functional = [a for a in analyses if a.get('is_functional_change', False)]
+    summaries = []
+    for analysis in functional or analyses:
+        summary = analysis.get('analysis_summary')
+        if summary and summary not in summaries:
+            summaries.append(summary)
+    return {
+        "is_functional_change": bool(functional),
+        "analysis_summary": " ".join(summaries) or "No analysis summary provided.",
+        "chunks": len(chunks),
+    }
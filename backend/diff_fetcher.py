@@ -0,0 +1,147 @@
+import os
+import logging
+import httpx
+from diff_parser import DiffParser, DiffSummary, summarize_diff
+
+# --- Configuration ---
+DIFF_MAX_BYTES = int(os.getenv("DIFF_MAX_BYTES", 5 * 1024 * 1024))
+DIFF_MAX_LINES = int(os.getenv("DIFF_MAX_LINES", 50000))
+DIFF_FETCH_TIMEOUT = float(os.getenv("DIFF_FETCH_TIMEOUT", 30))
+
+logger = logging.getLogger(__name__)
+
+# --- Shared HTTP Client ---
+# One pooled client per process so repeated fetches reuse keep-alive connections to GitHub.
+_client = None
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(DIFF_FETCH_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            follow_redirects=True,  # GitHub redirects .diff URLs to patch-diff.githubusercontent.com
+        )
+    return _client
+
+async def aclose_client():
+    """Closes the shared client. Call this on application shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+class FetchedDiff:
+    """
+    The result of a streamed diff fetch. `git_diff` and `concise_diff` only cover files that
+    survived the local filter (ignore rules and trivial-change classification); `summary`
+    holds the per-file breakdown.
+    """
+
+    def __init__(self, summary: DiffSummary, num_bytes: int, num_lines: int, truncated: bool):
+        self.summary = summary
+        self.git_diff = summary.git_diff
+        self.concise_diff = summary.concise_diff
+        self.num_bytes = num_bytes
+        self.num_lines = num_lines
+        self.truncated = truncated
+
+# --- Async Streaming Fetch ---
+
+async def fetch_diff(diff_url: str, headers: dict = None, max_bytes: int = DIFF_MAX_BYTES,
+                     max_lines: int = DIFF_MAX_LINES) -> FetchedDiff:
+    """
+    Streams a diff from `diff_url` without blocking the event loop.
+
+    Lines are fed to the diff parser as they arrive, so per-file hunks are built and
+    classified in the same pass. Reading stops as soon as either cap is reached and
+    the result is marked as truncated. Raises httpx.HTTPStatusError for non-2xx responses.
+    """
+    parser = DiffParser()
+    files = []
+    num_bytes = 0
+    num_lines = 0
+    truncated = False
+
+    async with get_client().stream("GET", diff_url, headers=headers) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            line_bytes = len(line.encode("utf-8")) + 1
+            if num_bytes + line_bytes > max_bytes or num_lines >= max_lines:
+                truncated = True
+                break
+            num_bytes += line_bytes
+            num_lines += 1
+            finished = parser.feed(line)
+            if finished is not None:
+                files.append(finished)
+
+    finished = parser.close()
+    if finished is not None:
+        files.append(finished)
+
+    if truncated:
+        logger.warning(f"Diff at {diff_url} exceeded the cap ({max_bytes} bytes / {max_lines} lines); truncated.")
+
+    return FetchedDiff(
+        summary=summarize_diff(files),
+        num_bytes=num_bytes,
+        num_lines=num_lines,
+        truncated=truncated,
+    )
+
+
+# --- Self-Test ---
+if __name__ == "__main__":
+    """
+    Serves a synthetic diff from a local HTTP stub and fetches it with and without caps.
+
+    Usage:
+      python diff_fetcher.py
+    """
+    import asyncio
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    test_diff = "\n".join(
+        ["diff --git a/app.py b/app.py", "--- a/app.py", "+++ b/app.py", "@@ -1,2000 +1,2000 @@"]
+        + [f"+line {i}" if i % 2 else f" line {i}" for i in range(2000)]
+        + ["diff --git a/yarn.lock b/yarn.lock", "--- a/yarn.lock", "+++ b/yarn.lock", "@@ -1 +1 @@", "-a", "+b"]
+    )
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            body = test_diff.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/compare.diff"
+
+    async def main():
+        full = await fetch_diff(url)
+        assert not full.truncated and len(full.summary.files) == 2
+        assert [f.path for f in full.summary.ignored] == ["yarn.lock"]
+        assert full.concise_diff.count("\n+line") == 1000
+        print(f"✅ Full fetch: {full.num_lines} lines, {full.num_bytes} bytes ({full.summary.skip_summary()}).")
+
+        capped = await fetch_diff(url, max_lines=100)
+        assert capped.truncated and capped.num_lines == 100
+        print(f"✅ Line cap: truncated at {capped.num_lines} lines.")
+
+        capped = await fetch_diff(url, max_bytes=1024)
+        assert capped.truncated and capped.num_bytes <= 1024
+        print(f"✅ Byte cap: truncated at {capped.num_bytes} bytes.")
+        await aclose_client()
+
+    asyncio.run(main())
+    server.shutdown()
@@ -0,0 +1,407 @@
+import os
+import re
+import fnmatch
+from collections import Counter
+
+# --- Configuration ---
+DEFAULT_IGNORE_PATTERNS = [
+    # Lockfiles
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock",
+    "Cargo.lock", "go.sum", "composer.lock", "Gemfile.lock", "*.lock",
+    # Generated and minified files
+    "*.min.js", "*.min.css", "*.map", "*.pb.go", "*_pb2.py", "*.generated.*",
+    "dist/*", "*/dist/*", "build/*", "*/build/*",
+    # Vendored code
+    "vendor/*", "*/vendor/*", "node_modules/*", "*/node_modules/*", "third_party/*", "*/third_party/*",
+]
+_ignore_env = os.getenv("DIFF_IGNORE_PATTERNS")
+DIFF_IGNORE_PATTERNS = [p.strip() for p in _ignore_env.split(",") if p.strip()] if _ignore_env else DEFAULT_IGNORE_PATTERNS
+
+LANGUAGES = {
+    ".py": "python", ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript", ".cjs": "javascript",
+    ".ts": "typescript", ".tsx": "typescript", ".java": "java", ".kt": "kotlin", ".go": "go",
+    ".rs": "rust", ".rb": "ruby", ".php": "php", ".c": "c", ".h": "c", ".cc": "cpp", ".cpp": "cpp",
+    ".hpp": "cpp", ".cs": "csharp", ".swift": "swift", ".sh": "shell", ".bash": "shell",
+    ".sql": "sql", ".yml": "yaml", ".yaml": "yaml", ".toml": "toml", ".json": "json",
+    ".md": "markdown", ".html": "html", ".css": "css", ".scss": "css",
+}
+_HASH_COMMENTS = ("#",)
+_C_COMMENTS = ("//",)
+# Line-comment prefixes. /* ... */ block comments are tracked separately (BLOCK_COMMENT_LANGUAGES),
+# since a bare "*" only starts a comment line inside one (`*p = 1;` is code).
+COMMENT_PREFIXES = {
+    "python": _HASH_COMMENTS, "shell": _HASH_COMMENTS, "ruby": _HASH_COMMENTS,
+    "yaml": _HASH_COMMENTS, "toml": _HASH_COMMENTS,
+    "javascript": _C_COMMENTS, "typescript": _C_COMMENTS, "java": _C_COMMENTS, "kotlin": _C_COMMENTS,
+    "go": _C_COMMENTS, "rust": _C_COMMENTS, "c": _C_COMMENTS, "cpp": _C_COMMENTS,
+    "csharp": _C_COMMENTS, "swift": _C_COMMENTS, "css": (),
+    "php": _C_COMMENTS + _HASH_COMMENTS, "sql": ("--",), "html": ("<!--",),
+}
+BLOCK_COMMENT_LANGUAGES = {
+    "javascript", "typescript", "java", "kotlin", "go", "rust", "c", "cpp", "csharp", "swift", "css", "php",
+}
+# Languages where indentation is syntax, so a change to leading whitespace is not trivial.
+INDENT_SENSITIVE_LANGUAGES = {"python", "yaml"}
+
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+
+# --- Metrics ---
+# Process-wide counters of what the local filter kept or skipped.
+_metrics = Counter()
+
+def diff_stats() -> dict:
+    return dict(_metrics)
+
+
+def detect_language(path: str) -> str:
+    name = os.path.basename(path)
+    if name == "Dockerfile":
+        return "dockerfile"
+    return LANGUAGES.get(os.path.splitext(name)[1].lower(), "text")
+
+
+def is_ignored(path: str, patterns: list = None) -> bool:
+    patterns = DIFF_IGNORE_PATTERNS if patterns is None else patterns
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+
+class Hunk:
+    """One '@@' section of a file diff. `lines` holds (tag, text) pairs with tag in '+', '-', ' '."""
+
+    def __init__(self, header: str):
+        self.header = header
+        self.lines = []
+
+
+class FileDiff:
+    """All hunks for one file, plus its language, ignore flag and trivial-change classification."""
+
+    def __init__(self, old_path: str = None, new_path: str = None):
+        self.old_path = old_path
+        self.new_path = new_path
+        self.hunks = []
+        self.raw_lines = []
+        self.is_binary = False
+        self.ignored = False
+        self.trivial_reason = None
+
+    @property
+    def path(self) -> str:
+        if self.new_path and self.new_path != "/dev/null":
+            return self.new_path
+        return self.old_path or "unknown"
+
+    @property
+    def language(self) -> str:
+        return detect_language(self.path)
+
+    @property
+    def added_lines(self) -> list:
+        return [text for hunk in self.hunks for tag, text in hunk.lines if tag == "+"]
+
+    @property
+    def removed_lines(self) -> list:
+        return [text for hunk in self.hunks for tag, text in hunk.lines if tag == "-"]
+
+    def to_concise(self) -> str:
+        """The file's changed lines only (no context), keeping the file boundary."""
+        header, hunks = self.split_hunks(concise=True)
+        return "\n".join([header] + hunks)
+
+    def split_hunks(self, concise: bool = False):
+        """
+        Returns the file header and one text block per hunk. Concise blocks hold only the
+        changed lines; full blocks keep the '@@' header and context lines.
+        """
+        if concise:
+            header = f"--- a/{self.old_path or self.path}\n+++ b/{self.path}"
+        else:
+            header_lines = []
+            for line in self.raw_lines:
+                if line.startswith("@@"):
+                    break
+                header_lines.append(line)
+            header = "\n".join(header_lines)
+        blocks = []
+        for hunk in self.hunks:
+            lines = [] if concise else [hunk.header]
+            lines.extend(f"{tag}{text}" for tag, text in hunk.lines if not concise or tag != " ")
+            if lines:
+                blocks.append("\n".join(lines))
+        return header, blocks
+
+
+def _strip_prefix(path: str) -> str:
+    path = path.split("\t")[0].strip()
+    if path.startswith(("a/", "b/")):
+        return path[2:]
+    return path
+
+
+class DiffParser:
+    """
+    A push-style unified-diff parser, so lines can be fed as they stream in.
+    `feed()` returns a finished FileDiff whenever a new file starts; `close()` returns the last one.
+    """
+
+    def __init__(self, ignore_patterns: list = None):
+        self.ignore_patterns = ignore_patterns
+        self._file = None
+        self._hunk = None
+        self._old_left = 0
+        self._new_left = 0
+
+    def _finish(self):
+        finished = self._file
+        self._file, self._hunk = None, None
+        self._old_left = self._new_left = 0
+        if finished is not None:
+            finished.ignored = finished.is_binary or is_ignored(finished.path, self.ignore_patterns)
+            if not finished.ignored:
+                finished.trivial_reason = classify_trivial(finished)
+        return finished
+
+    def feed(self, line: str):
+        line = line.rstrip("\r")
+        in_hunk = self._hunk is not None and (self._old_left > 0 or self._new_left > 0)
+
+        if in_hunk:
+            tag, text = line[:1], line[1:]
+            if tag in ("+", "-", " ") or line == "":
+                tag = tag or " "
+                self._hunk.lines.append((tag, text))
+                self._file.raw_lines.append(line)
+                if tag != "+":
+                    self._old_left -= 1
+                if tag != "-":
+                    self._new_left -= 1
+                return None
+            if line.startswith("\\"):  # "\ No newline at end of file"
+                self._file.raw_lines.append(line)
+                return None
+
+        finished = None
+        if line.startswith("diff --git "):
+            finished = self._finish()
+            parts = line[len("diff --git "):].split(" b/", 1)
+            self._file = FileDiff(_strip_prefix(parts[0]), parts[1] if len(parts) > 1 else None)
+        elif line.startswith("--- ") and (self._file is None or self._file.hunks):
+            # A plain (non-git) diff starts each file with '---'.
+            finished = self._finish()
+            self._file = FileDiff(_strip_prefix(line[4:]))
+        elif self._file is None:
+            return None
+
+        if line.startswith("--- "):
+            self._file.old_path = _strip_prefix(line[4:])
+        elif line.startswith("+++ "):
+            self._file.new_path = _strip_prefix(line[4:])
+        elif line.startswith("Binary files ") or line.startswith("GIT binary patch"):
+            self._file.is_binary = True
+        elif line.startswith("@@"):
+            match = _HUNK_HEADER.match(line)
+            self._hunk = Hunk(line)
+            self._file.hunks.append(self._hunk)
+            self._old_left = int(match.group(1) or 1) if match else 0
+            self._new_left = int(match.group(2) or 1) if match else 0
+        self._file.raw_lines.append(line)
+        return finished
+
+    def close(self):
+        return self._finish()
+
+
+def parse_diff(lines, ignore_patterns: list = None):
+    """Yields a FileDiff for each file in an iterable of unified-diff lines."""
+    parser = DiffParser(ignore_patterns)
+    for line in lines:
+        finished = parser.feed(line)
+        if finished is not None:
+            yield finished
+    finished = parser.close()
+    if finished is not None:
+        yield finished
+
+
+# --- Local Trivial-Change Classifier ---
+
+_DEF_LINE = re.compile(r"^\s*(async\s+def|def|class)\b.*:\s*(#.*)?$")
+_TRIPLE_QUOTES = ('"""', "'''", 'r"""', "r'''")
+
+def _docstring_flags(lines: list, side: str) -> list:
+    """
+    Marks, for one side of a Python hunk, which lines belong to a docstring: a bare
+    triple-quoted string directly under a `def` or `class` line. Strings opened any
+    other way (e.g. prompt templates) count as code. Hunks start mid-file, so this
+    assumes the hunk begins outside a string.
+    """
+    flags = []
+    in_docstring = False
+    in_string = False
+    previous = ""
+    for tag, text in lines:
+        if tag not in (" ", side):
+            flags.append(None)
+            continue
+        stripped = text.strip()
+        quotes = text.count('"""') + text.count("'''")
+        opens_docstring = (not in_docstring and not in_string
+                           and stripped.startswith(_TRIPLE_QUOTES) and _DEF_LINE.match(previous))
+        flags.append(in_docstring or bool(opens_docstring))
+        if quotes % 2 == 1:
+            if in_docstring or in_string:
+                in_docstring = in_string = False
+            elif opens_docstring:
+                in_docstring = True
+            else:
+                in_string = True
+        if stripped:
+            previous = text
+    return flags
+
+
+def _block_comment_flags(lines: list, side: str) -> list:
+    """
+    Marks, for one side of a hunk, which lines lie entirely inside a /* ... */ comment.
+    Hunks start mid-file, so if a closing "*/" comes before any opening "/*", the hunk
+    is taken to begin inside a comment.
+    """
+    texts = "\n".join(text for tag, text in lines if tag in (" ", side))
+    first_open, first_close = texts.find("/*"), texts.find("*/")
+    in_block = first_close != -1 and (first_open == -1 or first_close < first_open)
+    flags = []
+    for tag, text in lines:
+        if tag not in (" ", side):
+            flags.append(None)
+            continue
+        stripped = text.strip()
+        if not in_block and stripped.startswith("/*"):
+            in_block, stripped = True, stripped[2:]
+        if not in_block:
+            flags.append(False)
+            # Code followed by a comment that stays open.
+            in_block = stripped.rfind("/*") > stripped.rfind("*/")
+            continue
+        end = stripped.find("*/")
+        if end == -1:
+            flags.append(True)
+        else:
+            in_block = False
+            flags.append(not stripped[end + 2:].strip())
+    return flags
+
+
+def _whitespace_only(file_diff: FileDiff) -> bool:
+    """
+    True if each hunk reads the same before and after, ignoring blank lines and whitespace
+    (but not indentation in INDENT_SENSITIVE_LANGUAGES). Lines are compared in order,
+    context included, so reordered or moved statements are not whitespace changes.
+    """
+    keep_indent = file_diff.language in INDENT_SENSITIVE_LANGUAGES
+
+    def normalize(text: str):
+        squashed = "".join(text.split())
+        return (len(text.expandtabs(8)) - len(text.expandtabs(8).lstrip()), squashed) if keep_indent else squashed
+
+    for hunk in file_diff.hunks:
+        old = [normalize(text) for tag, text in hunk.lines if tag in (" ", "-") and text.strip()]
+        new = [normalize(text) for tag, text in hunk.lines if tag in (" ", "+") and text.strip()]
+        if old != new:
+            return False
+    return True
+
+
+def classify_trivial(file_diff: FileDiff):
+    """
+    Returns 'whitespace', 'comment' or 'docstring' if every change in the file is of that
+    kind (so no LLM needs to look at it), or None for a potentially functional change.
+    """
+    if _whitespace_only(file_diff):
+        return "whitespace"
+
+    prefixes = COMMENT_PREFIXES.get(file_diff.language)
+    if prefixes is None:
+        return None
+
+    saw_docstring = False
+    for hunk in file_diff.hunks:
+        for side in ("+", "-"):
+            in_docstring = _docstring_flags(hunk.lines, side) if file_diff.language == "python" else None
+            in_block = _block_comment_flags(hunk.lines, side) if file_diff.language in BLOCK_COMMENT_LANGUAGES else None
+            for index, (tag, text) in enumerate(hunk.lines):
+                if tag != side or not text.strip():
+                    continue
+                if text.strip().startswith(prefixes) or (in_block and in_block[index]):
+                    continue
+                if in_docstring and in_docstring[index]:
+                    saw_docstring = True
+                    continue
+                return None
+    return "docstring" if saw_docstring else "comment"
+
+
+class DiffSummary:
+    """The files worth analyzing, their concise diff, and counts of what was filtered out."""
+
+    def __init__(self, files: list):
+        self.files = files
+        self.relevant = [f for f in files if not f.ignored and not f.trivial_reason]
+        self.ignored = [f for f in files if f.ignored]
+        self.trivial = [f for f in files if f.trivial_reason]
+        self.concise_diff = "\n".join(f.to_concise() for f in self.relevant)
+        self.git_diff = "\n".join("\n".join(f.raw_lines) for f in self.relevant)
+
+    def skip_summary(self) -> str:
+        reasons = Counter(f.trivial_reason for f in self.trivial)
+        parts = [f"{len(self.ignored)} ignored"] + [f"{count} {reason}-only" for reason, count in reasons.items()]
+        return ", ".join(parts)
+
+
+def summarize_diff(files) -> DiffSummary:
+    """Builds a DiffSummary from parsed files and records the skip counts as metrics."""
+    summary = DiffSummary(list(files))
+    _metrics["diffs_parsed"] += 1
+    _metrics["files_parsed"] += len(summary.files)
+    _metrics["files_ignored"] += len(summary.ignored)
+    for file_diff in summary.trivial:
+        _metrics[f"files_trivial_{file_diff.trivial_reason}"] += 1
+    if summary.files and not summary.relevant:
+        _metrics["diffs_skipped_locally"] += 1
+    return summary
+
+
+# --- Self-Test ---
+if __name__ == "__main__":
+    """
+    Classifies small diffs that are (and are not) trivial.
+
+    Usage:
+      python diff_parser.py
+    """
+    def classify(path: str, *lines: str):
+        header = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}"]
+        old = sum(1 for line in lines if not line.startswith("+"))
+        new = sum(1 for line in lines if not line.startswith("-"))
+        (file_diff,) = parse_diff(header + [f"@@ -1,{old} +1,{new} @@"] + list(lines))
+        return file_diff.trivial_reason
+
+    cases = [
+        # Functional changes that only look like whitespace or comments.
+        ("dedent out of an if", None, classify("app.py", " if ready:", "     do_a()", "-    do_b()", "+do_b()")),
+        ("swapped statements", None, classify("app.py", "-validate()", "-save()", "+save()", "+validate()")),
+        ("C pointer write", None, classify("app.c", " void f(int *p) {", "-  *p = 1;", "+  *p = 2;", " }")),
+        ("code after a block comment", None, classify("app.js", "-/* a */ f();", "+/* b */ g();")),
+        # Trivial changes.
+        ("reflowed call", "whitespace", classify("app.js", "-f(a,b);", "+f( a, b );")),
+        ("added blank line", "whitespace", classify("app.py", " x = 1", "+", " y = 2")),
+        ("line comment", "comment", classify("app.py", " x = 1", "+# explain x")),
+        ("block comment body", "comment", classify("app.c", " /**", "- * Old text.", "+ * New text.", " */")),
+        ("hunk inside a block comment", "comment", classify("app.java", "- * Old text.", "+ * New text.", "  */")),
+        ("docstring", "docstring", classify("app.py", " def f():", '-    """Old."""', '+    """New."""')),
+    ]
+    failed = [(name, expected, got) for name, expected, got in cases if expected != got]
+    for name, expected, got in cases:
+        print(f"{'✅' if expected == got else '❌'} {name}: {got}")
+    assert not failed, f"Misclassified: {failed}"
+    print("✅ All trivial-change checks passed.")
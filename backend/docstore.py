@@ -0,0 +1,229 @@
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+# --- Configuration ---
+# Documents most recently returned by search are kept in memory; everything else stays on disk.
+DOCSTORE_CACHE_SIZE = int(os.getenv("DOCSTORE_CACHE_SIZE", 2048))
+
+_SQLITE_MAX_PARAMS = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id TEXT PRIMARY KEY,
+    page_content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def _to_document(doc_id: str, page_content: str, metadata: str) -> Document:
+    return Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    A LangChain docstore that keeps chunk text and metadata in SQLite instead of a pickle.
+
+    Nothing is read at open: a document is fetched by ID when a search returns it, and the
+    `cache_size` most recently fetched documents are kept in an LRU. Writes are committed
+    immediately, so the docstore is always at least as new as the saved FAISS index.
+
+    Every add and delete is also recorded in a `changes` log with an increasing sequence
+    number, in the same transaction. An index saved at sequence N is brought up to date by
+    replaying the changes after N, which is how worker processes that share the docstore
+    follow each other's writes (see vector_store). The log is pruned once indexes covering
+    it have been saved.
+    """
+
+    def __init__(self, path: str, cache_size: int = DOCSTORE_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    # --- Docstore interface ---
+
+    def search(self, search: str):
+        """The Document stored under ID `search`, or an error string (as InMemoryDocstore does)."""
+        with self._lock:
+            doc = self._cache.get(search)
+            if doc is not None:
+                self._cache.move_to_end(search)
+                return doc
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM chunks WHERE id = ?", (search,)
+            ).fetchone()
+            if row is None:
+                return f"ID {search} not found."
+            doc = _to_document(search, *row)
+            self._cache[search] = doc
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return doc
+
+    def add(self, texts: dict):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, page_content, metadata) VALUES (?, ?, ?)",
+                    [(doc_id, doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in texts.items()]
+                )
+                self._conn.executemany("INSERT INTO changes (op, id) VALUES ('add', ?)", [(doc_id,) for doc_id in texts])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for doc_id in texts:
+                self._cache.pop(doc_id, None)
+
+    def delete(self, ids: list):
+        ids = list(ids)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for start in range(0, len(ids), _SQLITE_MAX_PARAMS):
+                    batch = ids[start:start + _SQLITE_MAX_PARAMS]
+                    self._conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+                self._conn.executemany("INSERT INTO changes (op, id) VALUES ('delete', ?)", [(doc_id,) for doc_id in ids])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for doc_id in ids:
+                self._cache.pop(doc_id, None)
+
+    # --- Bulk reads (bypass the LRU) ---
+
+    def get_many(self, ids: list) -> dict:
+        """Documents for `ids`, keyed by ID. Missing IDs are left out."""
+        ids = list(ids)
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), _SQLITE_MAX_PARAMS):
+                batch = ids[start:start + _SQLITE_MAX_PARAMS]
+                rows = self._conn.execute(
+                    f"SELECT id, page_content, metadata FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((row[0], _to_document(*row)) for row in rows)
+        return found
+
+    def iter_documents(self, batch_size: int = 1000):
+        """Yields every (ID, Document), reading `batch_size` rows at a time."""
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, id, page_content, metadata FROM chunks WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            for _, doc_id, page_content, metadata in rows:
+                yield doc_id, _to_document(doc_id, page_content, metadata)
+
+    def ids(self) -> set:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT id FROM chunks")}
+
+    def ids_with_metadata(self, key: str, value) -> list:
+        """IDs of the documents whose metadata has `key` equal to `value`."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT id FROM chunks WHERE json_extract(metadata, ?) = ?", (f"$.{key}", value)
+            )]
+
+    def replace(self, texts: dict):
+        """
+        Replaces every document with `texts`, in one transaction. The change log is dropped
+        too, so followers reload (see changes_since).
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM chunks")
+                self._conn.executemany(
+                    "INSERT INTO chunks (id, page_content, metadata) VALUES (?, ?, ?)",
+                    [(doc_id, doc.page_content, json.dumps(doc.metadata)) for doc_id, doc in texts.items()]
+                )
+                self._conn.execute("DELETE FROM changes")
+                self._set_pruned(self._last_change())
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._cache.clear()
+
+    def forget(self, ids: list):
+        """Drops `ids` from the LRU, after another process may have changed them."""
+        with self._lock:
+            for doc_id in ids:
+                self._cache.pop(doc_id, None)
+
+    # --- Change log ---
+
+    def _last_change(self) -> int:
+        row = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    def _set_pruned(self, seq: int):
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('pruned_seq', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)", (seq,)
+        )
+
+    def last_change(self) -> int:
+        """The sequence number of the latest add or delete (0 if there has been none)."""
+        with self._lock:
+            return self._last_change()
+
+    def changes_since(self, seq: int) -> tuple:
+        """
+        The (seq, op, id) changes after `seq`, oldest first, and whether that list is complete.
+        It is not when changes after `seq` have already been pruned: the caller has to start
+        again from a newer saved index.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                row = self._conn.execute("SELECT value FROM meta WHERE key = 'pruned_seq'").fetchone()
+                rows = self._conn.execute(
+                    "SELECT seq, op, id FROM changes WHERE seq > ? ORDER BY seq", (seq,)
+                ).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+        return rows, (row[0] if row else 0) <= seq
+
+    def prune_changes(self, seq: int):
+        """Deletes the changes up to `seq`, which every saved index now covers."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM changes WHERE seq <= ?", (seq,))
+                self._set_pruned(seq)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
@@ -0,0 +1,175 @@
+import os
+import shutil
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from multiworker import exclusive_lock
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# "huggingface" runs the model with sentence-transformers on PyTorch (the reference backend).
+# "onnx" runs an int8-quantized export with ONNX Runtime, without loading PyTorch.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "huggingface").lower()
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+# ONNX Runtime intra-op threads; 0 lets it use one per physical core.
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 0))
+# The quantized model and its tokenizer are written here on first use.
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(BASE_DIR, "onnx_models"))
+# The sequence length sentence-transformers uses for all-MiniLM-L6-v2; longer inputs are truncated.
+EMBEDDING_MAX_TOKENS = 256
+BACKENDS = ("huggingface", "onnx")
+
+
+def embeddings_name(backend: str = EMBEDDING_BACKEND) -> str:
+    """
+    The name cached vectors and index manifests record for a backend. The reference keeps
+    the plain model name, so caches and indexes built before backends existed stay valid.
+    """
+    return EMBEDDING_MODEL_NAME if backend == "huggingface" else f"{EMBEDDING_MODEL_NAME}:{backend}-int8"
+
+
+def _quantized_model(model_name: str, model_dir: str) -> tuple:
+    """
+    Downloads the model's ONNX export and tokenizer from the Hugging Face Hub and quantizes
+    the weights to int8, once. Returns the paths of the quantized model and the tokenizer.
+    """
+    directory = os.path.join(model_dir, model_name)
+    model_path = os.path.join(directory, "model_int8.onnx")
+    tokenizer_path = os.path.join(directory, "tokenizer.json")
+    os.makedirs(directory, exist_ok=True)
+    # Workers starting together quantize once; the others wait and reuse the result.
+    with exclusive_lock(os.path.join(directory, "quantize.lock")):
+        if os.path.exists(model_path) and os.path.exists(tokenizer_path):
+            return model_path, tokenizer_path
+        from huggingface_hub import hf_hub_download
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"Quantizing {model_name} to int8 for ONNX Runtime (first run only)...")
+        repo = f"sentence-transformers/{model_name}"
+        shutil.copyfile(hf_hub_download(repo, "tokenizer.json"), tokenizer_path)
+        temp_path = os.path.join(directory, f"model_int8.{os.getpid()}.onnx")
+        quantize_dynamic(hf_hub_download(repo, "onnx/model.onnx"), temp_path, weight_type=QuantType.QInt8)
+        os.replace(temp_path, model_path)
+    return model_path, tokenizer_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings from an int8-quantized ONNX export of a sentence-transformers model.
+
+    Produces the same vectors as the reference backend up to quantization error: token
+    embeddings are mean-pooled over the attention mask and L2-normalized. Texts are embedded
+    in batches of `batch_size`, sorted by length so each batch needs little padding.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, model_dir: str = ONNX_MODEL_DIR,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, threads: int = EMBEDDING_THREADS):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "EMBEDDING_BACKEND=onnx needs onnxruntime and tokenizers (pip install onnxruntime tokenizers)."
+            ) from e
+        model_path, tokenizer_path = _quantized_model(model_name, model_dir)
+        self.batch_size = max(1, batch_size)
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=EMBEDDING_MAX_TOKENS)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _embed_batch(self, texts: list) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": mask,
+        }
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]  # (batch, tokens, dimension)
+
+        weights = mask[:, :, None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors = [None] * len(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed_batch([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed_batch([text])[0].tolist()
+
+
+def make_embeddings(backend: str = EMBEDDING_BACKEND) -> Embeddings:
+    """Creates the embeddings model for `backend` (one of BACKENDS)."""
+    if backend == "onnx":
+        return OnnxEmbeddings()
+    if backend == "huggingface":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL_NAME,
+            model_kwargs={'device': 'cpu'},  # Use CPU
+            encode_kwargs={'batch_size': EMBEDDING_BATCH_SIZE},
+        )
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Expected one of: {', '.join(BACKENDS)}")
+
+
+def cosine_agreement(reference: list, candidate: list) -> dict:
+    """Per-text cosine similarity between two backends' vectors for the same texts."""
+    a = np.asarray(reference, dtype=np.float32)
+    b = np.asarray(candidate, dtype=np.float32)
+    cosines = (a * b).sum(axis=1) / np.clip(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12, None)
+    return {
+        "texts": len(cosines),
+        "min": round(float(cosines.min()), 5) if len(cosines) else None,
+        "mean": round(float(cosines.mean()), 5) if len(cosines) else None,
+    }
+
+
+def _sample_texts(limit: int) -> list:
+    # The chunks the index would hold, so the check covers real Markdown and code.
+    from vector_store import _scan_source_files, _load_and_split_file
+
+    texts = []
+    for path in _scan_source_files():
+        chunks, _ = _load_and_split_file(path, "")
+        texts.extend(chunk.page_content for chunk in chunks)
+        if len(texts) >= limit:
+            break
+    return texts[:limit]
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Checks an embeddings backend against the reference (huggingface).")
+    parser.add_argument("--backend", default="onnx", choices=[b for b in BACKENDS if b != "huggingface"])
+    parser.add_argument("--chunks", type=int, default=200, help="how many corpus chunks to embed")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="fail if any chunk agrees less than this")
+    args = parser.parse_args()
+
+    texts = _sample_texts(args.chunks)
+    if not texts:
+        sys.exit("No documents found to compare on.")
+    agreement = cosine_agreement(make_embeddings("huggingface").embed_documents(texts),
+                                 make_embeddings(args.backend).embed_documents(texts))
+    print(f"Cosine agreement of '{args.backend}' with 'huggingface': {agreement}")
+    if agreement["min"] < args.min_cosine:
+        sys.exit(f"🔥 Parity check failed: minimum cosine {agreement['min']} < {args.min_cosine}.")
+    print("✅ Parity check passed.")
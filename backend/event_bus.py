@@ -0,0 +1,250 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import deque
+
+# --- Configuration ---
+SSE_BUFFER_SIZE = int(os.getenv("SSE_BUFFER_SIZE", 500))
+SSE_HISTORY_SIZE = int(os.getenv("SSE_HISTORY_SIZE", 1000))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", 15))
+# Multi-worker mode: events are exchanged through this SQLite file, polled by every worker.
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SSE_BUS_PATH = os.getenv("SSE_BUS_PATH", os.path.join(BASE_DIR, "event_bus.db"))
+SSE_BUS_POLL_SECONDS = float(os.getenv("SSE_BUS_POLL_SECONDS", 0.2))
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+# The shared table is trimmed to the history size once per this many publishes.
+_PRUNE_EVERY = 100
+
+
+class Subscriber:
+    """One connected dashboard. Holds a bounded ring buffer that drops the oldest events when full."""
+
+    def __init__(self, buffer_size: int):
+        self.buffer = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def push(self, message: dict):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(message)
+        self._ready.set()
+
+    async def get(self, timeout: float = SSE_KEEPALIVE_SECONDS) -> list:
+        """Waits for new events and returns all buffered ones. Returns [] on timeout."""
+        if not self.buffer:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return []
+        messages = list(self.buffer)
+        self.buffer.clear()
+        return messages
+
+
+class EventBus:
+    """
+    Broadcasts agent log events to every connected SSE client.
+
+    Publishing never waits on subscribers, so a slow dashboard can only lose its own
+    oldest events, never slow down the pipeline. Every event gets a monotonically
+    increasing ID, and a bounded history lets reconnecting clients replay what they
+    missed via the `Last-Event-ID` header.
+    """
+
+    def __init__(self, buffer_size: int = SSE_BUFFER_SIZE, history_size: int = SSE_HISTORY_SIZE):
+        self.buffer_size = buffer_size
+        self.history = deque(maxlen=history_size)
+        self.subscribers = set()
+        # Seeded from the clock so IDs keep increasing across server restarts.
+        self._next_id = int(time.time() * 1000)
+
+    def start(self):
+        """Starts background delivery. Nothing to do in a single process."""
+
+    async def stop(self):
+        pass
+
+    def publish(self, event: str, data: str) -> dict:
+        message = {"id": str(self._next_id), "event": event, "data": data}
+        self._next_id += 1
+        self._deliver(message)
+        return message
+
+    def _deliver(self, message: dict):
+        self.history.append(message)
+        for subscriber in self.subscribers:
+            subscriber.push(message)
+
+    def subscribe(self, last_event_id: str = None) -> Subscriber:
+        """Registers a new subscriber, pre-filled with any history newer than `last_event_id`."""
+        subscriber = Subscriber(self.buffer_size)
+        if last_event_id:
+            try:
+                last_id = int(last_event_id)
+            except ValueError:
+                last_id = None
+            if last_id is not None:
+                for message in self.history:
+                    if int(message["id"]) > last_id:
+                        subscriber.push(message)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "history": len(self.history),
+            "last_event_id": self._next_id - 1,
+            "dropped": sum(subscriber.dropped for subscriber in self.subscribers),
+        }
+
+
+class SharedEventBus(EventBus):
+    """
+    An EventBus shared by every worker process through a SQLite file.
+
+    publish() only queues the event in memory; a background task appends queued events to
+    the `events` table in batches, off the event loop, so a busy database never stalls the
+    loop. The table's AUTOINCREMENT key is the event ID for all workers. Each worker polls
+    the table every `poll_seconds` and delivers new rows, its own included, to its
+    subscribers, so a dashboard connected to any worker sees every worker's events in the
+    same order, and Last-Event-ID replay works across workers. The table keeps about
+    `history_size` events; if writes fall that far behind, the oldest queued events are dropped.
+    """
+
+    def __init__(self, path: str = SSE_BUS_PATH, buffer_size: int = SSE_BUFFER_SIZE,
+                 history_size: int = SSE_HISTORY_SIZE, poll_seconds: float = SSE_BUS_POLL_SECONDS):
+        super().__init__(buffer_size, history_size)
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        with self._lock:
+            # The first worker seeds the IDs from the clock (as EventBus does), so they stay
+            # above any a dashboard saw from an earlier server.
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT 'events', ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'events')",
+                (self._next_id - 1,)
+            )
+            self._conn.execute("COMMIT")
+        self._last_id = 0
+        self._published = 0
+        self._outbox = deque(maxlen=history_size)
+        self._outbox_ready = asyncio.Event()
+        self.dropped_unwritten = 0
+        self._poller = None
+        self._writer = None
+
+    def start(self):
+        """Primes the replay history from the shared table and starts polling it."""
+        if self._poller is not None:
+            return
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, event, data FROM events ORDER BY id DESC LIMIT ?", (self.history.maxlen,)
+            ).fetchall()
+            self._last_id = self._conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'events'"
+            ).fetchone()[0]
+        for event_id, event, data in reversed(rows):
+            self.history.append({"id": str(event_id), "event": event, "data": data})
+        self._next_id = self._last_id + 1
+        self._poller = asyncio.create_task(self._poll_loop())
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def stop(self):
+        for task in (self._poller, self._writer):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._poller = self._writer = None
+        # Write what is still queued, so the last events of a run reach the other workers.
+        try:
+            await self._flush()
+        except Exception as e:
+            logger.error(f"Failed to write to the shared event bus: {e}")
+
+    def publish(self, event: str, data: str) -> dict:
+        """Queues the event for the writer. Its ID is assigned when it is written."""
+        message = {"event": event, "data": data}
+        if len(self._outbox) == self._outbox.maxlen:
+            self.dropped_unwritten += 1
+        self._outbox.append(message)
+        self._outbox_ready.set()
+        return message
+
+    def _write(self, messages: list):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO events (event, data) VALUES (?, ?)",
+                    [(message["event"], message["data"]) for message in messages]
+                )
+                before = self._published
+                self._published += len(messages)
+                if self._published // _PRUNE_EVERY != before // _PRUNE_EVERY:
+                    last_id = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()[0]
+                    self._conn.execute("DELETE FROM events WHERE id <= ?", (last_id - self.history.maxlen,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def _flush(self):
+        messages = list(self._outbox)
+        self._outbox.clear()
+        if messages:
+            await asyncio.to_thread(self._write, messages)
+
+    async def _write_loop(self):
+        while True:
+            await self._outbox_ready.wait()
+            self._outbox_ready.clear()
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error(f"Failed to write to the shared event bus: {e}")
+
+    def _read_new(self) -> list:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, event, data FROM events WHERE id > ? ORDER BY id", (self._last_id,)
+            ).fetchall()
+
+    async def _poll_loop(self):
+        while True:
+            try:
+                rows = await asyncio.to_thread(self._read_new)
+            except Exception as e:
+                logger.error(f"Failed to read the shared event bus: {e}")
+                rows = []
+            for event_id, event, data in rows:
+                self._deliver({"id": str(event_id), "event": event, "data": data})
+                self._last_id = event_id
+            self._next_id = self._last_id + 1
+            await asyncio.sleep(self.poll_seconds)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "unwritten": len(self._outbox), "dropped_unwritten": self.dropped_unwritten}
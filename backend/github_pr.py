@@ -0,0 +1,210 @@
+import os
+import logging
+import threading
+from functools import lru_cache
+from github import Github, GithubException, InputGitTreeElement
+
+# --- Configuration ---
+GITHUB_API_TOKEN = os.getenv("GITHUB_API_TOKEN")
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+
+logger = logging.getLogger(__name__)
+
+# --- Shared GitHub Client ---
+# One authenticated client per process; PyGithub reuses its HTTP connection pool.
+_client = None
+_client_lock = threading.Lock()
+
+def get_github_client() -> Github:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = Github(GITHUB_API_TOKEN, base_url=GITHUB_API_URL)
+        return _client
+
+@lru_cache(maxsize=64)
+def get_repo(repo_name: str):
+    """Returns a cached Repository; its default branch and owner come with this one lookup."""
+    return get_github_client().get_repo(repo_name)
+
+
+def create_docs_pr(repo_name: str, branch_name: str, pr_title: str, pr_body: str,
+                   commit_message: str, files: dict) -> str:
+    """
+    Writes every file in `files` (path -> new content) as ONE commit on `branch_name`,
+    branched from the repo's default branch, and opens (or reuses) a PR for it.
+
+    Uses the Git Data API, so the number of API calls is constant no matter how many
+    files change: head ref, head commit, base tree, new tree, new commit, branch ref, PR.
+    Paths that don't exist on the default branch are skipped. Returns the PR URL.
+    Raises ValueError if none of the paths exist, and GithubException on API errors.
+    """
+    repo = get_repo(repo_name)
+    base_branch = repo.default_branch
+
+    # 1. Resolve the default branch head and its tree
+    head_sha = repo.get_git_ref(f"heads/{base_branch}").object.sha
+    base_commit = repo.get_git_commit(head_sha)
+    base_tree = repo.get_git_tree(base_commit.tree.sha, recursive=True)
+    existing_paths = {element.path for element in base_tree.tree if element.type == "blob"}
+
+    def exists(path: str) -> bool:
+        if path in existing_paths:
+            return True
+        if not base_tree.truncated:
+            return False
+        # Very large repos get a truncated listing; fall back to a per-path lookup.
+        try:
+            repo.get_contents(path, ref=head_sha)
+            return True
+        except GithubException as e:
+            if e.status == 404:
+                return False
+            raise
+
+    # 2. Build one tree containing all file updates
+    elements = []
+    for path, content in files.items():
+        if not exists(path):
+            logger.warning(f"File '{path}' does not exist on '{base_branch}'. Skipping...")
+            continue
+        elements.append(InputGitTreeElement(path=path, mode="100644", type="blob", content=content))
+    if not elements:
+        raise ValueError("No files were updated, so no PR was created.")
+
+    tree = repo.create_git_tree(elements, base_tree=base_commit.tree)
+    commit = repo.create_git_commit(commit_message, tree, [base_commit])
+
+    # 3. Point the branch at the new commit (create it, or move it if it already exists)
+    try:
+        repo.create_git_ref(ref=f"refs/heads/{branch_name}", sha=commit.sha)
+    except GithubException as e:
+        if e.status != 422:
+            raise
+        logger.info(f"Branch '{branch_name}' already exists. Moving it to the new commit...")
+        repo.get_git_ref(f"heads/{branch_name}").edit(sha=commit.sha, force=True)
+    logger.info(f"Committed {len(elements)} files to '{branch_name}' in {commit.sha[:7]}.")
+
+    # 4. Open the PR, or reuse the one already open for this branch
+    try:
+        pr = repo.create_pull(base=base_branch, head=branch_name, title=pr_title, body=pr_body)
+    except GithubException as e:
+        if e.status != 422:
+            raise
+        open_prs = repo.get_pulls(state="open", head=f"{repo.owner.login}:{branch_name}")
+        pr = next(iter(open_prs), None)
+        if pr is None:
+            raise
+        logger.info(f"PR for '{branch_name}' already exists; it now includes the new commit.")
+    return pr.html_url
+
+
+# --- Self-Test ---
+if __name__ == "__main__":
+    """
+    Runs create_docs_pr() against a stub repository that records every API call, and
+    checks that any number of files costs one tree and one commit, and that paths missing
+    from the default branch are skipped. No network access.
+
+    Usage:
+      python github_pr.py
+    """
+    from types import SimpleNamespace as Obj
+
+    class StubRepo:
+        def __init__(self, paths: list, truncated: bool = False, branch_exists: bool = False, pr_exists: bool = False):
+            self.paths = set(paths)
+            self.truncated = truncated
+            self.branch_exists = branch_exists
+            self.pr_exists = pr_exists
+            self.default_branch = "main"
+            self.owner = Obj(login="octo")
+            self.calls = []
+            self.trees = []
+
+        def _call(self, name: str):
+            self.calls.append(name)
+
+        def get_git_ref(self, ref):
+            self._call("get_git_ref")
+            return Obj(object=Obj(sha="head"), edit=lambda sha, force: self._call("edit_git_ref"))
+
+        def get_git_commit(self, sha):
+            self._call("get_git_commit")
+            return Obj(sha=sha, tree=Obj(sha="base-tree"))
+
+        def get_git_tree(self, sha, recursive=False):
+            self._call("get_git_tree")
+            listed = sorted(self.paths)[:1] if self.truncated else self.paths
+            return Obj(tree=[Obj(path=path, type="blob") for path in listed], truncated=self.truncated)
+
+        def get_contents(self, path, ref=None):
+            self._call("get_contents")
+            if path not in self.paths:
+                raise GithubException(404, {"message": "Not Found"})
+            return Obj(path=path)
+
+        def create_git_tree(self, elements, base_tree=None):
+            self._call("create_git_tree")
+            self.trees.append([element._identity["path"] for element in elements])
+            return Obj(sha="new-tree")
+
+        def create_git_commit(self, message, tree, parents):
+            self._call("create_git_commit")
+            return Obj(sha="new-commit-sha")
+
+        def create_git_ref(self, ref, sha):
+            self._call("create_git_ref")
+            if self.branch_exists:
+                raise GithubException(422, {"message": "Reference already exists"})
+
+        def create_pull(self, base, head, title, body):
+            self._call("create_pull")
+            if self.pr_exists:
+                raise GithubException(422, {"message": "A pull request already exists"})
+            return Obj(html_url="https://github.com/octo/docs/pull/1")
+
+        def get_pulls(self, state, head):
+            self._call("get_pulls")
+            return [Obj(html_url="https://github.com/octo/docs/pull/1")]
+
+    def run(repo: StubRepo, paths: list) -> str:
+        global get_repo
+        get_repo = lambda repo_name: repo
+        return create_docs_pr("octo/docs", "docs/ai-update", "docs: update", "body", "docs: update",
+                              {path: f"new {path}" for path in paths})
+
+    # One tree and one commit, however many files change; missing paths are skipped.
+    call_counts = []
+    for count in (2, 50):
+        paths = [f"docs/page{i}.md" for i in range(count)]
+        repo = StubRepo(paths)
+        assert run(repo, paths + ["docs/missing.md"]).endswith("/pull/1")
+        assert repo.trees == [paths], repo.trees
+        assert repo.calls.count("create_git_tree") == 1 and repo.calls.count("create_git_commit") == 1, repo.calls
+        call_counts.append(len(repo.calls))
+    assert call_counts == [7, 7], call_counts
+    print(f"✅ 2 and 50 files each took {call_counts[0]} API calls (one tree, one commit); the missing file was skipped.")
+
+    # An existing branch is moved and an open PR reused.
+    repo = StubRepo(["README.md"], branch_exists=True, pr_exists=True)
+    assert run(repo, ["README.md"]).endswith("/pull/1")
+    assert "edit_git_ref" in repo.calls and "get_pulls" in repo.calls, repo.calls
+    print("✅ Existing branch moved and open PR reused.")
+
+    # A truncated tree listing falls back to per-path lookups.
+    repo = StubRepo(["a.md", "b.md"], truncated=True)
+    run(repo, ["a.md", "b.md", "c.md"])
+    assert repo.trees == [["a.md", "b.md"]] and repo.calls.count("get_contents") == 2, (repo.trees, repo.calls)
+    print("✅ Truncated tree: unlisted paths checked individually, the missing one skipped.")
+
+    # Nothing to update: no tree, commit or PR.
+    repo = StubRepo(["README.md"])
+    try:
+        run(repo, ["docs/missing.md"])
+        raise AssertionError("expected ValueError")
+    except ValueError:
+        pass
+    assert "create_git_tree" not in repo.calls and "create_pull" not in repo.calls, repo.calls
+    print("✅ No existing paths: nothing was written.")
+    print("✅ All GitHub PR checks passed.")
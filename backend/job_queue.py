@@ -0,0 +1,379 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(BASE_DIR, "agent_jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_MAX_DEPTH = int(os.getenv("JOB_MAX_DEPTH", 100))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 60))
+# A failed job is retried after this delay, doubled on each further attempt.
+JOB_RETRY_SECONDS = float(os.getenv("JOB_RETRY_SECONDS", 30))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 5))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 24 * 3600))
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_until REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+CREATE TABLE IF NOT EXISTS seen (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    job_id INTEGER,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS idx_seen_kind_time ON seen (kind, seen_at);
+"""
+# Columns added after the first release; older queue files are migrated on open.
+_ADDED_COLUMNS = {"coalesce_key": "TEXT", "run_after": "REAL"}
+_SQLITE_MAX_PARAMS = 500
+
+
+class QueueFullError(Exception):
+    """Raised when the queue already holds JOB_MAX_DEPTH pending jobs."""
+
+
+class JobQueue:
+    """
+    A persistent, at-least-once job queue backed by SQLite.
+
+    A job is only marked 'done' after its handler returns. Jobs are claimed with a
+    lease that is renewed while the handler runs, so a job whose worker crashed is
+    picked up again once its lease expires (including after a server restart). A job
+    whose handler raises is retried with exponential backoff, up to `max_attempts` runs.
+
+    Jobs enqueued with `coalesce()` wait before they run, and later jobs with the same
+    key are merged into a waiting one. The queue also keeps bounded "seen" sets for
+    de-duplication. All state lives in the SQLite file, so processes sharing it share
+    the jobs, the waiting windows and the seen sets.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, max_depth: int = JOB_MAX_DEPTH,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, lease_seconds: float = JOB_LEASE_SECONDS,
+                 retry_seconds: float = JOB_RETRY_SECONDS):
+        self.path = path
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+        self._wakeup = None
+        self._next_due = None
+        self._workers = []
+        self._lease_task = None
+        self._stopping = False
+        self._running = {}  # job id -> worker task, used for lease renewal
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in columns:
+                try:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+                except sqlite3.OperationalError:
+                    pass  # Another process added it first.
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_coalesce ON jobs (coalesce_key, status)")
+
+    # --- Synchronous storage operations (run via asyncio.to_thread) ---
+
+    def _enqueue_sync(self, payload: dict, coalesce_key: str = None, delay_seconds: float = 0,
+                      max_delay_seconds: float = None) -> tuple:
+        """Returns (job id, whether the payload was merged into a waiting job)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = None
+                if coalesce_key is not None:
+                    row = self._conn.execute(
+                        "SELECT id, payload, enqueued_at FROM jobs WHERE status = 'queued' AND coalesce_key = ? "
+                        "ORDER BY id LIMIT 1",
+                        (coalesce_key,)
+                    ).fetchone()
+                if row is not None:
+                    job_id, stored, enqueued_at = row
+                    merged = json.loads(stored)
+                    merged["events"].extend(payload["events"])
+                    run_after = now + delay_seconds
+                    if max_delay_seconds is not None:
+                        run_after = min(run_after, enqueued_at + max_delay_seconds)
+                    self._conn.execute(
+                        "UPDATE jobs SET payload = ?, run_after = ? WHERE id = ?",
+                        (json.dumps(merged), run_after, job_id)
+                    )
+                else:
+                    depth = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                    if depth >= self.max_depth:
+                        raise QueueFullError(f"Job queue is full ({depth} pending jobs).")
+                    job_id = self._conn.execute(
+                        "INSERT INTO jobs (payload, enqueued_at, coalesce_key, run_after) VALUES (?, ?, ?, ?)",
+                        (json.dumps(payload), now, coalesce_key, now + delay_seconds if delay_seconds else None)
+                    ).lastrowid
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id, row is not None
+
+    def _claim_sync(self):
+        """Atomically claims the oldest queued job, or a running job whose lease has expired."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs that keep crashing their worker are parked instead of retried forever.
+                parked = [row[0] for row in self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, self.max_attempts)
+                ).fetchall()]
+                for job_id in parked:
+                    self._fail_sync(job_id, "Lease expired too many times", now)
+                row = self._conn.execute(
+                    "SELECT id, payload, enqueued_at, attempts FROM jobs "
+                    "WHERE (status = 'queued' AND (run_after IS NULL OR run_after <= ?)) "
+                    "OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is None:
+                    self._next_due = self._conn.execute(
+                        "SELECT MIN(run_after) FROM jobs WHERE status = 'queued'"
+                    ).fetchone()[0]
+                    self._conn.execute("COMMIT")
+                    return None
+                job_id, payload, enqueued_at, attempts = row
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = ?, started_at = ?, lease_until = ? WHERE id = ?",
+                    (attempts + 1, now, now + self.lease_seconds, job_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"id": job_id, "payload": json.loads(payload), "enqueued_at": enqueued_at, "attempt": attempts + 1}
+
+    def _renew_leases_sync(self, job_ids: list):
+        until = time.time() + self.lease_seconds
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                [(until, job_id) for job_id in job_ids]
+            )
+
+    def _finish_sync(self, job_id: int, error: str = None):
+        now = time.time()
+        with self._lock:
+            if error is None:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'done', finished_at = ?, lease_until = NULL WHERE id = ?",
+                    (now, job_id)
+                )
+                return
+            attempts = self._conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            if attempts >= self.max_attempts:
+                self._fail_sync(job_id, error, now)
+                return
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', lease_until = NULL, last_error = ?, run_after = ? WHERE id = ?",
+                (error, now + self.retry_seconds * 2 ** (attempts - 1), job_id)
+            )
+
+    def _fail_sync(self, job_id: int, error: str, now: float):
+        # Caller holds the lock. What the job marked as seen is released, so it can be retried.
+        self._conn.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, lease_until = NULL, last_error = ? WHERE id = ?",
+            (now, error, job_id)
+        )
+        self._conn.execute("DELETE FROM seen WHERE job_id = ?", (job_id,))
+
+    def _is_seen_sync(self, kind: str, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM seen WHERE kind = ? AND key = ?", (kind, key)).fetchone() is not None
+
+    def _mark_seen_sync(self, kind: str, keys: list, job_id: int = None, max_entries: int = None) -> set:
+        """
+        Records `keys` of `kind` as seen and returns the ones that were already recorded,
+        except by `job_id` itself (so a retried job sees the same result). Beyond
+        `max_entries`, the least recently seen keys of that kind are forgotten.
+        """
+        now = time.time()
+        already = set()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for start in range(0, len(keys), _SQLITE_MAX_PARAMS):
+                    batch = keys[start:start + _SQLITE_MAX_PARAMS]
+                    rows = self._conn.execute(
+                        f"SELECT key, job_id FROM seen WHERE kind = ? AND key IN ({','.join('?' * len(batch))})",
+                        [kind] + batch
+                    ).fetchall()
+                    already.update(key for key, owner in rows if job_id is None or owner != job_id)
+                self._conn.executemany(
+                    "INSERT INTO seen (kind, key, job_id, seen_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (kind, key) DO UPDATE SET seen_at = excluded.seen_at",
+                    [(kind, key, job_id, now) for key in keys]
+                )
+                if max_entries is not None:
+                    count = self._conn.execute("SELECT COUNT(*) FROM seen WHERE kind = ?", (kind,)).fetchone()[0]
+                    if count > max_entries:
+                        self._conn.execute(
+                            "DELETE FROM seen WHERE kind = ? AND key IN "
+                            "(SELECT key FROM seen WHERE kind = ? ORDER BY seen_at LIMIT ?)",
+                            (kind, kind, count - max_entries)
+                        )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return already
+
+    def _prune_sync(self, retention_seconds: float = JOB_RETENTION_SECONDS):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - retention_seconds,)
+            )
+
+    def stats(self) -> dict:
+        """Returns queue depth, in-flight count and wait-time statistics."""
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            waiting = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND run_after > ?", (now,)
+            ).fetchone()[0]
+            seen = dict(self._conn.execute("SELECT kind, COUNT(*) FROM seen GROUP BY kind").fetchall())
+            oldest = self._conn.execute("SELECT MIN(enqueued_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            waits = [row[0] for row in self._conn.execute(
+                "SELECT started_at - enqueued_at FROM jobs WHERE started_at IS NOT NULL ORDER BY id DESC LIMIT 200"
+            ).fetchall()]
+        waits.sort()
+        return {
+            "depth": counts.get("queued", 0),
+            "waiting": waiting,
+            "in_flight": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "workers": len(self._workers),
+            "oldest_queued_age_seconds": round(now - oldest, 3) if oldest else 0.0,
+            "wait_seconds_avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "wait_seconds_p50": round(waits[len(waits) // 2], 3) if waits else 0.0,
+            "wait_seconds_max": round(waits[-1], 3) if waits else 0.0,
+            "seen": seen,
+        }
+
+    # --- Async API ---
+
+    async def enqueue(self, payload: dict) -> int:
+        """Persists a job and wakes an idle worker. Raises QueueFullError when at capacity."""
+        job_id, _ = await asyncio.to_thread(self._enqueue_sync, payload)
+        if self._wakeup:
+            self._wakeup.set()
+        return job_id
+
+    async def coalesce(self, key: str, payload: dict, delay_seconds: float, max_delay_seconds: float = None) -> tuple:
+        """
+        Persists a job that runs `delay_seconds` from now, or merges `payload` into the job
+        with the same `key` that is still queued: its "events" list is extended and its start
+        is pushed back, up to `max_delay_seconds` after it was first enqueued. Payloads must
+        have an "events" list. Returns (job id, whether it was merged). Raises QueueFullError
+        when a new job is needed and the queue is at capacity.
+        """
+        result = await asyncio.to_thread(self._enqueue_sync, payload, key, delay_seconds, max_delay_seconds)
+        if self._wakeup:
+            self._wakeup.set()
+        return result
+
+    async def is_seen(self, kind: str, key: str) -> bool:
+        """Whether `key` of `kind` has been recorded (and not released by a failed job)."""
+        return await asyncio.to_thread(self._is_seen_sync, kind, key)
+
+    async def mark_seen(self, kind: str, keys: list, job_id: int = None, max_entries: int = None) -> set:
+        """Async version of _mark_seen_sync(): records `keys` and returns those seen before."""
+        return await asyncio.to_thread(self._mark_seen_sync, kind, list(keys), job_id, max_entries)
+
+    async def _worker(self, name: str, handler):
+        # The flag guards against wait_for() swallowing a cancel that races with a wakeup.
+        while not self._stopping:
+            # Clear before claiming so an enqueue that races with an empty claim still wakes us.
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self._claim_sync)
+            if job is None:
+                # Wake up in time for the next waiting job.
+                timeout = JOB_POLL_SECONDS
+                if self._next_due is not None:
+                    timeout = min(timeout, max(self._next_due - time.time(), 0.05))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logger.info(f"{name} picked up job #{job['id']} (attempt {job['attempt']}, "
+                        f"waited {time.time() - job['enqueued_at']:.1f}s)")
+            self._running[job["id"]] = asyncio.current_task()
+            error = None
+            try:
+                await handler(job["payload"], job["id"])
+            except asyncio.CancelledError:
+                # Leave the job 'running'; its lease expires and it is retried after restart.
+                raise
+            except Exception as e:
+                logger.error(f"Job #{job['id']} failed: {e}", exc_info=True)
+                error = str(e)
+            finally:
+                self._running.pop(job["id"], None)
+            await asyncio.to_thread(self._finish_sync, job["id"], error)
+
+    async def _lease_keeper(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if self._running:
+                await asyncio.to_thread(self._renew_leases_sync, list(self._running))
+
+    async def start(self, handler, num_workers: int = JOB_WORKERS):
+        """Starts the worker pool. `handler` is an async callable that receives the job payload and ID."""
+        if self._workers:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        await asyncio.to_thread(self._prune_sync)
+        self._workers = [
+            asyncio.create_task(self._worker(f"worker-{i}", handler))
+            for i in range(max(1, num_workers))
+        ]
+        self._lease_task = asyncio.create_task(self._lease_keeper())
+        depth = (await asyncio.to_thread(self.stats))["depth"]
+        logger.info(f"Job queue started with {num_workers} workers ({depth} jobs pending).")
+
+    async def stop(self):
+        """Cancels the workers. In-flight jobs stay leased and are recovered on the next start."""
+        self._stopping = True
+        tasks = self._workers + ([self._lease_task] if self._lease_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._lease_task = None
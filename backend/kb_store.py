@@ -0,0 +1,395 @@
+import os
+import re
+import json
+import time
+import uuid
+import atexit
+import hashlib
+import datetime
+import threading
+from contextlib import contextmanager, nullcontext
+from multiworker import MULTI_WORKER, FileLock
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+KB_PATH = os.getenv("KB_PATH", os.path.join(BASE_DIR, "data", "kb"))
+KB_EXPORT_PATH = os.path.abspath(os.getenv("KB_EXPORT_PATH", os.path.join(BASE_DIR, "data", "@Knowledge_base.md")))
+KB_SEGMENT_MAX_BYTES = int(os.getenv("KB_SEGMENT_MAX_BYTES", 1024 * 1024))
+KB_COMPACT_RATIO = float(os.getenv("KB_COMPACT_RATIO", 0.5))
+KB_COMPACT_MIN_BYTES = int(os.getenv("KB_COMPACT_MIN_BYTES", 256 * 1024))
+KB_INDEX_CHECKPOINT_EVERY = int(os.getenv("KB_INDEX_CHECKPOINT_EVERY", 20))
+
+INDEX_FILE = "index.json"
+LOCK_FILE = "kb.lock"
+EXPORT_MARKER = "<!-- Exported from the knowledge-base store (data/kb). Edits here are overwritten. -->"
+_SEGMENT_NAME = re.compile(r"^segment-(\d{6})\.jsonl$")
+_LEGACY_ENTRY = re.compile(r"\n*---\n\n### AI-Generated Update \((\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\)\n\n")
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.strip().encode("utf-8")).hexdigest()
+
+
+class KnowledgeBaseStore:
+    """
+    A log-structured store for AI-generated knowledge-base entries.
+
+    Entries are appended as JSON lines to segment files that roll over at
+    KB_SEGMENT_MAX_BYTES. An in-memory index maps each live entry ID to its
+    (segment, offset, length), and is checkpointed to `index.json`; on open, any
+    segment bytes written after the checkpoint are replayed.
+
+    An entry supersedes the live entry with the same `key` (e.g. docs for the same
+    changed files); an entry whose content is identical to a live one is dropped.
+    Once superseded bytes exceed KB_COMPACT_RATIO of the store, the live entries are
+    rewritten into fresh segments and the old ones deleted, so the store (and any
+    index built from it) only grows with the entries that are still current.
+
+    In multi-worker mode every operation holds a file lock shared by all workers, and
+    first replays what other workers appended (or reopens the store after their compaction).
+    """
+
+    def __init__(self, path: str = KB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}      # entry_id -> {"segment", "offset", "length", "key", "hash", "timestamp"}
+        self._by_key = {}       # key -> entry_id
+        self._by_hash = {}      # content hash -> entry_id
+        self._segments = {}     # segment name -> size in bytes
+        self._unsaved = 0
+        self.stats_counters = {"appended": 0, "superseded": 0, "duplicates": 0, "compactions": 0}
+        os.makedirs(self.path, exist_ok=True)
+        self._file_lock = FileLock(os.path.join(self.path, LOCK_FILE)) if MULTI_WORKER else None
+        with self._file_lock.exclusive() if self._file_lock else nullcontext():
+            self._open()
+
+    # --- Loading ---
+
+    def _segment_path(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _segment_names(self) -> list:
+        return sorted(name for name in os.listdir(self.path) if _SEGMENT_NAME.match(name))
+
+    def _open(self):
+        checkpoint = None
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, "r", encoding="utf-8") as f:
+                    checkpoint = json.load(f)
+            except Exception as e:
+                print(f"Error reading KB index, rebuilding it from the segments: {e}")
+
+        on_disk = self._segment_names()
+        if checkpoint:
+            self._entries = checkpoint["entries"]
+            self._segments = {name: size for name, size in checkpoint["segments"].items() if name in on_disk}
+            for entry_id, entry in self._entries.items():
+                self._by_key[entry["key"]] = entry_id
+                self._by_hash[entry["hash"]] = entry_id
+            newest = max(self._segments, default="")
+            for name in on_disk:
+                if name not in self._segments and name < newest:
+                    # Left behind by a compaction that finished writing its index.
+                    os.remove(self._segment_path(name))
+        replayed = 0
+        for name in self._segment_names():
+            replayed += self._replay(name, self._segments.get(name, 0))
+        if replayed:
+            self._save_index()
+
+    @contextmanager
+    def _locked(self):
+        """The store lock; in multi-worker mode also the cross-process lock, with other workers' writes applied."""
+        with self._lock:
+            if self._file_lock is None:
+                yield
+                return
+            with self._file_lock.exclusive():
+                self._refresh()
+                yield
+
+    def _refresh(self):
+        on_disk = self._segment_names()
+        if any(name not in on_disk for name in self._segments):
+            # Another worker compacted the store: reopen from its checkpoint.
+            self._entries, self._by_key, self._by_hash, self._segments = {}, {}, {}, {}
+            self._open()
+            return
+        for name in on_disk:
+            if os.path.getsize(self._segment_path(name)) > self._segments.get(name, 0):
+                self._replay(name, self._segments.get(name, 0))
+
+    def _replay(self, name: str, start: int) -> int:
+        """Applies records written to a segment after `start`. Truncates a torn last line."""
+        path = self._segment_path(name)
+        applied = 0
+        offset = start
+        with open(path, "rb") as f:
+            f.seek(start)
+            for raw in f:
+                try:
+                    if not raw.endswith(b"\n"):
+                        raise ValueError("incomplete record")
+                    record = json.loads(raw)
+                except ValueError:
+                    print(f"Discarding a torn record at {name}:{offset}.")
+                    break
+                self._apply(record, name, offset, len(raw))
+                offset += len(raw)
+                applied += 1
+        if offset < os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+        self._segments[name] = offset
+        return applied
+
+    def _apply(self, record: dict, segment: str, offset: int, length: int) -> bool:
+        """Updates the index for one record. Returns False if it duplicates a live entry."""
+        if record["hash"] in self._by_hash:
+            return False
+        previous = self._by_key.get(record["key"])
+        if previous is not None:
+            old = self._entries.pop(previous)
+            self._by_hash.pop(old["hash"], None)
+        self._entries[record["id"]] = {
+            "segment": segment, "offset": offset, "length": length,
+            "key": record["key"], "hash": record["hash"], "timestamp": record["timestamp"],
+        }
+        self._by_key[record["key"]] = record["id"]
+        self._by_hash[record["hash"]] = record["id"]
+        return True
+
+    def _save_index(self):
+        data = json.dumps({"entries": self._entries, "segments": self._segments}).encode("utf-8")
+        _atomic_write(os.path.join(self.path, INDEX_FILE), data)
+        self._unsaved = 0
+
+    # --- Writes ---
+
+    def _active_segment(self, incoming: int) -> str:
+        names = sorted(self._segments)
+        if names and self._segments[names[-1]] + incoming <= KB_SEGMENT_MAX_BYTES:
+            return names[-1]
+        return self._new_segment_name()
+
+    def _new_segment_name(self) -> str:
+        existing = [int(_SEGMENT_NAME.match(n).group(1)) for n in set(self._segments) | set(self._segment_names())]
+        return f"segment-{max(existing, default=0) + 1:06d}.jsonl"
+
+    def _write_record(self, record: dict, segment: str = None) -> tuple:
+        raw = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        segment = segment or self._active_segment(len(raw))
+        offset = self._segments.get(segment, 0)
+        with open(self._segment_path(segment), "ab") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        self._segments[segment] = offset + len(raw)
+        return segment, offset, len(raw)
+
+    def append(self, content: str, key: str = None, metadata: dict = None):
+        """
+        Appends an entry and returns it (with its `id` and the `superseded` entry ID, if any),
+        or None if identical content is already live.
+        """
+        digest = content_hash(content)
+        with self._locked():
+            if digest in self._by_hash:
+                self.stats_counters["duplicates"] += 1
+                return None
+            record = {
+                "id": uuid.uuid4().hex,
+                "key": key or digest,
+                "hash": digest,
+                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "metadata": metadata or {},
+                "content": content,
+            }
+            superseded = self._by_key.get(record["key"])
+            segment, offset, length = self._write_record(record)
+            self._apply(record, segment, offset, length)
+            self.stats_counters["appended"] += 1
+            if superseded:
+                self.stats_counters["superseded"] += 1
+            self._unsaved += 1
+            if self._unsaved >= KB_INDEX_CHECKPOINT_EVERY:
+                self._save_index()
+            needs_compaction = self._needs_compaction()
+
+        if needs_compaction:
+            self.compact()
+        return {**record, "superseded": superseded}
+
+    # --- Reads ---
+
+    def _read(self, entry: dict) -> dict:
+        with open(self._segment_path(entry["segment"]), "rb") as f:
+            f.seek(entry["offset"])
+            return json.loads(f.read(entry["length"]))
+
+    def get(self, entry_id: str):
+        with self._locked():
+            entry = self._entries.get(entry_id)
+            return self._read(entry) if entry else None
+
+    def live_entries(self) -> list:
+        """Returns every live entry, oldest first, as full records."""
+        with self._locked():
+            entries = sorted(self._entries.values(), key=lambda e: (e["segment"], e["offset"]))
+            return [self._read(entry) for entry in entries]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # --- Compaction and Export ---
+
+    def _total_bytes(self) -> int:
+        return sum(self._segments.values())
+
+    def _live_bytes(self) -> int:
+        return sum(entry["length"] for entry in self._entries.values())
+
+    def _needs_compaction(self) -> bool:
+        total = self._total_bytes()
+        dead = total - self._live_bytes()
+        return total >= KB_COMPACT_MIN_BYTES and dead > total * KB_COMPACT_RATIO
+
+    def compact(self) -> dict:
+        """Rewrites the live entries into fresh segments and deletes the old ones."""
+        with self._locked():
+            start_time = time.perf_counter()
+            before = self._total_bytes()
+            old_segments = list(self._segments)
+            records = [self._read(entry) for entry in
+                       sorted(self._entries.values(), key=lambda e: (e["segment"], e["offset"]))]
+
+            self._entries, self._by_key, self._by_hash = {}, {}, {}
+            segment, size = self._new_segment_name(), 0
+            for record in records:
+                if size >= KB_SEGMENT_MAX_BYTES:
+                    segment, size = self._new_segment_name(), 0
+                written = self._write_record(record, segment)
+                size += written[2]
+                self._apply(record, *written)
+            for name in old_segments:
+                self._segments.pop(name, None)
+            self._save_index()
+            for name in old_segments:
+                os.remove(self._segment_path(name))
+
+            self.stats_counters["compactions"] += 1
+            report = {
+                "entries": len(records),
+                "bytes_before": before,
+                "bytes_after": self._total_bytes(),
+                "seconds": round(time.perf_counter() - start_time, 3),
+            }
+        print(f"Compacted knowledge base: {report}")
+        return report
+
+    def export_markdown(self, path: str = KB_EXPORT_PATH) -> int:
+        """Writes the live entries as a Markdown view. Returns the number of entries written."""
+        entries = self.live_entries()
+        parts = [EXPORT_MARKER]
+        for record in entries:
+            parts.append(
+                f"\n\n---\n\n"
+                f"### AI-Generated Update ({record['timestamp']})\n\n"
+                f"{record['content']}\n"
+            )
+        _atomic_write(path, "".join(parts).encode("utf-8"))
+        return len(entries)
+
+    def import_legacy_markdown(self, path: str = KB_EXPORT_PATH) -> int:
+        """
+        Imports entries from the old append-only Markdown file, or from an export
+        (one entry per '### AI-Generated Update' section). Duplicate sections are dropped.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        parts = _LEGACY_ENTRY.split(text.replace(EXPORT_MARKER, "", 1))
+        sections = [(None, parts[0])] + list(zip(parts[1::2], parts[2::2]))
+        imported = 0
+        with self._locked():
+            for timestamp, content in sections:
+                content = content.strip()
+                if not content:
+                    continue
+                digest = content_hash(content)
+                record = {
+                    "id": uuid.uuid4().hex, "key": digest, "hash": digest,
+                    "timestamp": timestamp or "", "metadata": {"imported_from": os.path.basename(path)},
+                    "content": content,
+                }
+                if digest in self._by_hash:
+                    self.stats_counters["duplicates"] += 1
+                    continue
+                self._apply(record, *self._write_record(record))
+                imported += 1
+            self._save_index()
+        return imported
+
+    def checkpoint(self):
+        with self._locked():
+            if self._unsaved:
+                self._save_index()
+
+    def stats(self) -> dict:
+        with self._locked():
+            total = self._total_bytes()
+            return {
+                **self.stats_counters,
+                "live_entries": len(self._entries),
+                "segments": len(self._segments),
+                "total_bytes": total,
+                "dead_bytes": total - self._live_bytes(),
+            }
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_kb_store() -> KnowledgeBaseStore:
+    """
+    Returns the process-wide knowledge-base store. On first use with an empty store,
+    entries from the old Markdown knowledge base are imported. The Markdown file itself
+    is tracked in git and only rewritten on request (`python kb_store.py --export`).
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = KnowledgeBaseStore()
+            if len(_store) == 0 and os.path.exists(KB_EXPORT_PATH):
+                imported = _store.import_legacy_markdown()
+                if imported:
+                    print(f"Imported {imported} entries from '{KB_EXPORT_PATH}' into the KB store.")
+            atexit.register(_store.checkpoint)
+        return _store
+
+
+# --- Self-Test ---
+if __name__ == "__main__":
+    """
+    Usage:
+      python kb_store.py            # print store stats
+      python kb_store.py --compact  # drop superseded/duplicate entries now
+      python kb_store.py --export   # rewrite the Markdown view at data/@Knowledge_base.md
+    """
+    import sys
+
+    store = get_kb_store()
+    if "--compact" in sys.argv:
+        store.compact()
+    if "--export" in sys.argv:
+        count = store.export_markdown()
+        print(f"Exported {count} entries to '{KB_EXPORT_PATH}'.")
+    print(json.dumps(store.stats(), indent=1))
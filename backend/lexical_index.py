@@ -0,0 +1,121 @@
+import os
+import re
+import math
+import heapq
+from functools import lru_cache
+from collections import Counter
+
+# --- Configuration ---
+BM25_K1 = float(os.getenv("BM25_K1", 1.2))
+BM25_B = float(os.getenv("BM25_B", 0.75))
+# Terms in more than this fraction of chunks carry almost no signal and are skipped at query time.
+BM25_MAX_DF_RATIO = float(os.getenv("BM25_MAX_DF_RATIO", 0.5))
+RRF_K = int(os.getenv("RRF_K", 60))
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_PART_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z]|\d|\b)|[A-Z]?[a-z]+|[A-Z]+|\d+")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+
+@lru_cache(maxsize=200_000)
+def _word_tokens(word: str) -> tuple:
+    lowered = word.lower()
+    tokens = [lowered] if len(lowered) > 1 and lowered not in STOPWORDS else []
+    if lowered != word or "_" in word:
+        parts = _PART_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts
+                          if len(part) > 1 and part.lower() not in STOPWORDS)
+    return tuple(tokens)
+
+
+def term_counts(text: str) -> Counter:
+    """
+    Lower-cased term frequencies. Identifiers are kept whole *and* split into their parts, so
+    `CONFIDENCE_THRESHOLD`, `getVectorStore` or `/api/v1/users` match both exactly and by word.
+    """
+    counts = Counter()
+    for word, count in Counter(_WORD_RE.findall(text)).items():
+        for token in _word_tokens(word):
+            counts[token] += count
+    return counts
+
+
+class BM25Index:
+    """
+    An in-memory inverted index scored with Okapi BM25.
+
+    Documents are added and removed by ID, so it can be kept in step with the FAISS
+    index chunk for chunk. Not thread-safe: the caller serializes access.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}   # term -> {doc_id: term frequency}
+        self._doc_terms = {}  # doc_id -> distinct terms, for removal
+        self._doc_len = {}
+        self._total_len = 0
+        self._num_postings = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, doc_id: str, text: str):
+        if doc_id in self._doc_len:
+            self.remove(doc_id)
+        counts = term_counts(text)
+        for term, count in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = count
+        self._doc_terms[doc_id] = tuple(counts)
+        self._num_postings += len(counts)
+        length = sum(counts.values())
+        self._doc_len[doc_id] = length
+        self._total_len += length
+
+    def remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._num_postings -= len(terms)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id)
+
+    def search(self, query: str, k: int = 20) -> list:
+        """Returns up to `k` (doc_id, score) pairs, best first."""
+        num_docs = len(self._doc_len)
+        if not num_docs:
+            return []
+        avg_len = self._total_len / num_docs or 1.0
+        scores = {}
+        for term in term_counts(query):
+            postings = self._postings.get(term)
+            if not postings or len(postings) > BM25_MAX_DF_RATIO * num_docs:
+                continue
+            df = len(postings)
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def stats(self) -> dict:
+        return {"documents": len(self._doc_len), "terms": len(self._postings), "postings": self._num_postings}
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = RRF_K) -> list:
+    """
+    Merges ranked lists of IDs: each ID scores sum(1 / (k + rank)) over the lists it
+    appears in. Returns (id, score) pairs, best first. Ties keep first-seen order.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import asyncio
+import threading
+
+# --- Configuration ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(BASE_DIR, "llm_cache.db"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 5000))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    chain TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used);
+"""
+
+
+def normalize_diff(text: str) -> str:
+    """Normalizes line endings and trailing whitespace so re-sent copies of a change hash the same."""
+    lines = [line.rstrip() for line in text.replace("\r\n", "\n").split("\n")]
+    return "\n".join(lines).strip("\n")
+
+
+def template_hash(prompt) -> str:
+    """Hashes a prompt template so editing a prompt invalidates its cached responses."""
+    return hashlib.sha256(prompt.pretty_repr().encode("utf-8")).hexdigest()[:16]
+
+
+class LLMResponseCache:
+    """
+    A persistent, content-addressed cache of chain outputs backed by SQLite.
+
+    Entries expire after `ttl_seconds`, and at most `max_entries` are kept, evicting
+    the least recently used.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def make_key(chain_name: str, prompt_hash: str, model_name: str, inputs: dict) -> str:
+        payload = json.dumps([chain_name, prompt_hash, model_name, inputs], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Returns the cached value, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, chain_name: str, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, chain, value, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, chain_name, json.dumps(value), now, now)
+                )
+                count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                if count > self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                        (count - self.max_entries,)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+class CachedChain:
+    """
+    Puts an LLMResponseCache in front of a chain. The key combines the chain name, the
+    prompt template hash, the model name and the chain inputs, with `diff_keys`
+    normalized first. A hit returns without calling the model at all.
+    """
+
+    def __init__(self, name: str, chain, prompt, model_name: str, cache: LLMResponseCache,
+                 diff_keys: tuple = ("git_diff",)):
+        self.name = name
+        self.chain = chain
+        self.model_name = model_name
+        self.cache = cache
+        self.diff_keys = diff_keys
+        self.prompt_hash = template_hash(prompt)
+
+    def _key(self, inputs: dict) -> str:
+        normalized = {
+            key: normalize_diff(value) if key in self.diff_keys and isinstance(value, str) else value
+            for key, value in inputs.items()
+        }
+        return self.cache.make_key(self.name, self.prompt_hash, self.model_name, normalized)
+
+    def invoke(self, inputs: dict, *args, **kwargs):
+        key = self._key(inputs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = self.chain.invoke(inputs, *args, **kwargs)
+        self.cache.put(key, self.name, result)
+        return result
+
+    async def ainvoke(self, inputs: dict, *args, **kwargs):
+        key = self._key(inputs)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            return cached
+        result = await self.chain.ainvoke(inputs, *args, **kwargs)
+        await asyncio.to_thread(self.cache.put, key, self.name, result)
+        return result
@@ -1,26 +1,110 @@
 import os
+import time
 from dotenv import load_dotenv
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.documents import Document
+from langchain_core.callbacks import BaseCallbackHandler
+from llm_cache import LLMResponseCache, CachedChain, LLM_CACHE_ENABLED
+from rate_limiter import AdaptiveRateLimiter, RateLimitedChain, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK
+from diff_budget import estimate_tokens
+from metrics import LLM_REQUESTS, LLM_REQUEST_SECONDS, LLM_PROMPT_TOKENS, LLM_COMPLETION_TOKENS
 
 # --- Load API Key ---
 load_dotenv()
 
-# Check if API key exists
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY not found in environment variables. Please set it in your .env file.")
-
-# Set the API key for the SDK
-os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
 
 # Initialize the Generative AI model
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash-lite", 
-    temperature=0.2 
-)
+LLM_MODEL_NAME = "gemini-2.5-flash-lite"
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+_llm = None
+
+def get_llm() -> ChatGoogleGenerativeAI:
+    """
+    Returns the shared Gemini client, created on first use so importing this module never
+    fails. Raises ValueError if GOOGLE_API_KEY is missing.
+    """
+    global _llm
+    if _llm is None:
+        # Check if API key exists
+        if not GOOGLE_API_KEY:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables. Please set it in your .env file.")
+        # Set the API key for the SDK
+        os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
+        _llm = ChatGoogleGenerativeAI(
+            model=LLM_MODEL_NAME, 
+            temperature=0.2,
+            timeout=LLM_TIMEOUT_SECONDS,
+            max_retries=1 # Retries are handled by the shared rate limiter, which also backs off on 429s
+        )
+    return _llm
+
+# --- Response Cache ---
+# Identical changes (cherry-picks, re-pushes, redeliveries) reuse earlier analyzer/summarizer output.
+_llm_cache = None
+
+def get_llm_cache() -> LLMResponseCache:
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMResponseCache()
+    return _llm_cache
+
+# --- Rate Limiting ---
+# Every chain call goes through one scheduler: RPM/TPM token buckets, adaptive
+# concurrency and retries, with analyzer calls ahead of bulk seeding work.
+_rate_limiter = None
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = AdaptiveRateLimiter()
+    return _rate_limiter
+
+# --- Metrics ---
+# Per-chain model latency and token usage, taken from the model's own usage metadata
+# (falling back to a length estimate if the response has none).
+
+class TokenUsageRecorder(BaseCallbackHandler):
+    def __init__(self, chain_name: str):
+        self.chain_name = chain_name
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), sum(estimate_tokens(str(m.content)) for batch in messages for m in batch))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), sum(estimate_tokens(p) for p in prompts))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start, prompt_estimate = self._started.pop(run_id, (None, 0))
+        if start is not None:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, chain=self.chain_name)
+        LLM_REQUESTS.inc(chain=self.chain_name, outcome="ok")
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+        completion_estimate = sum(estimate_tokens(g.text) for gens in response.generations for g in gens)
+        LLM_PROMPT_TOKENS.inc(usage.get("input_tokens", prompt_estimate), chain=self.chain_name)
+        LLM_COMPLETION_TOKENS.inc(usage.get("output_tokens", completion_estimate), chain=self.chain_name)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start, _ = self._started.pop(run_id, (None, 0))
+        if start is not None:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, chain=self.chain_name)
+        LLM_REQUESTS.inc(chain=self.chain_name, outcome="error")
+
+def _rate_limited(name: str, chain, priority: int):
+    metered = chain.with_config(callbacks=[TokenUsageRecorder(name)])
+    return RateLimitedChain(name, metered, get_rate_limiter(), priority)
+
+def _with_cache(name: str, chain, prompt):
+    if not LLM_CACHE_ENABLED:
+        return chain
+    return CachedChain(name, chain, prompt, LLM_MODEL_NAME, get_llm_cache())
 
 # --- 1. The "Analyzer" Chain ---
 
@@ -52,9 +136,9 @@ Examples:
     ])
     
     # We pipe the prompt to the LLM and then to a JSON parser
-    analyzer_chain = prompt | llm | JsonOutputParser()
+    analyzer_chain = _rate_limited("analyzer", prompt | get_llm() | JsonOutputParser(), PRIORITY_HIGH)
     
-    return analyzer_chain
+    return _with_cache("analyzer", analyzer_chain, prompt)
 
 # --- 2. The "Rewriter" Chain ---
 
@@ -110,7 +194,7 @@ Please provide the new, updated documentation based on these changes:
     ])
     
     # We pipe this to the LLM and then to a simple string parser
-    rewriter_chain = prompt | llm | StrOutputParser()
+    rewriter_chain = _rate_limited("rewriter", prompt | get_llm() | StrOutputParser(), PRIORITY_NORMAL)
     
     return rewriter_chain
 
@@ -153,7 +237,7 @@ Please write a new documentation section for this feature:
 """)
     ])
     
-    creator_chain = prompt | llm | StrOutputParser()
+    creator_chain = _rate_limited("creator", prompt | get_llm() | StrOutputParser(), PRIORITY_NORMAL)
     return creator_chain
 
 # --- 4. The "Summarizer" Chain ---
@@ -188,8 +272,8 @@ Please provide the single-sentence summary for the changelog:
 """)
     ])
     
-    summarizer_chain = prompt | llm | StrOutputParser()
-    return summarizer_chain
+    summarizer_chain = _rate_limited("summarizer", prompt | get_llm() | StrOutputParser(), PRIORITY_NORMAL)
+    return _with_cache("summarizer", summarizer_chain, prompt)
 
 # --- 5. The "Seeder" Chain ---
 
@@ -226,7 +310,7 @@ Please generate the initial project documentation based on this code.
 """)
     ])
     
-    seeder_chain = prompt | llm | StrOutputParser()
+    seeder_chain = _rate_limited("seeder", prompt | get_llm() | StrOutputParser(), PRIORITY_BULK)
     return seeder_chain
 
 # --- Helper Function to format docs ---
@@ -1,18 +1,30 @@
 import os
+import time
 import hmac
 import hashlib
 import asyncio
 import json
 import logging
-import requests # <--- IMPORTED
 from dotenv import load_dotenv
 from github import Github # PyGithub library
 from fastapi import FastAPI, Request, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, JSONResponse
 from sse_starlette.sse import EventSourceResponse
 
 # --- Import our agent logic ---
 import agent_logic 
+from job_queue import JobQueue, QueueFullError
+from event_bus import EventBus, SharedEventBus
+from multiworker import MULTI_WORKER
+from webhook_coalescer import EventCoalescer, WEBHOOK_SEEN_DELIVERIES
+from diff_fetcher import fetch_diff, aclose_client
+from vector_store import flush_vector_store, embedding_cache_stats, vector_store_stats
+from diff_parser import diff_stats
+from kb_store import get_kb_store
+from llm_clients import get_rate_limiter, get_llm_cache
+from llm_cache import LLM_CACHE_ENABLED
+from metrics import REGISTRY, CONTENT_TYPE, WEBHOOK_REQUESTS, WEBHOOK_SECONDS
 
 # --- Load Environment Variables ---
 load_dotenv()
@@ -37,10 +49,89 @@ logger = logging.getLogger(__name__)
 
 # --- Global App Setup ---
 app = FastAPI()
-log_queue = asyncio.Queue()
+# With several workers, every dashboard must see every worker's events.
+event_bus = SharedEventBus() if MULTI_WORKER else EventBus()
 
 async def push_log(event: str, data: str):
-    await log_queue.put({"event": event, "data": data})
+    # Fan out to every connected dashboard without waiting on any of them.
+    event_bus.publish(event, data)
+
+# --- Durable Job Queue for Agent Runs ---
+# Webhooks only persist a job; a bounded pool of workers runs the agent pipeline.
+job_queue = JobQueue()
+
+async def run_agent(**payload):
+    await agent_logic.run_agent_analysis(logger=logger, broadcaster=push_log, **payload)
+
+async def process_agent_job(payload: dict, job_id: int):
+    # Webhook events are queued as coalesced runs; plain payloads are single agent runs.
+    if "events" in payload:
+        await coalescer.run_job(payload, job_id)
+    else:
+        await run_agent(**payload)
+
+# --- Webhook Coalescing and De-duplication ---
+# Bursts of events for the same repo/branch become one run; redelivered webhooks are dropped.
+coalescer = EventCoalescer(queue=job_queue, run=run_agent, broadcaster=push_log)
+
+async def queue_agent_run(key: tuple, delivery_id: str = None, **event):
+    """
+    Queues a webhook event for its (repo, branch) run. Answers 503 if the queue is full.
+    The delivery ID is recorded against the job only once it is queued, so a redelivery
+    of an event that was rejected or lost on the way still gets through, and one whose
+    job finally fails is let through again.
+    """
+    try:
+        job_id, merged = await coalescer.add(key, **event)
+    except QueueFullError as e:
+        await push_log("log-error", f"Agent is busy, rejecting event: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    if delivery_id:
+        await job_queue.mark_seen("delivery", [delivery_id], job_id=job_id, max_entries=WEBHOOK_SEEN_DELIVERIES)
+    if merged:
+        await push_log("log-step", f"Merged into pending job #{job_id} for '{key[1]}'.")
+    else:
+        depth = (await asyncio.to_thread(job_queue.stats))["depth"]
+        await push_log("log-step", f"Queued as job #{job_id} ({depth} pending); "
+                                   f"it starts once '{key[1]}' is quiet for {coalescer.debounce_seconds:.0f}s.")
+    return job_id
+
+# --- Background Warm-Up ---
+# The embedding model, vector index and LLM chains load after the server starts accepting
+# requests. Jobs enqueued meanwhile are held in the queue; workers start once warm-up is done.
+warmup_task = None
+
+async def warm_up_and_start_workers():
+    await agent_logic.warmup.run()
+    await job_queue.start(process_agent_job)
+
+@app.on_event("startup")
+async def start_job_workers():
+    global warmup_task
+    event_bus.start()
+    warmup_task = asyncio.create_task(warm_up_and_start_workers())
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+    # Pending coalesced runs are already in the job queue and run after the restart.
+    await job_queue.stop()
+    await event_bus.stop()
+    await aclose_client()
+    await asyncio.to_thread(flush_vector_store)
+
+async def fetch_git_diff(diff_url: str):
+    """Streams the diff from GitHub without blocking the event loop (see diff_fetcher)."""
+    headers = {
+        "Authorization": f"token {GITHUB_API_TOKEN}",
+        "Accept": "application/vnd.github.v3.diff"
+    }
+    diff = await fetch_diff(diff_url, headers=headers)
+    if diff.truncated:
+        await push_log("log-step", f"Large diff truncated to {diff.num_lines} lines ({diff.num_bytes // 1024} KB).")
+    return diff
 
 app.add_middleware(
     CORSMiddleware,
@@ -55,16 +146,88 @@ app.add_middleware(
 async def health_check():
     return {"status": "ok", "message": "Doc-Ops Agent is healthy"}
 
+# --- Readiness Endpoint ---
+# 503 until warm-up finishes, so a load balancer only routes to instances that can run the agent.
+@app.get("/api/ready")
+async def readiness_check():
+    queue = await asyncio.to_thread(job_queue.stats)
+    status = {**agent_logic.warmup.status(), "queued_jobs": queue["depth"]}
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# --- Job Queue Stats Endpoint ---
+@app.get("/api/queue/stats")
+async def queue_stats():
+    return await asyncio.to_thread(job_queue.stats)
+
+# --- Webhook Coalescer Stats Endpoint ---
+@app.get("/api/webhook/stats")
+async def webhook_stats():
+    return await asyncio.to_thread(coalescer_stats)
+
+def coalescer_stats() -> dict:
+    # Seen deliveries and file diffs live in the job queue, so every worker reports the same counts.
+    seen = job_queue.stats()["seen"]
+    return {**coalescer.stats(), "seen_deliveries": seen.get("delivery", 0), "seen_file_diffs": seen.get("file_diff", 0)}
+
+# --- Diff Filter Stats Endpoint ---
+@app.get("/api/diff/stats")
+async def diff_filter_stats():
+    return diff_stats()
+
+# --- Embedding Cache Stats Endpoint ---
+@app.get("/api/embeddings/stats")
+async def embeddings_stats():
+    return await asyncio.to_thread(embedding_cache_stats)
+
+# --- Vector Store Namespaces Endpoint ---
+@app.get("/api/vector/stats")
+async def vector_stats():
+    return await asyncio.to_thread(vector_store_stats)
+
+# --- LLM Rate Limiter Stats Endpoint ---
+@app.get("/api/llm/stats")
+async def llm_stats():
+    return get_rate_limiter().stats()
+
+# --- Knowledge Base Store Stats Endpoint ---
+@app.get("/api/kb/stats")
+async def kb_stats():
+    return await asyncio.to_thread(lambda: get_kb_store().stats())
+
+# --- Prometheus Metrics Endpoint ---
+# Stage/LLM/retrieval/webhook histograms and counters, plus every stats endpoint above as gauges.
+REGISTRY.register_collector("docsmith_warmup", agent_logic.warmup.status, "Background warm-up")
+REGISTRY.register_collector("docsmith_job_queue", job_queue.stats, "Durable job queue")
+REGISTRY.register_collector("docsmith_webhook_coalescer", coalescer_stats, "Webhook coalescer")
+REGISTRY.register_collector("docsmith_diff_filter", diff_stats, "Diff filter")
+REGISTRY.register_collector("docsmith_embedding_cache", embedding_cache_stats, "Embedding cache")
+REGISTRY.register_collector("docsmith_vector_stores", vector_store_stats, "Loaded vector-store namespaces")
+REGISTRY.register_collector("docsmith_llm_cache", lambda: get_llm_cache().stats() if LLM_CACHE_ENABLED else {}, "LLM response cache")
+REGISTRY.register_collector("docsmith_llm_rate_limiter", lambda: get_rate_limiter().stats(), "LLM rate limiter")
+REGISTRY.register_collector("docsmith_kb_store", lambda: get_kb_store().stats(), "Knowledge-base store")
+REGISTRY.register_collector("docsmith_sse", event_bus.stats, "SSE event bus")
+
+@app.get("/metrics")
+async def metrics():
+    # Collectors read SQLite-backed stats, so render off the event loop.
+    return Response(content=await asyncio.to_thread(REGISTRY.render), media_type=CONTENT_TYPE)
+
 # --- 1. The "Live Feed" Endpoint (for React) ---
 @app.get("/api/stream/logs")
-async def stream_logs(request: Request):
+async def stream_logs(request: Request, last_event_id: str = Header(None)):
+    # Reconnecting browsers send Last-Event-ID; replay whatever they missed.
+    subscriber = event_bus.subscribe(last_event_id)
+
     async def event_generator():
-        while True:
-            if await request.is_disconnected():
-                print("Client disconnected.")
-                break
-            message = await log_queue.get()
-            yield message
+        try:
+            while True:
+                if await request.is_disconnected():
+                    print("Client disconnected.")
+                    break
+                for message in await subscriber.get():
+                    yield message
+        finally:
+            event_bus.unsubscribe(subscriber)
             
     return EventSourceResponse(event_generator())
 
@@ -74,8 +237,25 @@ async def handle_github_webhook(
     request: Request, 
     x_github_event: str = Header(None),
     x_hub_signature_256: str = Header(None),
+    x_github_delivery: str = Header(None),
     content_type: str = Header(None),
 ):
+    # Time every delivery and count it by event type and outcome (ok / error / rejected_<status>).
+    event = x_github_event or "unknown"
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        response = await _handle_github_webhook(request, x_github_event, x_hub_signature_256, x_github_delivery, content_type)
+        outcome = response.get("status", "ok")
+        return response
+    except HTTPException as e:
+        outcome = f"rejected_{e.status_code}"
+        raise
+    finally:
+        WEBHOOK_REQUESTS.inc(event=event, outcome=outcome)
+        WEBHOOK_SECONDS.observe(time.perf_counter() - start, event=event)
+
+async def _handle_github_webhook(request: Request, x_github_event: str, x_hub_signature_256: str, x_github_delivery: str, content_type: str) -> dict:
     raw_body = await request.body()
     
     if content_type != "application/json":
@@ -102,6 +282,13 @@ async def handle_github_webhook(
         print("ERROR: Webhook signature mismatch.")
         raise HTTPException(status_code=403, detail="Invalid webhook signature.")
 
+    # --- FEATURE: DROP REDELIVERIES ---
+    # GitHub reuses the X-GitHub-Delivery ID when an event is redelivered. The IDs of queued
+    # events are kept in the job queue, so a redelivery is caught whichever worker receives it.
+    if x_github_delivery and await job_queue.is_seen("delivery", x_github_delivery):
+        await push_log("log-skip", f"Ignoring duplicate delivery {x_github_delivery}.")
+        return {"status": "ok", "message": "Duplicate delivery ignored."}
+
     # FIX: Parse the raw body that was already read, instead of reading the stream again.
     try:
         payload = json.loads(raw_body)
@@ -124,6 +311,8 @@ async def handle_github_webhook(
         pr_number = payload.get("pull_request", {}).get("number")
         user_name = payload.get("pull_request", {}).get("user", {}).get("login", "unknown-user")
         diff_url = payload.get("pull_request", {}).get("diff_url")
+        # Key by the base branch so the merge's own push to that branch coalesces with it.
+        base_branch = payload.get("pull_request", {}).get("base", {}).get("ref", "unknown")
 
         if not diff_url:
             await push_log("log-error", "Failed to get diff_url from payload.")
@@ -132,28 +321,23 @@ async def handle_github_webhook(
         await push_log("log-trigger", f"PR Merged: '{pr_title}'. Agent is starting...")
 
         try:
-            headers = {
-                "Authorization": f"token {GITHUB_API_TOKEN}",
-                "Accept": "application/vnd.github.v3.diff"
-            }
-            git_diff_response = requests.get(diff_url, headers=headers)
-            git_diff_response.raise_for_status()
-            git_diff = git_diff_response.text
-            
-            asyncio.create_task(
-                agent_logic.run_agent_analysis(
-                    logger=logger,
-                    broadcaster=push_log,
-                    git_diff=git_diff,
-                    pr_title=f"PR #{pr_number}: {pr_title}", # Provide more context
-                    repo_name=repo_name,
-                    pr_number=pr_number,
-                    user_name=user_name
-                )
-            )
+            diff = await fetch_git_diff(diff_url)
         except Exception as e:
             print(f"Error fetching diff: {e}")
             await push_log("log-error", f"Failed to fetch diff from GitHub: {e}")
+            return {"status": "error", "message": "Failed to fetch diff"}
+        if not diff.concise_diff:
+            await push_log("log-skip", f"No functional code changes in PR #{pr_number} ({diff.summary.skip_summary()}).")
+            return {"status": "ok", "message": "Only trivial or ignored changes."}
+
+        await queue_agent_run(
+            key=(repo_name, base_branch),
+            delivery_id=x_github_delivery,
+            files=diff.summary.relevant,
+            pr_title=f"PR #{pr_number}: {pr_title}", # Provide more context
+            pr_number=pr_number,
+            user_name=user_name
+        )
 
     # --- NEW: Logic to handle PUSH events ---
     elif x_github_event == "push":
@@ -191,29 +375,24 @@ async def handle_github_webhook(
         try:
             # The diff URL for a push is the compare URL with .diff appended
             diff_url = f"{compare_url}.diff"
-            headers = {
-                "Authorization": f"token {GITHUB_API_TOKEN}",
-                "Accept": "application/vnd.github.v3.diff"
-            }
-            git_diff_response = requests.get(diff_url, headers=headers)
-            git_diff_response.raise_for_status()
-            git_diff = git_diff_response.text
-
-            # Start the agent analysis in the background
-            asyncio.create_task(
-                agent_logic.run_agent_analysis(
-                    logger=logger,
-                    broadcaster=push_log,
-                    git_diff=git_diff,
-                    pr_title=f"Push to {branch}: {push_title}", # Title for the log
-                    repo_name=repo_name,
-                    pr_number=push_id, # Use commit hash as a unique identifier
-                    user_name=pusher_name
-                )
-            )
+            diff = await fetch_git_diff(diff_url)
         except Exception as e:
             print(f"Error fetching diff for push: {e}")
             await push_log("log-error", f"Failed to fetch diff from GitHub for push: {e}")
+            return {"status": "error", "message": "Failed to fetch diff"}
+        if not diff.concise_diff:
+            await push_log("log-skip", f"No functional code changes in push to '{branch}' ({diff.summary.skip_summary()}).")
+            return {"status": "ok", "message": "Only trivial or ignored changes."}
+
+        # Coalesce with other recent events on this branch in the job queue
+        await queue_agent_run(
+            key=(repo_name, branch),
+            delivery_id=x_github_delivery,
+            files=diff.summary.relevant,
+            pr_title=f"Push to {branch}: {push_title}", # Title for the log
+            pr_number=push_id, # Use commit hash as a unique identifier
+            user_name=pusher_name
+        )
 
     return {"status": "ok"}
 
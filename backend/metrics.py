@@ -0,0 +1,243 @@
+import re
+import time
+import bisect
+import threading
+import contextlib
+
+# --- Configuration ---
+# Upper bounds (seconds) for latency histograms: from a cached lookup to a slow LLM call.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class: a named family of samples keyed by label values."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def remove(self, **labels):
+        """Drops the sample for `labels` (e.g. for a namespace that is no longer loaded)."""
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self) -> list:
+        with self._lock:
+            samples = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in samples]
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that can go up and down."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextlib.contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """
+    Observations counted into cumulative buckets, plus their sum and count, so
+    quantiles (p50, p99) can be computed server-side with histogram_quantile().
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)  # the last slot is +Inf
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observes the wall-clock duration of the `with` block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        with self._lock:
+            samples = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self._header()
+        for key, (counts, total) in samples:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = key + (("le", _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Holds every metric plus "collectors": callables run at scrape time that turn an
+    existing stats() dict into gauges, so components don't have to be instrumented twice.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def register_collector(self, prefix: str, stats_fn, documentation: str = ""):
+        """`stats_fn()` returns a (possibly nested) dict; numeric leaves become `<prefix>_<key>` gauges."""
+        with self._lock:
+            self._collectors.append((prefix, stats_fn, documentation))
+
+    def _collect(self, prefix: str, stats_fn, documentation: str) -> list:
+        try:
+            stats = stats_fn() or {}
+        except Exception as e:
+            return [f"# Collector {prefix} failed: {_escape(e)}"]
+        lines = []
+        for key, value in _flatten(stats):
+            name = _NAME_RE.sub("_", f"{prefix}_{key}")
+            lines += [f"# HELP {name} {documentation or prefix} ({key})", f"# TYPE {name} gauge",
+                      f"{name} {_format_value(value)}"]
+        return lines
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        for collector in collectors:
+            lines += self._collect(*collector)
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(stats: dict, parent: str = ""):
+    for key, value in stats.items():
+        name = f"{parent}_{key}" if parent else str(key)
+        if isinstance(value, dict):
+            yield from _flatten(value, name)
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+REGISTRY = Registry()
+
+# --- Agent Metrics ---
+# Defined here so every module records into the same families.
+
+AGENT_RUNS = Counter(
+    "docsmith_agent_runs_total", "Agent runs by outcome.", ("outcome",))
+AGENT_RUN_SECONDS = Histogram(
+    "docsmith_agent_run_duration_seconds", "End-to-end duration of an agent run.", ("outcome",))
+AGENT_RUNS_IN_FLIGHT = Gauge(
+    "docsmith_agent_runs_in_flight", "Agent runs currently executing.")
+STAGE_SECONDS = Histogram(
+    "docsmith_stage_duration_seconds", "Duration of each pipeline stage.", ("stage",))
+STAGE_SKIPS = Counter(
+    "docsmith_stage_skipped_total", "Pipeline stages skipped (e.g. by the trivial-change gate).", ("stage",))
+
+LLM_REQUESTS = Counter(
+    "docsmith_llm_requests_total", "Model calls per chain by outcome.", ("chain", "outcome"))
+LLM_REQUEST_SECONDS = Histogram(
+    "docsmith_llm_request_duration_seconds", "Model call latency per chain, excluding rate-limiter wait.", ("chain",))
+LLM_PROMPT_TOKENS = Counter(
+    "docsmith_llm_prompt_tokens_total", "Prompt tokens sent per chain.", ("chain",))
+LLM_COMPLETION_TOKENS = Counter(
+    "docsmith_llm_completion_tokens_total", "Completion tokens received per chain.", ("chain",))
+
+RETRIEVAL_K = Histogram(
+    "docsmith_retrieval_results", "Documents returned per retrieval.", buckets=(0, 1, 2, 3, 5, 10, 20, 50))
+RETRIEVAL_SCORE = Histogram(
+    "docsmith_retrieval_score", "Relevance scores of retrieved documents (top = best per query).", ("rank",),
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+
+VECTOR_STORE_SECONDS = Histogram(
+    "docsmith_vector_store_operation_duration_seconds", "Duration of vector-store operations.", ("operation",))
+VECTOR_STORE_CHUNKS = Gauge(
+    "docsmith_vector_store_chunks", "Chunks in each loaded vector index, by namespace.", ("namespace",))
+
+WEBHOOK_REQUESTS = Counter(
+    "docsmith_webhook_requests_total", "GitHub webhooks received, by event and outcome.", ("event", "outcome"))
+WEBHOOK_SECONDS = Histogram(
+    "docsmith_webhook_duration_seconds", "Time to handle a GitHub webhook (diff fetch and enqueue).", ("event",))
@@ -0,0 +1,88 @@
+import os
+from contextlib import contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-worker mode only
+    fcntl = None
+
+# --- Configuration ---
+# Set when several server processes share this backend directory (e.g. `gunicorn -w 4`).
+# Dashboard events then go through a shared bus (event_bus.SharedEventBus), each FAISS index
+# is written by one elected worker and followed by the others (vector_store), and KB store
+# appends are serialized across processes (kb_store).
+MULTI_WORKER = os.getenv("MULTI_WORKER", "false").lower() == "true"
+
+if MULTI_WORKER and fcntl is None:
+    raise RuntimeError("MULTI_WORKER needs POSIX file locks (fcntl), which this platform does not have.")
+
+
+class FileLock:
+    """
+    An advisory lock (flock) on a file, shared by every process that opens the same path.
+
+    `try_acquire()` takes the lock exclusively and keeps it until `release()` (or process exit,
+    when the OS drops it), which is how a single writer is elected. `exclusive()` and `shared()`
+    hold it for a `with` block. Each call opens its own descriptor, so threads of one process
+    exclude each other too, but a process must not block on a lock it holds via `try_acquire()`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def _open(self) -> int:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """Takes the lock without waiting. Returns True if this process now holds it."""
+        if self._fd is not None:
+            return True
+        fd = self._open()
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        # The holder's PID, for whoever wonders which worker is the writer.
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    @contextmanager
+    def _hold(self, operation: int):
+        fd = self._open()
+        try:
+            fcntl.flock(fd, operation)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def exclusive(self):
+        return self._hold(fcntl.LOCK_EX)
+
+    def shared(self):
+        return self._hold(fcntl.LOCK_SH)
+
+
+def exclusive_lock(path: str):
+    """An exclusive FileLock on `path` for a `with` block in multi-worker mode, otherwise a no-op."""
+    return FileLock(path).exclusive() if MULTI_WORKER else nullcontext()
+
+
+def shared_lock(path: str):
+    """A shared FileLock on `path` for a `with` block in multi-worker mode, otherwise a no-op."""
+    return FileLock(path).shared() if MULTI_WORKER else nullcontext()
@@ -0,0 +1,85 @@
+import time
+import asyncio
+
+
+class SkipStage(Exception):
+    """Raised by a stage to skip itself and every stage that depends on it."""
+
+
+class StageGraph:
+    """
+    A small dependency graph of async pipeline stages.
+
+    Each stage starts as soon as all of its dependencies have finished and receives
+    their results as positional arguments, so independent stages run concurrently.
+    Wall-clock time is recorded per stage. With `cancel_on_error`, the first stage error
+    cancels the stages still pending or running; without it, stages that don't depend on
+    the failed one run to completion.
+    """
+
+    def __init__(self, cancel_on_error: bool = True):
+        self.cancel_on_error = cancel_on_error
+        self._stages = {}  # name -> (coroutine function, dependency names)
+        self.timings = {}
+        self.skipped = []
+        self.cancelled = []
+
+    def stage(self, name: str, deps: tuple = ()):
+        """Decorator that registers a stage. Dependencies must be registered first."""
+        def register(fn):
+            missing = [dep for dep in deps if dep not in self._stages]
+            if missing:
+                raise ValueError(f"Stage '{name}' depends on unknown stages: {missing}")
+            self._stages[name] = (fn, tuple(deps))
+            return fn
+        return register
+
+    async def _run_stage(self, tasks: dict, name: str, fn, deps: tuple):
+        # Awaiting a dependency re-raises its SkipStage or error, which skips this stage too.
+        inputs = [await tasks[dep] for dep in deps]
+        start = time.perf_counter()
+        try:
+            return await fn(*inputs)
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    async def run(self) -> dict:
+        """
+        Runs every stage and returns the results by name. Re-raises the first stage error.
+        Stages cancelled because of it are listed in `cancelled`, so no stage with side
+        effects runs on ahead of a failure the caller will retry.
+        """
+        tasks = {}
+        for name, (fn, deps) in self._stages.items():
+            tasks[name] = asyncio.create_task(self._run_stage(tasks, name, fn, deps))
+
+        pending, first_error = set(tasks.values()), None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = None if task.cancelled() else task.exception()
+                    if error is not None and not isinstance(error, SkipStage) and first_error is None:
+                        first_error = error
+                        if self.cancel_on_error:
+                            for other in pending:
+                                other.cancel()
+        finally:
+            # Also when run() itself is cancelled: no stage outlives the graph.
+            for task in pending:
+                task.cancel()
+
+        results = {}
+        for name, task in tasks.items():
+            if task.cancelled():
+                self.cancelled.append(name)
+            elif isinstance(task.exception(), SkipStage):
+                self.skipped.append(name)
+            elif task.exception() is None:
+                results[name] = task.result()
+        if first_error is not None:
+            raise first_error
+        return results
+
+    def format_timings(self) -> str:
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
@@ -0,0 +1,461 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import threading
+import itertools
+from collections import Counter
+
+# --- Configuration ---
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 15))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", 250000))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", 1))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", 1.0))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", 60.0))
+LLM_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", 1000))
+
+# Lower runs first.
+PRIORITY_HIGH = 0     # analyzer: on the webhook's critical path
+PRIORITY_NORMAL = 1   # rewriter, creator, and the summarizer (dashboard only)
+PRIORITY_BULK = 2     # knowledge seeding and other background work
+
+# Rough average for code and English with Gemini's tokenizer (same as diff_budget).
+CHARS_PER_TOKEN = 4
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_request_tokens(inputs) -> int:
+    """Estimates prompt tokens from the chain inputs, plus an allowance for the response."""
+    if isinstance(inputs, dict):
+        chars = sum(len(str(value)) for value in inputs.values())
+    else:
+        chars = len(str(inputs))
+    return chars // CHARS_PER_TOKEN + LLM_OUTPUT_TOKEN_ESTIMATE
+
+
+def _status_code(error: Exception):
+    for attr in ("status_code", "code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    cause = error.__cause__ or error.__context__
+    return _status_code(cause) if isinstance(cause, Exception) and cause is not error else None
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    text = str(error)
+    return _status_code(error) == 429 or "429" in text or "RESOURCE_EXHAUSTED" in text or "rate limit" in text.lower()
+
+
+def is_timeout_error(error: Exception) -> bool:
+    text = str(error).lower()
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "timed out" in text or "deadline" in text
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """429s, timeouts and 5xx responses are worth retrying; anything else is not."""
+    status = _status_code(error)
+    if is_rate_limit_error(error) or is_timeout_error(error):
+        return True
+    return (status is not None and 500 <= status < 600) or "UNAVAILABLE" in str(error)
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at `per_minute` tokens per minute. Not thread-safe."""
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def available(self, now: float) -> float:
+        return min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+
+    def drain(self, now: float):
+        """Empties the bucket, e.g. after the server reported a rate limit."""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _Waiter:
+    """A queued request. `wake()` may be called from any thread."""
+
+    def __init__(self, priority: int, seq: int, tokens: int, loop=None):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.loop = loop
+        self.event = asyncio.Event() if loop is not None else threading.Event()
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wake(self):
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.event.set)
+            except RuntimeError:
+                pass  # its event loop has already closed
+        else:
+            self.event.set()
+
+
+class AdaptiveRateLimiter:
+    """
+    A client-side scheduler for LLM calls, shared by every chain.
+
+    A call is admitted when it is the highest-priority waiter (FIFO within a priority),
+    fewer than `limit` calls are in flight, and both the requests-per-minute and
+    tokens-per-minute buckets can cover it. The concurrency limit is adjusted AIMD-style:
+    it grows by about one per `limit` successful calls and halves on a 429 or timeout
+    (at most once per congestion window: errors from calls admitted before the last
+    decrease don't count again), within [LLM_MIN_CONCURRENCY, LLM_MAX_CONCURRENCY].
+
+    `call`/`acall` run a function under the limiter and retry retryable errors with
+    full-jitter exponential backoff. Both sync and async callers share the same state.
+    """
+
+    def __init__(self, requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, min_concurrency: int = LLM_MIN_CONCURRENCY,
+                 max_retries: int = LLM_MAX_RETRIES, retry_base_seconds: float = LLM_RETRY_BASE_SECONDS,
+                 retry_max_seconds: float = LLM_RETRY_MAX_SECONDS):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+        self._counters = Counter()
+        self._wait_seconds = Counter()
+
+    # --- Admission ---
+
+    def _try_admit(self, waiter: _Waiter) -> float:
+        """Admits `waiter` if possible. Returns 0 if admitted, else how long to wait before retrying."""
+        with self._lock:
+            now = time.monotonic()
+            if self._waiters[0] is not waiter or self.in_flight >= int(self.limit):
+                return 1.0  # woken early by release() or when it reaches the head
+            delay = max(self.requests.wait_time(1, now), self.tokens.wait_time(waiter.tokens, now))
+            if delay > 0:
+                return delay
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            self._wait_seconds[waiter.priority] += now - waiter.enqueued
+            self._counters[f"admitted_p{waiter.priority}"] += 1
+            head = self._waiters[0] if self._waiters else None
+        if head is not None:
+            head.wake()
+        return 0.0
+
+    def _enqueue(self, priority: int, tokens: int, loop=None) -> _Waiter:
+        with self._lock:
+            waiter = _Waiter(priority, next(self._seq), tokens, loop)
+            heapq.heappush(self._waiters, waiter)
+            return waiter
+
+    def _abandon(self, waiter: _Waiter):
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+            head = self._waiters[0] if self._waiters else None
+        if head is not None:
+            head.wake()
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, tokens: int = 0) -> float:
+        """Blocks until the call is admitted. Returns the admission time, to pass to release()."""
+        waiter = self._enqueue(priority, tokens)
+        try:
+            while True:
+                delay = self._try_admit(waiter)
+                if delay == 0:
+                    return time.monotonic()
+                waiter.event.wait(timeout=delay)
+                waiter.event.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    async def aacquire(self, priority: int = PRIORITY_NORMAL, tokens: int = 0) -> float:
+        waiter = self._enqueue(priority, tokens, asyncio.get_running_loop())
+        try:
+            while True:
+                delay = self._try_admit(waiter)
+                if delay == 0:
+                    return time.monotonic()
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                waiter.event.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    def release(self, admitted_at: float, error: Exception = None):
+        """Ends a call and feeds its outcome into the concurrency controller."""
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if error is None:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+            elif is_rate_limit_error(error) or is_timeout_error(error):
+                if is_rate_limit_error(error):
+                    self._counters["rate_limited"] += 1
+                    self.requests.drain(now)
+                else:
+                    self._counters["timeouts"] += 1
+                if admitted_at >= self._last_decrease:
+                    previous = int(self.limit)
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._last_decrease = now
+                    if int(self.limit) != previous:
+                        logger.warning(f"LLM backpressure ({type(error).__name__}); concurrency limit is now {int(self.limit)}.")
+            head = self._waiters[0] if self._waiters else None
+        if head is not None:
+            head.wake()
+
+    # --- Calls with retries ---
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+
+    def call(self, fn, *args, priority: int = PRIORITY_NORMAL, tokens: int = 0, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            admitted_at = self.acquire(priority, tokens)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.release(admitted_at, e)
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    self._counters["failed"] += 1
+                    raise
+                self._counters["retries"] += 1
+                time.sleep(self._backoff(attempt))
+                continue
+            self.release(admitted_at)
+            self._counters["succeeded"] += 1
+            return result
+
+    async def acall(self, fn, *args, priority: int = PRIORITY_NORMAL, tokens: int = 0, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            admitted_at = await self.aacquire(priority, tokens)
+            try:
+                result = await fn(*args, **kwargs)
+            except asyncio.CancelledError:
+                self.release(admitted_at)
+                raise
+            except Exception as e:
+                self.release(admitted_at, e)
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    self._counters["failed"] += 1
+                    raise
+                self._counters["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            self.release(admitted_at)
+            self._counters["succeeded"] += 1
+            return result
+
+    async def astream(self, fn, *args, priority: int = PRIORITY_NORMAL, tokens: int = 0, **kwargs):
+        """
+        Like acall() for a function returning an async iterator, yielding its chunks. The call
+        holds its slot until the stream ends. Errors are only retried before the first chunk,
+        since the caller has already used anything yielded after it.
+        """
+        for attempt in range(self.max_retries + 1):
+            admitted_at = await self.aacquire(priority, tokens)
+            started = False
+            try:
+                async for chunk in fn(*args, **kwargs):
+                    started = True
+                    yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                self.release(admitted_at)
+                raise
+            except Exception as e:
+                self.release(admitted_at, e)
+                if started or attempt >= self.max_retries or not is_retryable_error(e):
+                    self._counters["failed"] += 1
+                    raise
+                self._counters["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            self.release(admitted_at)
+            self._counters["succeeded"] += 1
+            return
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            admitted = {key: count for key, count in self._counters.items() if key.startswith("admitted_p")}
+            return {
+                **self._counters,
+                "concurrency_limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                "requests_available": round(self.requests.available(now), 1),
+                "tokens_available": int(self.tokens.available(now)),
+                "avg_wait_seconds": {
+                    f"p{priority}": round(seconds / admitted[f"admitted_p{priority}"], 3)
+                    for priority, seconds in self._wait_seconds.items()
+                },
+            }
+
+
+class RateLimitedChain:
+    """Runs a chain's invoke/ainvoke/astream through an AdaptiveRateLimiter at a fixed priority."""
+
+    def __init__(self, name: str, chain, limiter: AdaptiveRateLimiter, priority: int = PRIORITY_NORMAL):
+        self.name = name
+        self.chain = chain
+        self.limiter = limiter
+        self.priority = priority
+
+    def invoke(self, inputs, *args, **kwargs):
+        return self.limiter.call(self.chain.invoke, inputs, *args, priority=self.priority,
+                                 tokens=estimate_request_tokens(inputs), **kwargs)
+
+    async def ainvoke(self, inputs, *args, **kwargs):
+        return await self.limiter.acall(self.chain.ainvoke, inputs, *args, priority=self.priority,
+                                        tokens=estimate_request_tokens(inputs), **kwargs)
+
+    def astream(self, inputs, *args, **kwargs):
+        return self.limiter.astream(self.chain.astream, inputs, *args, priority=self.priority,
+                                    tokens=estimate_request_tokens(inputs), **kwargs)
+
+
+# --- Self-Test ---
+if __name__ == "__main__":
+    """
+    Drives the limiter with a stub chain that answers 429 a set number of times, and
+    checks retries with backoff, the AIMD concurrency limit and priority ordering.
+    No LLM is called.
+
+    Usage:
+      python rate_limiter.py
+    """
+
+    class RateLimited(Exception):
+        status_code = 429
+
+    class StubChain:
+        """Fails its first `failures` calls with a 429, then returns its input."""
+
+        def __init__(self, failures: int = 0, latency: float = 0.0, log: list = None):
+            self.failures = failures
+            self.latency = latency
+            self.log = log
+            self.calls = []
+
+        async def ainvoke(self, inputs, *args, **kwargs):
+            self.calls.append(time.monotonic())
+            await asyncio.sleep(self.latency)
+            if len(self.calls) <= self.failures:
+                raise RateLimited("429 RESOURCE_EXHAUSTED")
+            if self.log is not None:
+                self.log.append(inputs)
+            return inputs
+
+    def fast_limiter(**kwargs) -> AdaptiveRateLimiter:
+        # Buckets large enough that only concurrency and retries shape the schedule.
+        return AdaptiveRateLimiter(requests_per_minute=60000, tokens_per_minute=1e9, **kwargs)
+
+    async def check_backoff():
+        limiter = fast_limiter(max_retries=5, retry_base_seconds=0.02, retry_max_seconds=0.05)
+        delays = []
+        backoff = limiter._backoff
+        limiter._backoff = lambda attempt: delays.append((attempt, backoff(attempt))) or delays[-1][1]
+        stub = StubChain(failures=3)
+        assert await RateLimitedChain("stub", stub, limiter).ainvoke("ok") == "ok"
+        assert len(stub.calls) == 4, stub.calls
+        assert [attempt for attempt, _ in delays] == [0, 1, 2], delays
+        for (attempt, delay), before, after in zip(delays, stub.calls, stub.calls[1:]):
+            assert 0 <= delay <= min(0.05, 0.02 * 2 ** attempt), (attempt, delay)
+            assert after - before >= delay, (attempt, delay, after - before)
+        stats = limiter.stats()
+        assert stats["retries"] == 3 and stats["rate_limited"] == 3 and stats["succeeded"] == 1, stats
+        print(f"✅ 3 x 429 retried with backoff {[round(delay, 3) for _, delay in delays]}s, then succeeded.")
+
+        stub = StubChain(failures=10)
+        try:
+            await RateLimitedChain("stub", stub, limiter).ainvoke("ok")
+            raise AssertionError("expected the last 429 to be raised")
+        except RateLimited:
+            pass
+        assert len(stub.calls) == limiter.max_retries + 1, stub.calls
+        print(f"✅ Gave up after {len(stub.calls)} attempts.")
+
+    async def check_aimd():
+        limiter = fast_limiter(max_concurrency=8, min_concurrency=1, max_retries=0)
+        # Four calls in flight together all hit a 429: one congestion event, one halving.
+        chain = RateLimitedChain("stub", StubChain(failures=4, latency=0.05), limiter)
+        results = await asyncio.gather(*(chain.ainvoke(i) for i in range(4)), return_exceptions=True)
+        assert all(isinstance(r, RateLimited) for r in results), results
+        assert int(limiter.limit) == 4, limiter.limit
+        # A 429 from a call admitted after that decrease halves it again.
+        await asyncio.gather(RateLimitedChain("stub", StubChain(failures=1), limiter).ainvoke(0), return_exceptions=True)
+        assert int(limiter.limit) == 2, limiter.limit
+        # Successes grow it back additively: about one per `limit` calls.
+        chain = RateLimitedChain("stub", StubChain(), limiter)
+        for i in range(6):
+            await chain.ainvoke(i)
+        assert 3 <= int(limiter.limit) < 8, limiter.limit
+        print(f"✅ Concurrency limit 8 -> 4 -> 2 on 429s, back to {int(limiter.limit)} after 6 successes.")
+
+    async def check_priority():
+        limiter = fast_limiter(max_concurrency=1, min_concurrency=1)
+        order = []
+        # Hold the only slot so every call below queues, then release it.
+        admitted_at = await limiter.aacquire()
+        calls = [RateLimitedChain(name, StubChain(log=order), limiter, priority).ainvoke(name)
+                 for name, priority in (("bulk", PRIORITY_BULK), ("normal-1", PRIORITY_NORMAL),
+                                        ("high", PRIORITY_HIGH), ("normal-2", PRIORITY_NORMAL))]
+        tasks = [asyncio.create_task(call) for call in calls]
+        await asyncio.sleep(0.05)
+        assert not order and limiter.stats()["waiting"] == 4, order
+        limiter.release(admitted_at)
+        await asyncio.gather(*tasks)
+        assert order == ["high", "normal-1", "normal-2", "bulk"], order
+        print(f"✅ Queued calls ran by priority, FIFO within one: {order}")
+
+    async def main():
+        await check_backoff()
+        await check_aimd()
+        await check_priority()
+        print("✅ All rate limiter checks passed.")
+
+    asyncio.run(main())
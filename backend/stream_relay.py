@@ -0,0 +1,51 @@
+import os
+import json
+import time
+import uuid
+
+# --- Configuration ---
+# Streamed LLM output reaches the dashboard at most this often; chunks in between are merged.
+STREAM_FLUSH_SECONDS = float(os.getenv("STREAM_FLUSH_SECONDS", 0.25))
+
+
+def _chunk_text(chunk) -> str:
+    # Chains ending in StrOutputParser yield strings, bare models yield message chunks.
+    return chunk if isinstance(chunk, str) else str(getattr(chunk, "content", chunk))
+
+
+async def relay_stream(chunks, broadcaster, label: str, flush_seconds: float = STREAM_FLUSH_SECONDS) -> str:
+    """
+    Forwards an async stream of LLM output to the dashboard as "log-delta" events and
+    returns the assembled text.
+
+    The first chunk is sent as soon as it arrives, so the dashboard shows output after
+    the model's first-token latency. Later chunks are merged and sent at most once per
+    `flush_seconds`, which keeps the event count (and the replay history it fills) small
+    for long documents. Each event's data is JSON: the stream's `id` and `label`, the new
+    `text`, and `done` on the last one.
+    """
+    stream_id = uuid.uuid4().hex[:12]
+    parts, pending = [], []
+    last_flush = None
+
+    async def flush(done: bool = False):
+        nonlocal last_flush
+        text = "".join(pending)
+        pending.clear()
+        last_flush = time.monotonic()
+        await broadcaster("log-delta", json.dumps({"id": stream_id, "label": label, "text": text, "done": done}))
+
+    try:
+        async for chunk in chunks:
+            text = _chunk_text(chunk)
+            if not text:
+                continue
+            parts.append(text)
+            pending.append(text)
+            if last_flush is None or time.monotonic() - last_flush >= flush_seconds:
+                await flush()
+    finally:
+        # Also closes the dashboard's draft if the stream failed part-way.
+        if last_flush is not None:
+            await flush(done=True)
+    return "".join(parts)
@@ -0,0 +1,104 @@
+import re
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*")
+_BACKTICK_RE = re.compile(r"`([^`\n]+)`")
+_CALL_RE = re.compile(r"([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+_DEFINITION_RE = re.compile(r"^\s*(?:export\s+)?(?:async\s+)?(?:def|class|function|func)\s+([A-Za-z_][A-Za-z0-9_]*)")
+_HUNK_CONTEXT_RE = re.compile(r"^@@ [^@]* @@\s?(.*)$")
+DOC_EXTENSIONS = (".md", ".mdx", ".rst", ".txt")
+
+
+def _looks_like_code(name: str) -> bool:
+    """snake_case, camelCase and dunder names; plain words are left to the lexical index."""
+    return "_" in name.strip("_") or name.startswith("__") or any(
+        a.islower() and b.isupper() for a, b in zip(name, name[1:])
+    )
+
+
+def _add_dotted(names: set, dotted: str):
+    names.add(dotted)
+    for part in dotted.split("."):
+        names.add(part)
+
+
+def mentioned_symbols(text: str) -> set:
+    """
+    Names a piece of documentation refers to as code: anything in backticks, anything
+    written as a call (`name(`), and snake_case / camelCase identifiers. Dotted names
+    (`Class.method`) are recorded whole and per part.
+    """
+    names = set()
+    for quoted in _BACKTICK_RE.findall(text):
+        for dotted in _IDENTIFIER_RE.findall(quoted):
+            if len(dotted) > 2:
+                _add_dotted(names, dotted)
+    for called in _CALL_RE.findall(text):
+        if len(called) > 2:
+            names.add(called)
+    for dotted in _IDENTIFIER_RE.findall(text):
+        if _looks_like_code(dotted.rsplit(".", 1)[-1]):
+            _add_dotted(names, dotted)
+    return names
+
+
+def symbols_in_diff(files: list) -> list:
+    """
+    The functions and classes a diff touches: definitions on changed lines, plus the
+    enclosing definition git reports in each hunk header (`@@ ... @@ def name(`).
+    `files` are parsed FileDiff objects. Returns names in first-seen order.
+    """
+    seen = {}
+    for file_diff in files:
+        for hunk in file_diff.hunks:
+            context = _HUNK_CONTEXT_RE.match(hunk.header)
+            if context:
+                match = _DEFINITION_RE.match(context.group(1))
+                if match:
+                    seen.setdefault(match.group(1))
+            for tag, text in hunk.lines:
+                if tag != " ":
+                    match = _DEFINITION_RE.match(text)
+                    if match:
+                        seen.setdefault(match.group(1))
+    return list(seen)
+
+
+class SymbolIndex:
+    """
+    A reverse index from code symbol names to the documentation chunks that mention them,
+    so docs about a changed function are found by dictionary lookup, without an embedding
+    query. Only chunks from documentation sources are indexed. Not thread-safe: the caller
+    serializes access.
+    """
+
+    def __init__(self):
+        self._docs_by_symbol = {}  # symbol -> {doc_id: None}, in insertion order
+        self._symbols_by_doc = {}
+
+    def add(self, doc_id: str, document):
+        if not str(document.metadata.get("source", "")).lower().endswith(DOC_EXTENSIONS):
+            return
+        self.remove(doc_id)
+        symbols = mentioned_symbols(document.page_content)
+        for symbol in symbols:
+            self._docs_by_symbol.setdefault(symbol, {})[doc_id] = None
+        self._symbols_by_doc[doc_id] = tuple(symbols)
+
+    def remove(self, doc_id: str):
+        for symbol in self._symbols_by_doc.pop(doc_id, ()):
+            docs = self._docs_by_symbol[symbol]
+            docs.pop(doc_id, None)
+            if not docs:
+                del self._docs_by_symbol[symbol]
+
+    def lookup(self, symbols: list, limit: int = None) -> list:
+        """Doc chunk IDs mentioning any of `symbols`; chunks naming more of them come first."""
+        hits = {}
+        for symbol in symbols:
+            for doc_id in self._docs_by_symbol.get(symbol, ()):
+                hits[doc_id] = hits.get(doc_id, 0) + 1
+        ranked = sorted(hits, key=hits.get, reverse=True)
+        return ranked[:limit] if limit else ranked
+
+    def stats(self) -> dict:
+        return {"documents": len(self._symbols_by_doc), "symbols": len(self._docs_by_symbol)}
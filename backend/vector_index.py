@@ -0,0 +1,197 @@
+import os
+import math
+import faiss
+import numpy as np
+
+# --- Configuration ---
+# Index layout for the vector store: "flat" (exact, brute force), "ivf_flat", "ivf_pq",
+# "hnsw" or "sq8" (int8 scalar-quantized). Corpora smaller than VECTOR_INDEX_MIN_VECTORS
+# always use a flat index; larger ones are (re)trained into the configured type.
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat").lower()
+VECTOR_INDEX_MIN_VECTORS = int(os.getenv("VECTOR_INDEX_MIN_VECTORS", 20000))
+VECTOR_NPROBE = int(os.getenv("VECTOR_NPROBE", 16))            # IVF lists scanned per query
+VECTOR_EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", 64))      # HNSW candidate list per query
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", 32))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", 80))
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8")
+# k-means wants ~40 points per centroid; more than this many training points adds little.
+TRAINING_POINTS_PER_LIST = 40
+MAX_TRAINING_POINTS = 200_000
+
+if VECTOR_INDEX_TYPE not in INDEX_TYPES:
+    raise ValueError(f"VECTOR_INDEX_TYPE must be one of {', '.join(INDEX_TYPES)}, got '{VECTOR_INDEX_TYPE}'.")
+
+
+def _nlist_for(num_vectors: int) -> int:
+    """Number of IVF lists: ~4*sqrt(n), as a power of two, with enough points to train each."""
+    target = 4 * math.sqrt(max(num_vectors, 1))
+    nlist = 2 ** int(round(math.log2(max(target, 1))))
+    while nlist > 1 and nlist * TRAINING_POINTS_PER_LIST > num_vectors:
+        nlist //= 2
+    return max(nlist, 1)
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """PQ sub-vectors of ~8 dimensions each (m must divide the dimension)."""
+    for m in range(max(dim // 8, 1), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def factory_string(index_type: str, num_vectors: int, dim: int, min_vectors: int = VECTOR_INDEX_MIN_VECTORS) -> str:
+    if index_type == "flat" or num_vectors < min_vectors:
+        return "Flat"
+    if index_type == "ivf_flat":
+        return f"IVF{_nlist_for(num_vectors)},Flat"
+    if index_type == "ivf_pq":
+        return f"IVF{_nlist_for(num_vectors)},PQ{_pq_subquantizers(dim)}"
+    if index_type == "hnsw":
+        return f"HNSW{VECTOR_HNSW_M}"
+    if index_type == "sq8":
+        return "SQ8"
+    raise ValueError(f"Unknown index type '{index_type}'.")
+
+
+def index_type_of(index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq8"
+    ivf = _ivf(index)
+    if ivf is not None:
+        return "ivf_pq" if isinstance(ivf, faiss.IndexIVFPQ) else "ivf_flat"
+    return "flat"
+
+
+def _ivf(index):
+    # extract_index_ivf returns the IndexIVF base class; downcast it so IVF-PQ is recognized.
+    try:
+        return faiss.downcast_index(faiss.extract_index_ivf(index))
+    except RuntimeError:
+        return None
+
+
+def is_ivf(index) -> bool:
+    return _ivf(index) is not None
+
+
+def is_exact_storage(index) -> bool:
+    """True if reconstruct() returns the original vectors (no quantization)."""
+    return index_type_of(index) in ("flat", "ivf_flat", "hnsw")
+
+
+def configure_search(index, nprobe: int = None, ef_search: int = None):
+    """Applies query-time tuning: nprobe for IVF indexes, efSearch for HNSW."""
+    ivf = _ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe or VECTOR_NPROBE, ivf.nlist)
+        # A hashtable direct map allows reconstruct() (MMR, hybrid scoring) and remove_ids() by label.
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or VECTOR_EF_SEARCH
+
+
+def new_index(vectors: np.ndarray, index_type: str = None, num_vectors: int = None,
+              min_vectors: int = VECTOR_INDEX_MIN_VECTORS):
+    """
+    Returns an empty, trained index of the configured type for vectors like `vectors`
+    (also the training sample). `num_vectors` sizes the IVF lists if more vectors follow.
+    Below `min_vectors` the index is flat.
+    """
+    index_type = index_type or VECTOR_INDEX_TYPE
+    num_vectors = num_vectors or len(vectors)
+    dim = vectors.shape[1]
+    factory = factory_string(index_type, num_vectors, dim, min_vectors)
+    index = faiss.IndexFlatL2(dim) if factory == "Flat" else faiss.index_factory(dim, factory, faiss.METRIC_L2)
+    if not index.is_trained:
+        sample = vectors
+        limit = min(MAX_TRAINING_POINTS, max(_nlist_for(num_vectors) * TRAINING_POINTS_PER_LIST * 4, 10_000))
+        if len(sample) > limit:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), limit, replace=False)]
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = VECTOR_HNSW_EF_CONSTRUCTION
+    configure_search(index)
+    return index
+
+
+def read_index(path: str, mmap: bool = True):
+    """
+    Memory-maps the index file: loading takes about as long as opening it, and vectors are
+    paged in as searches touch them. Flat, SQ8 and HNSW indexes copy on the first write;
+    IVF lists stay read-only in the file (see is_read_only). With `mmap=False` the whole
+    index is read into memory.
+    """
+    index = faiss.read_index(path, faiss.IO_FLAG_MMAP if mmap else 0)
+    configure_search(index)
+    return index
+
+
+def is_read_only(index) -> bool:
+    """True for a memory-mapped IVF index, whose on-disk lists cannot be added to or removed from."""
+    ivf = _ivf(index)
+    return ivf is not None and isinstance(faiss.downcast_InvertedLists(ivf.invlists), faiss.OnDiskInvertedLists)
+
+
+def needs_rebuild(index, index_type: str = None) -> bool:
+    """
+    True if the index should be rebuilt: it is not the type configured for its size
+    (e.g. a flat index that has passed VECTOR_INDEX_MIN_VECTORS), or its IVF lists were
+    sized for a corpus a quarter of the current one or smaller. A trained index only
+    falls back to flat once it shrinks below half the threshold, so it doesn't flip-flop.
+    """
+    index_type = index_type or VECTOR_INDEX_TYPE
+    current = index_type_of(index)
+    if current == "flat":
+        return factory_string(index_type, index.ntotal, index.d) != "Flat"
+    if index_type != current or index.ntotal < VECTOR_INDEX_MIN_VECTORS // 2:
+        return True
+    ivf = _ivf(index)
+    return ivf is not None and ivf.nlist * 2 <= _nlist_for(index.ntotal)
+
+
+def estimate_bytes(index) -> int:
+    """Approximate memory of the index's codes and graph/list structure, without serializing it."""
+    n, d = index.ntotal, index.d
+    kind = index_type_of(index)
+    if kind == "sq8":
+        return n * d
+    if kind in ("ivf_flat", "ivf_pq"):
+        return n * (_ivf(index).code_size + 8)  # codes plus a 64-bit ID per entry
+    if kind == "hnsw":
+        return n * (d * 4 + index.hnsw.nb_neighbors(0) * 4)
+    return n * d * 4
+
+
+def describe(index, with_size: bool = False) -> dict:
+    info = {"type": index_type_of(index), "vectors": index.ntotal, "dim": index.d}
+    ivf = _ivf(index)
+    if ivf is not None:
+        info.update(nlist=ivf.nlist, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        info.update(m=index.hnsw.nb_neighbors(1), ef_search=index.hnsw.efSearch)
+    if with_size:  # serializes the whole index, so only on request
+        info["bytes"] = int(faiss.serialize_index(index).nbytes)
+    return info
+
+
+# --- Self-Test ---
+if __name__ == "__main__":
+    """
+    Builds an index of each type at the trained-index threshold and checks that it is
+    recognized as that type and not flagged for a rebuild straight away.
+
+    Usage:
+      python vector_index.py
+    """
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((VECTOR_INDEX_MIN_VECTORS, 64)).astype(np.float32)
+    for index_type in ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8"):
+        index = new_index(vectors, index_type)
+        index.add(vectors)
+        print(f"{index_type}: {describe(index)}, exact storage: {is_exact_storage(index)}")
+        assert index_type_of(index) == index_type, index_type_of(index)
+        assert not needs_rebuild(index, index_type)
+    assert not is_exact_storage(new_index(vectors, "ivf_pq"))
+    print("✅ All index types are recognized.")
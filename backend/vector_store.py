@@ -1,19 +1,102 @@
 import os
+import re
+import json
+import time
+import atexit
+import hashlib
+import uuid
 import faiss
 import asyncio
+import threading
+import numpy as np
+from pathlib import Path
+from collections import OrderedDict
 from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.document_loaders import TextLoader
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from typing import Any
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings # <-- Changed import
 from dotenv import load_dotenv
 from llm_clients import get_seeder_chain # For initial knowledge seeding
+from embedding_cache import CachedEmbeddings
+from embedding_backends import EMBEDDING_BACKEND, embeddings_name, make_embeddings
+from kb_store import get_kb_store, KB_EXPORT_PATH
+from metrics import VECTOR_STORE_SECONDS, VECTOR_STORE_CHUNKS
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from code_chunker import split_python_source
+from symbol_index import SymbolIndex
+from docstore import SQLiteDocstore
+from multiworker import MULTI_WORKER, FileLock, exclusive_lock, shared_lock
+import vector_index
 
 # --- Load API Key (still needed for LLM, but not for embeddings) ---
 load_dotenv()
 
 # --- Configuration ---
-DATA_PATH = "data/"
-INDEX_PATH = "faiss_index"
+# The local corpus, the indexes and repo_data/ live in the backend directory wherever the
+# server is started from. Source paths in chunks and manifests are relative to it, so chunk
+# IDs stay the same if the checkout moves.
+BASE_DIR = os.getenv("VECTOR_STORE_ROOT", os.path.dirname(os.path.abspath(__file__)))
+DATA_PATH = os.path.join(BASE_DIR, "data")
+INDEX_PATH = os.path.join(BASE_DIR, "faiss_index")
+# Chunk text lives in a SQLite docstore next to the (memory-mapped) FAISS index, so loading
+# reads neither; the index's label -> chunk ID map is saved with the index.
+DOCSTORE_FILE = "docstore.db"
+INDEX_IDS_FILE = "index_ids.json"
+VECTOR_FLUSH_SECONDS = float(os.getenv("VECTOR_FLUSH_SECONDS", 30))
+VECTOR_FLUSH_THRESHOLD = int(os.getenv("VECTOR_FLUSH_THRESHOLD", 50))
+# Retrieval fuses FAISS and BM25 rankings (reciprocal rank fusion) over this many candidates each.
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", 20))
+
+# --- Index Namespaces ---
+# Each repository gets its own index (directory, manifest and docstore). DOCS_REPO is the
+# repository the local corpus (DATA_PATH and the backend's .py files) documents; it, and
+# calls without a repository, use the default namespace in INDEX_PATH. Other repositories are
+# indexed from REPO_DATA_PATH/<owner>__<repo>/ plus their own KB entries, under
+# NAMESPACE_INDEX_ROOT/<owner>__<repo>/. With SHARE_DEFAULT_NAMESPACE, a repository with no
+# data directory of its own shares the default namespace instead (the single-repository setup).
+DEFAULT_NAMESPACE = "default"
+DOCS_REPO = os.getenv("DOCS_REPO", "")
+SHARE_DEFAULT_NAMESPACE = os.getenv("SHARE_DEFAULT_NAMESPACE", "false").lower() == "true"
+REPO_DATA_PATH = os.getenv("REPO_DATA_PATH", os.path.join(BASE_DIR, "repo_data"))
+NAMESPACE_INDEX_ROOT = os.getenv("NAMESPACE_INDEX_ROOT", os.path.join(BASE_DIR, "faiss_indexes"))
+# Loaded indexes are kept in an LRU bounded by count and by estimated memory.
+VECTOR_STORE_MAX_LOADED = int(os.getenv("VECTOR_STORE_MAX_LOADED", 8))
+VECTOR_STORE_MAX_MEMORY_MB = float(os.getenv("VECTOR_STORE_MAX_MEMORY_MB", 2048))
+
+# --- Multi-Worker Mode ---
+# With MULTI_WORKER, the worker holding an index's writer lock is the only one that saves it.
+# Every worker writes chunks to the shared docstore and replays its change log into its own
+# in-memory index every VECTOR_SYNC_SECONDS; the others also switch to each snapshot the
+# writer saves, and one of them takes over the lock if the writer exits.
+VECTOR_SYNC_SECONDS = float(os.getenv("VECTOR_SYNC_SECONDS", 1))
+VECTOR_WRITER_WAIT_SECONDS = float(os.getenv("VECTOR_WRITER_WAIT_SECONDS", 120))
+WRITER_LOCK_FILE = "writer.lock"
+SNAPSHOT_LOCK_FILE = "snapshot.lock"
+
+# --- Shared Embeddings Provider ---
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+def get_embeddings() -> CachedEmbeddings:
+    """
+    Returns the process-wide embeddings model (see EMBEDDING_BACKEND), loading it on first use.
+    It is wrapped in a persistent content-hash cache so unchanged chunks are never re-embedded.
+    """
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            print(f"Loading local embedding model ({EMBEDDING_BACKEND})... (This may download the model on first run)")
+            _embeddings = CachedEmbeddings(make_embeddings(EMBEDDING_BACKEND), embeddings_name(EMBEDDING_BACKEND))
+            print("Embedding model loaded.")
+        return _embeddings
+
+def embedding_cache_stats() -> dict:
+    """Returns embedding cache hit/miss counts, or an empty dict if the model is not loaded yet."""
+    return _embeddings.stats() if _embeddings is not None else {}
 
 # --- Helper Functions ---
 
@@ -35,7 +118,7 @@ def _seed_initial_knowledge():
         source_files = ['main.py', 'agent_logic.py', 'vector_store.py']
         source_code = ""
         for file_name in source_files:
-            with open(file_name, 'r', encoding='utf-8') as f:
+            with open(os.path.join(BASE_DIR, file_name), 'r', encoding='utf-8') as f:
                 source_code += f"--- {file_name} ---\n{f.read()}\n\n"
         
         # Get the LLM chain to generate the summary
@@ -53,178 +136,1101 @@ def _seed_initial_knowledge():
     except Exception as e:
         print(f"🔥 Error seeding knowledge base: {e}")
 
-def create_vector_store():
+# --- Source Files and Manifest ---
+
+# Define loader arguments to handle encoding errors
+LOADER_KWARGS = {'encoding': 'utf-8', 'autodetect_encoding': True} # <-- Encoding fix
+MANIFEST_FILE = "manifest.json"
+# Bump when chunking changes, so incremental updates re-split files chunked the old way.
+SPLITTER_VERSION = 2  # 2: .py files are chunked per function/class
+
+def _get_text_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=100
+    )
+
+def _repo_slug(repo_name: str) -> str:
+    """A directory name for a repository: `owner/repo` becomes `owner__repo`."""
+    return re.sub(r"[^A-Za-z0-9._-]+", "__", repo_name).strip(".") or DEFAULT_NAMESPACE
+
+def namespace_for(repo_name: str = None) -> str:
+    """The index namespace that serves `repo_name` (see Index Namespaces above)."""
+    if not repo_name or repo_name == DOCS_REPO:
+        return DEFAULT_NAMESPACE
+    slug = _repo_slug(repo_name)
+    if SHARE_DEFAULT_NAMESPACE and not os.path.isdir(os.path.join(REPO_DATA_PATH, slug)):
+        return DEFAULT_NAMESPACE
+    return slug
+
+def repo_file_path(source: str, repo_name: str = None) -> str:
     """
-    Loads docs from the DATA_PATH, splits them, creates embeddings,
-    and saves a new FAISS index to INDEX_PATH.
+    The path in `repo_name` of the file a chunk's `source` was loaded from. The default
+    corpus is this project's backend/ directory; a repository namespace's files sit under
+    REPO_DATA_PATH/<owner>__<repo>/ laid out as in that repository.
     """
-    print(f"Creating new vector store from data in '{DATA_PATH}'...")
+    source = source.replace("\\", "/")
+    namespace = namespace_for(repo_name)
+    if namespace == DEFAULT_NAMESPACE:
+        return source if source.startswith("backend/") else f"backend/{source}"
+    root = os.path.abspath(os.path.join(REPO_DATA_PATH, namespace))
+    relative = os.path.relpath(_absolute(source), root).replace(os.sep, "/")
+    return source if relative.startswith("../") else relative
 
-    # --- NEW: Seed knowledge if the guide is empty ---
-    _seed_initial_knowledge()
+def _index_path(namespace: str) -> str:
+    return INDEX_PATH if namespace == DEFAULT_NAMESPACE else os.path.join(NAMESPACE_INDEX_ROOT, namespace)
 
-    # Define loader arguments to handle encoding errors
-    loader_kwargs = {'encoding': 'utf-8', 'autodetect_encoding': True} # <-- Encoding fix
+def _relative(path: str) -> str:
+    """`path` relative to BASE_DIR, or absolute if it lies outside it."""
+    relative = os.path.relpath(os.path.abspath(path), BASE_DIR)
+    return os.path.abspath(path) if relative.startswith(os.pardir) else relative
 
-    # --- THIS IS THE CHANGE: Load both Markdown and Python files ---
-    print("Loading documents from all sources (.md and .py files)...")
-    
-    # 1a. Load all .md documents from the /data directory
-    md_loader = DirectoryLoader(
-        DATA_PATH, 
-        glob="**/*.md", 
-        loader_cls=TextLoader,
-        loader_kwargs=loader_kwargs,
-        show_progress=True,
-        use_multithreading=True
+def _absolute(path: str) -> str:
+    """Resolves a source path as returned by _scan_source_files()."""
+    return os.path.join(BASE_DIR, path)
+
+def _scan_source_files(namespace: str = DEFAULT_NAMESPACE) -> list:
+    """
+    Lists the namespace's source files, relative to BASE_DIR, skipping hidden directories
+    the same way DirectoryLoader does. For the default namespace: every .md file under
+    DATA_PATH and every .py file under the backend directory, except other namespaces' data.
+    For a repository namespace: every .md and .py file in its REPO_DATA_PATH directory.
+    The Markdown export of the KB store is skipped; its entries are indexed from the store.
+    """
+    if namespace == DEFAULT_NAMESPACE:
+        paths = [str(p) for p in Path(DATA_PATH).glob("**/*.md")]
+        paths += [str(p) for p in Path(BASE_DIR).glob("**/*.py")]
+        excluded = (os.path.abspath(REPO_DATA_PATH) + os.sep, os.path.abspath(NAMESPACE_INDEX_ROOT) + os.sep)
+        paths = [p for p in paths if not os.path.abspath(p).startswith(excluded)]
+    else:
+        root = Path(REPO_DATA_PATH) / namespace
+        paths = [str(p) for pattern in ("**/*.md", "**/*.py") for p in root.glob(pattern)]
+    paths = {_relative(p) for p in paths}
+    return sorted(
+        p for p in paths
+        if os.path.isfile(_absolute(p)) and not any(part.startswith('.') for part in Path(p).parts)
+        and os.path.abspath(_absolute(p)) != KB_EXPORT_PATH
     )
-    
-    # 1b. Load all .py source code files from the current (backend) directory
-    py_loader = DirectoryLoader(
-        '.', # Current directory
-        glob="**/*.py",
-        loader_cls=TextLoader,
-        loader_kwargs=loader_kwargs,
-        show_progress=True,
-        use_multithreading=True
+
+def _kb_entries(namespace: str = DEFAULT_NAMESPACE) -> list:
+    """The live KB store entries written for repositories this namespace serves."""
+    return [record for record in get_kb_store().live_entries()
+            if namespace_for(record.get("metadata", {}).get("repo")) == namespace]
+
+def _fingerprint_file(path: str) -> dict:
+    """Returns the size, mtime and content hash of a source file."""
+    stat = os.stat(_absolute(path))
+    with open(_absolute(path), 'rb') as f:
+        content_hash = hashlib.sha256(f.read()).hexdigest()
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": content_hash}
+
+def _load_and_split_file(path: str, content_hash: str):
+    """
+    Loads and splits one source file. Returns the chunks and their stable IDs.
+    Python files are chunked along their syntax tree (see code_chunker), falling back
+    to the plain text splitter if they don't parse.
+    """
+    documents = TextLoader(_absolute(path), **LOADER_KWARGS).load()
+    for document in documents:
+        document.metadata["source"] = path
+    chunks = None
+    if path.endswith(".py"):
+        chunks = split_python_source(documents[0].page_content, documents[0].metadata)
+    if chunks is None:
+        chunks = _get_text_splitter().split_documents(documents)
+    path_hash = hashlib.sha256(path.encode('utf-8')).hexdigest()[:8]
+    chunk_ids = [f"{path_hash}-{content_hash[:12]}-{i}" for i in range(len(chunks))]
+    return chunks, chunk_ids
+
+KB_SOURCE = os.path.join('data', os.path.basename(KB_EXPORT_PATH))
+
+def _kb_manifest_key(entry_id: str) -> str:
+    return f"kb:{entry_id}"
+
+def _split_kb_entry(record: dict):
+    """Splits one KB store entry. Returns the chunks and their stable IDs."""
+    document = Document(page_content=record["content"], metadata={"source": KB_SOURCE, "kb_entry_id": record["id"]})
+    chunks = _get_text_splitter().split_documents([document])
+    path_hash = hashlib.sha256(_kb_manifest_key(record["id"]).encode('utf-8')).hexdigest()[:8]
+    chunk_ids = [f"{path_hash}-{record['hash'][:12]}-{i}" for i in range(len(chunks))]
+    return chunks, chunk_ids
+
+def _load_manifest(index_path: str = INDEX_PATH):
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error reading manifest, ignoring it: {e}")
+        return None
+
+def _save_manifest(manifest: dict, index_path: str = INDEX_PATH):
+    os.makedirs(index_path, exist_ok=True)
+    _atomic_write(
+        os.path.join(index_path, MANIFEST_FILE),
+        json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8')
     )
-    
+
+# --- Index Maintenance ---
+# The FAISS layout is configurable (see vector_index). LangChain's FAISS wrapper assumes
+# positions are compacted on delete, which holds for flat/SQ8 indexes only: IVF indexes
+# keep their labels (so chunks are added and removed by label here) and HNSW cannot
+# remove at all (so a delete rebuilds the graph from its stored vectors).
+
+def _build_db(docs: list, ids: list, embeddings, index_path: str = INDEX_PATH) -> FAISS:
+    """
+    Embeds `docs` and builds a FAISS store with an index of the configured type, replacing
+    the contents of the docstore in `index_path`. The docstore is replaced in one transaction
+    once every chunk is embedded and indexed, so a build that fails leaves the previous
+    docstore in place, still matching the saved index.
+    """
+    os.makedirs(index_path, exist_ok=True)
+    if docs:
+        texts = [doc.page_content for doc in docs]
+        vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+        db = FAISS(embeddings, vector_index.new_index(vectors), InMemoryDocstore(), {}, distance_strategy="COSINE")
+        db.add_embeddings(zip(texts, vectors), metadatas=[doc.metadata for doc in docs], ids=ids)
+    else:
+        index = faiss.IndexFlatL2(len(embeddings.embed_query("placeholder")))
+        db = FAISS(embeddings, index, InMemoryDocstore(), {}, distance_strategy="COSINE")
+    docstore = SQLiteDocstore(os.path.join(index_path, DOCSTORE_FILE))
+    docstore.replace(db.docstore._dict)
+    db.docstore = docstore
+    return db
+
+def _ensure_writable(db: FAISS):
+    """A memory-mapped IVF index is read into memory (from the index directory) before its first change."""
+    if vector_index.is_read_only(db.index):
+        index_path = os.path.dirname(db.docstore.path)
+        db.index = faiss.read_index(os.path.join(index_path, "index.faiss"))
+        vector_index.configure_search(db.index)
+
+def _index_vectors(db: FAISS, docs: list, ids: list):
+    """Embeds `docs` and adds them to the index under `ids`. The docstore is not touched."""
+    vectors = np.array(db.embeddings.embed_documents([doc.page_content for doc in docs]), dtype=np.float32)
+    if db._normalize_L2:
+        faiss.normalize_L2(vectors)
+    if vector_index.is_ivf(db.index):
+        start = max(db.index_to_docstore_id, default=-1) + 1
+        labels = np.arange(start, start + len(docs), dtype=np.int64)
+        db.index.add_with_ids(vectors, labels)
+    else:
+        labels = np.arange(db.index.ntotal, db.index.ntotal + len(docs), dtype=np.int64)
+        db.index.add(vectors)
+    db.index_to_docstore_id.update(zip(labels.tolist(), ids))
+
+def _unindex(db: FAISS, ids: list):
+    """Removes the chunks `ids` from the index. The docstore is not touched."""
+    drop = set(ids)
+    labels = {label for label, doc_id in db.index_to_docstore_id.items() if doc_id in drop}
+    if not labels:
+        return
+    if vector_index.is_ivf(db.index):
+        db.index.remove_ids(np.array(sorted(labels), dtype=np.int64))
+        for label in labels:
+            del db.index_to_docstore_id[label]
+        return
+    keep = sorted(label for label in db.index_to_docstore_id if label not in labels)
+    if isinstance(db.index, faiss.IndexHNSW):
+        vectors = db.index.reconstruct_n(0, db.index.ntotal)[keep]
+        index = vector_index.new_index(vectors, "hnsw", min_vectors=0) if len(keep) else faiss.IndexFlatL2(db.index.d)
+        index.add(vectors)
+        db.index = index
+    else:
+        # Flat and SQ8 indexes shift the remaining vectors down, as LangChain's FAISS.delete expects.
+        db.index.remove_ids(np.array(sorted(labels), dtype=np.int64))
+    db.index_to_docstore_id = {position: db.index_to_docstore_id[label] for position, label in enumerate(keep)}
+
+def _add_to_db(db: FAISS, docs: list, ids: list = None) -> list:
+    _ensure_writable(db)
+    ids = ids or [str(uuid.uuid4()) for _ in docs]
+    _index_vectors(db, docs, ids)
+    db.docstore.add({doc_id: Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata)
+                     for doc_id, doc in zip(ids, docs)})
+    return ids
+
+def _delete_from_db(db: FAISS, ids: list):
+    _ensure_writable(db)
+    _unindex(db, ids)
+    db.docstore.delete(ids)
+
+def _rebuild_index(db: FAISS):
+    """
+    Retrains the index into the configured type for its current size, keeping every chunk.
+    Vectors come from the index itself when it stores them exactly, otherwise from the
+    embedding cache (re-embedding only what is not cached).
+    """
+    labels = sorted(db.index_to_docstore_id)
+    if vector_index.is_exact_storage(db.index):
+        vectors = np.vstack([db.index.reconstruct(label) for label in labels]) if labels else np.zeros((0, db.index.d), dtype=np.float32)
+    else:
+        docs = db.docstore.get_many([db.index_to_docstore_id[label] for label in labels])
+        texts = [docs[db.index_to_docstore_id[label]].page_content for label in labels]
+        vectors = np.array(db.embeddings.embed_documents(texts), dtype=np.float32)
+    before = vector_index.describe(db.index)
+    index = vector_index.new_index(vectors) if labels else faiss.IndexFlatL2(db.index.d)
+    index.add(vectors)
+    db.index = index
+    db.index_to_docstore_id = {position: db.index_to_docstore_id[label] for position, label in enumerate(labels)}
+    print(f"Rebuilt vector index: {before} -> {vector_index.describe(index)}")
+
+# --- Index Persistence ---
+
+def _serialize_db(db: FAISS, seq: int) -> tuple:
+    """
+    The FAISS index and its label -> chunk ID map, as bytes. Chunk text is already in the
+    docstore; `seq` is the last docstore change the index reflects.
+    """
+    labels = list(db.index_to_docstore_id)
+    ids = {"labels": labels, "ids": [db.index_to_docstore_id[label] for label in labels], "seq": seq}
+    return faiss.serialize_index(db.index), json.dumps(ids).encode("utf-8")
+
+def _write_db(index_path: str, index_bytes, ids_bytes: bytes):
+    """Writes both files, then swaps them in together (under the snapshot lock in multi-worker mode)."""
+    os.makedirs(index_path, exist_ok=True)
+    files = {"index.faiss": index_bytes.tobytes(), INDEX_IDS_FILE: ids_bytes}
+    for name, data in files.items():
+        with open(os.path.join(index_path, f"{name}.tmp"), "wb") as f:
+            f.write(data)
+    with exclusive_lock(os.path.join(index_path, SNAPSHOT_LOCK_FILE)):
+        for name in files:
+            os.replace(os.path.join(index_path, f"{name}.tmp"), os.path.join(index_path, name))
+
+def _save_db(db: FAISS, index_path: str = INDEX_PATH, seq: int = None):
+    """Saves the index. Without `seq`, the caller must be the docstore's only writer."""
+    _write_db(index_path, *_serialize_db(db, db.docstore.last_change() if seq is None else seq))
+
+def _snapshot_version(index_path: str):
+    """Identifies the saved index: every save replaces the ids file. None if nothing is saved."""
     try:
-        md_docs = md_loader.load()
-        py_docs = py_loader.load()
-        documents = md_docs + py_docs
+        stat = os.stat(os.path.join(index_path, INDEX_IDS_FILE))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+def _read_snapshot(index_path: str, mmap: bool = True) -> tuple:
+    """The saved index, its label -> chunk ID map, the docstore change it reflects, and its version."""
+    with shared_lock(os.path.join(index_path, SNAPSHOT_LOCK_FILE)):
+        version = _snapshot_version(index_path)
+        index = vector_index.read_index(os.path.join(index_path, "index.faiss"), mmap=mmap)
+        with open(os.path.join(index_path, INDEX_IDS_FILE), "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    if len(saved["ids"]) != index.ntotal:
+        raise ValueError(f"{INDEX_IDS_FILE} lists {len(saved['ids'])} chunks but the index holds {index.ntotal}.")
+    return index, dict(zip(saved["labels"], saved["ids"])), saved.get("seq", 0), version
+
+def _load_db(embeddings, index_path: str = INDEX_PATH) -> FAISS:
+    """Opens a saved index without reading chunk text: the vectors are memory-mapped, text is fetched per hit."""
+    index, index_to_docstore_id, _, _ = _read_snapshot(index_path)
+    docstore = SQLiteDocstore(os.path.join(index_path, DOCSTORE_FILE))
+    return FAISS(embeddings, index, docstore, index_to_docstore_id, distance_strategy="COSINE")
+
+def _migrate_pickled_docstore(embeddings, index_path: str = INDEX_PATH):
+    """Copies an index saved by FAISS.save_local (docstore pickled in index.pkl) to the SQLite docstore."""
+    legacy = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    docstore = SQLiteDocstore(os.path.join(index_path, DOCSTORE_FILE))
+    docstore.add(legacy.docstore._dict)
+    _save_db(legacy, index_path, docstore.last_change())
+    # index.pkl stays (it may be tracked in git); the ids file written above marks the index as migrated.
+    print(f"Migrated {len(legacy.docstore._dict)} chunks from index.pkl to '{DOCSTORE_FILE}'.")
+
+def _reconcile_docstore(db: FAISS) -> bool:
+    """
+    The docstore is written immediately and the index by the flusher, so after a crash the
+    index can lag behind it: chunks missing from the index are added back (their vectors come
+    from the embedding cache) and chunks deleted from the docstore are removed. Returns True
+    if the index changed.
+    """
+    stored = db.docstore.ids()
+    indexed = set(db.index_to_docstore_id.values())
+    if indexed - stored:
+        _delete_from_db(db, list(indexed - stored))
+    if stored - indexed:
+        docs = db.docstore.get_many(stored - indexed)
+        _add_to_db(db, list(docs.values()), ids=list(docs))
+    return stored != indexed
+
+@VECTOR_STORE_SECONDS.time(operation="create")
+def create_vector_store(namespace: str = DEFAULT_NAMESPACE):
+    """
+    Loads the namespace's docs (DATA_PATH for the default one), splits them, creates
+    embeddings, and saves a new FAISS index to the namespace's index directory along
+    with a manifest of the source files and the chunk IDs each one produced.
+    """
+    index_path = _index_path(namespace)
+    print(f"Creating new vector store for namespace '{namespace}' in '{index_path}'...")
+
+    # --- NEW: Seed knowledge if the guide is empty ---
+    if namespace == DEFAULT_NAMESPACE:
+        _seed_initial_knowledge()
+
+    # --- THIS IS THE CHANGE: Load both Markdown and Python files ---
+    print("Loading documents from all sources (.md and .py files)...")
+    manifest = {"version": 1, "splitter": SPLITTER_VERSION, "embeddings": embeddings_name(), "files": {}}
+    docs, doc_ids = [], []
+    try:
+        for path in _scan_source_files(namespace):
+            entry = _fingerprint_file(path)
+            chunks, chunk_ids = _load_and_split_file(path, entry["sha256"])
+            entry["chunk_ids"] = chunk_ids
+            manifest["files"][path] = entry
+            docs.extend(chunks)
+            doc_ids.extend(chunk_ids)
+        # Knowledge-base entries come from the KB store (live entries only).
+        for record in _kb_entries(namespace):
+            chunks, chunk_ids = _split_kb_entry(record)
+            manifest["files"][_kb_manifest_key(record["id"])] = {"sha256": record["hash"], "chunk_ids": chunk_ids}
+            docs.extend(chunks)
+            doc_ids.extend(chunk_ids)
     except Exception as e:
         print(f"Error loading documents: {e}")
         return None
 
     # 2. Create embeddings (using local model)
-    print("Loading local embedding model... (This may download ~500MB on first run)")
     try:
-        embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'} # Use CPU
-        )
-        print("Embedding model loaded.")
+        embeddings = get_embeddings()
     except Exception as e:
         print(f"Error initializing local embedding model: {e}")
         return None
 
     # If no documents are found, create an empty index and save it.
-    if not documents:
-        print(f"Warning: No .md documents found in '{DATA_PATH}'. Creating an empty index.")
+    if not docs:
+        print(f"Warning: No documents found for namespace '{namespace}'. Creating an empty index.")
         print("The agent will run, but won't find docs until you add them and restart.")
-        empty_faiss = FAISS.from_texts(["placeholder"], embeddings)
-        empty_faiss.delete([empty_faiss.index_to_docstore_id[0]])
-        empty_faiss.save_local(INDEX_PATH)
+        empty_faiss = _build_db([], [], embeddings, index_path)
+        _save_db(empty_faiss, index_path)
+        _save_manifest(manifest, index_path)
         return empty_faiss
 
-    # 2. Split the documents into smaller, searchable chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=100
-    )
-    docs = text_splitter.split_documents(documents)
-    print(f"Loaded and split {len(documents)} documents into {len(docs)} chunks.")
+    print(f"Loaded and split {len(manifest['files'])} documents into {len(docs)} chunks.")
 
     # 4. Create FAISS index from documents and embeddings
     print("Creating FAISS index... This may take a moment.")
     try:
         # --- THIS IS THE FIX ---
         # Use the COSINE distance strategy, which is what the retriever expects and works correctly with the embedding model.
-        db = FAISS.from_documents(docs, embeddings, distance_strategy="COSINE")
+        # Past VECTOR_INDEX_MIN_VECTORS chunks the index is trained into VECTOR_INDEX_TYPE.
+        db = _build_db(docs, doc_ids, embeddings, index_path)
         
-        # 5. Save the index locally
-        db.save_local(INDEX_PATH)
-        print(f"Successfully created and saved index to '{INDEX_PATH}'.")
+        # 5. Save the index and manifest locally
+        _save_db(db, index_path)
+        _save_manifest(manifest, index_path)
+        print(f"Successfully created and saved index to '{index_path}'.")
+        print(f"Embedding cache: {embeddings.stats()}")
         return db
     except Exception as e:
         print(f"Error creating or saving FAISS index: {e}")
         return None
 
+@VECTOR_STORE_SECONDS.time(operation="update_incremental")
+def update_vector_store_incremental(namespace: str = DEFAULT_NAMESPACE):
+    """
+    Brings the on-disk index up to date with the source files, re-splitting and
+    re-embedding only files whose content changed since the manifest was written.
+    Chunks of changed or removed files are deleted, as are chunks that no tracked
+    file owns (e.g. ones added at runtime), so the result matches a full rebuild.
+    Returns a report of the files and chunks touched.
+    """
+    index_path = _index_path(namespace)
+    manifest = _load_manifest(index_path)
+    # Vectors from another embeddings backend can't be mixed with new ones, so everything is re-embedded.
+    # (Manifests written before backends existed were built by the reference backend.)
+    built_with = manifest.get("embeddings", embeddings_name("huggingface")) if manifest else None
+    if manifest and built_with != embeddings_name():
+        print(f"Index was embedded with '{built_with}', not '{embeddings_name()}'.")
+    db = load_vector_store(namespace) if manifest and built_with == embeddings_name() else None
+    if db is None:
+        print("No index with a manifest found for this embeddings backend. Running a full build instead...")
+        db = create_vector_store(namespace)
+        manifest = _load_manifest(index_path) or {"files": {}}
+        files = manifest["files"]
+        return {
+            "full_build": True,
+            "files_scanned": len(files),
+            "files_added": len(files),
+            "chunks_added": sum(len(entry["chunk_ids"]) for entry in files.values()),
+        }
+
+    if namespace == DEFAULT_NAMESPACE:
+        _seed_initial_knowledge()
+
+    seq = db.docstore.last_change()
+    files = manifest["files"]
+    current_paths = _scan_source_files(namespace)
+    report = {
+        "full_build": False,
+        "files_scanned": len(current_paths),
+        "files_unchanged": 0,
+        "files_changed": 0,
+        "files_added": 0,
+        "files_removed": 0,
+        "chunks_deleted": 0,
+        "chunks_added": 0,
+    }
+    stale_ids, new_docs, new_ids = [], [], []
+    # Code files chunked by an older splitter are re-split even if their content is unchanged.
+    resplit_code = manifest.get("splitter", 1) != SPLITTER_VERSION
+    manifest["splitter"] = SPLITTER_VERSION
+    manifest["embeddings"] = embeddings_name()
+
+    for path in current_paths:
+        old_entry = files.get(path)
+        stat = os.stat(_absolute(path))
+        force = resplit_code and path.endswith(".py")
+        # Cheap check first: size and mtime unchanged means the file was not touched.
+        if not force and old_entry and old_entry["size"] == stat.st_size and old_entry["mtime"] == stat.st_mtime:
+            report["files_unchanged"] += 1
+            continue
+
+        entry = _fingerprint_file(path)
+        if not force and old_entry and old_entry["sha256"] == entry["sha256"]:
+            # Touched but identical content: refresh the stat fields only.
+            old_entry.update(size=entry["size"], mtime=entry["mtime"])
+            report["files_unchanged"] += 1
+            continue
+
+        chunks, chunk_ids = _load_and_split_file(path, entry["sha256"])
+        entry["chunk_ids"] = chunk_ids
+        if old_entry:
+            stale_ids.extend(old_entry["chunk_ids"])
+            report["files_changed"] += 1
+        else:
+            report["files_added"] += 1
+        files[path] = entry
+        new_docs.extend(chunks)
+        new_ids.extend(chunk_ids)
+
+    # KB store entries are immutable, so an entry ID seen before needs no work;
+    # superseded entries drop out of the live set and are removed below.
+    kb_entries = _kb_entries(namespace)
+    current_kb_keys = set()
+    for record in kb_entries:
+        key = _kb_manifest_key(record["id"])
+        current_kb_keys.add(key)
+        if key in files:
+            report["files_unchanged"] += 1
+            continue
+        chunks, chunk_ids = _split_kb_entry(record)
+        files[key] = {"sha256": record["hash"], "chunk_ids": chunk_ids}
+        report["files_added"] += 1
+        new_docs.extend(chunks)
+        new_ids.extend(chunk_ids)
+    report["files_scanned"] += len(kb_entries)
+
+    for path in set(files) - set(current_paths) - current_kb_keys:
+        stale_ids.extend(files.pop(path)["chunk_ids"])
+        report["files_removed"] += 1
+
+    owned_ids = {chunk_id for entry in files.values() for chunk_id in entry["chunk_ids"]}
+    indexed_ids = set(db.index_to_docstore_id.values())
+    stale_ids = set(stale_ids) | (indexed_ids - owned_ids)
+    stale_ids &= indexed_ids
+    # KB chunks added at runtime already carry their final IDs.
+    already_indexed = indexed_ids - stale_ids
+    new_pairs = [(doc, chunk_id) for doc, chunk_id in zip(new_docs, new_ids) if chunk_id not in already_indexed]
+    new_docs = [doc for doc, _ in new_pairs]
+    new_ids = [chunk_id for _, chunk_id in new_pairs]
+
+    try:
+        if stale_ids:
+            _delete_from_db(db, list(stale_ids))
+        if new_docs:
+            _add_to_db(db, new_docs, ids=new_ids)
+        if vector_index.needs_rebuild(db.index):
+            _rebuild_index(db)
+            report["index_rebuilt"] = True
+        _save_db(db, index_path, seq)
+        _save_manifest(manifest, index_path)
+    except Exception as e:
+        print(f"Error updating FAISS index: {e}")
+        return None
+
+    report["chunks_deleted"] = len(stale_ids)
+    report["chunks_added"] = len(new_docs)
+    print(f"Embedding cache: {get_embeddings().stats()}")
+    return report
 
-def load_vector_store():
+
+@VECTOR_STORE_SECONDS.time(operation="load")
+def load_vector_store(namespace: str = DEFAULT_NAMESPACE):
     """
-    Loads an existing FAISS index from INDEX_PATH.
+    Loads the namespace's existing FAISS index. The vectors are memory-mapped and
+    chunk text stays in the docstore until a search returns it.
     """
+    index_path = _index_path(namespace)
     
     # Check if the index files exist
-    if not os.path.exists(f"{INDEX_PATH}/index.faiss") or not os.path.exists(f"{INDEX_PATH}/index.pkl"):
-        print(f"No index found at '{INDEX_PATH}'.")
+    if not os.path.exists(f"{index_path}/index.faiss") or not (
+            os.path.exists(f"{index_path}/{INDEX_IDS_FILE}") or os.path.exists(f"{index_path}/index.pkl")):
+        print(f"No index found at '{index_path}'.")
         return None
 
-    print(f"Loading existing index from '{INDEX_PATH}'...")
+    print(f"Loading existing index from '{index_path}'...")
     
     try:
-        # Re-initialize the same local embeddings model
-        embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}
-        )
+        # Reuse the shared local embeddings model
+        embeddings = get_embeddings()
         
+        # Indexes saved before the SQLite docstore keep their chunks in a pickle; convert once.
+        if not os.path.exists(f"{index_path}/{INDEX_IDS_FILE}"):
+            _migrate_pickled_docstore(embeddings, index_path)
+
         # Load the local index
-        db = FAISS.load_local(INDEX_PATH, embeddings, allow_dangerous_deserialization=True) # Hackathon-safe
-        print("Successfully loaded index.")
+        db = _load_db(embeddings, index_path)
+        # Other workers may write to the docstore meanwhile; their changes are replayed later.
+        seq = db.docstore.last_change()
+        changed = _reconcile_docstore(db)
+        print(f"Successfully loaded index ({vector_index.describe(db.index)}).")
+        # The corpus may have grown past the training threshold, or the index type changed.
+        if vector_index.needs_rebuild(db.index):
+            _rebuild_index(db)
+            changed = True
+        if changed:
+            _save_db(db, index_path, seq)
         return db
     except Exception as e:
         print(f"Error loading index. Did you create it first? {e}")
         return None
 
-def add_docs_to_store(new_docs: list):
+# --- Resident Vector Store ---
+
+class ResidentVectorStore:
     """
-    Incrementally adds new documents to the existing vector store.
+    A process-wide wrapper around one namespace's loaded FAISS store.
+
+    Additions are applied in memory under a lock, so searches see new chunks right away.
+    Persistence is write-behind: a background thread saves the index once
+    VECTOR_FLUSH_THRESHOLD chunks are pending or every VECTOR_FLUSH_SECONDS.
+
+    A BM25 index over the same chunks is kept in step with FAISS (it is rebuilt by streaming
+    the docstore once on load), so exact identifiers from a diff can be found lexically, and so
+    is a symbol index from code names to the doc chunks that mention them.
+
+    In multi-worker mode (with a `writer_lock`) writes go to the shared docstore only, and
+    sync() replays the docstore's change log into all three indexes, so this worker sees every
+    worker's chunks. Only the holder of the writer lock flushes; the others switch to each
+    snapshot it saves. `seq` is the last docstore change the loaded index reflects.
     """
-    print(f"Incrementally adding {len(new_docs)} new documents to the vector store...")
-    db = load_vector_store()
+
+    def __init__(self, db, index_path: str = INDEX_PATH, namespace: str = DEFAULT_NAMESPACE,
+                 writer_lock: FileLock = None, seq: int = 0, snapshot_version=None):
+        self.db = db
+        self.index_path = index_path
+        self.namespace = namespace
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._pending = 0
+        self._flush_requested = threading.Event()
+        self._flusher = None
+        self._closed = False
+        self._positions = None  # docstore ID -> FAISS position, rebuilt lazily after writes
+        self._writer_lock = writer_lock
+        self._seq = seq
+        self._flushed_seq = seq
+        self._snapshot_version = snapshot_version
+        self._rebuild_text_indexes()
+        VECTOR_STORE_CHUNKS.set(self.size(), namespace=self.namespace)
+        if writer_lock is not None:
+            self.sync()
+
+    def _rebuild_text_indexes(self):
+        self.lexical = BM25Index()
+        self.symbols = SymbolIndex()
+        for doc_id, doc in self.db.docstore.iter_documents():
+            self.lexical.add(doc_id, doc.page_content)
+            self.symbols.add(doc_id, doc)
+
+    @property
+    def is_writer(self) -> bool:
+        """True if this process saves the index (always, outside multi-worker mode)."""
+        return self._writer_lock is None or self._writer_lock.held
+
+    # --- Reads ---
+
+    @VECTOR_STORE_SECONDS.time(operation="similarity_search")
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 5):
+        with self._lock:
+            return self.db.similarity_search_with_relevance_scores(query, k=k)
+
+    async def asimilarity_search_with_relevance_scores(self, query: str, k: int = 5):
+        return await asyncio.to_thread(self.similarity_search_with_relevance_scores, query, k)
+
+    @VECTOR_STORE_SECONDS.time(operation="mmr_search")
+    def max_marginal_relevance_search(self, query: str, k: int = 5, fetch_k: int = 20):
+        with self._lock:
+            return self.db.max_marginal_relevance_search(query, k=k, fetch_k=fetch_k)
+
+    def _distance_to(self, query_vector: np.ndarray, doc_id: str) -> float:
+        """The FAISS distance between the query and a stored chunk, as index.search would report it."""
+        if self._positions is None:
+            self._positions = {value: key for key, value in self.db.index_to_docstore_id.items()}
+        vector = self.db.index.reconstruct(self._positions[doc_id])
+        if self.db.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            return float(np.dot(query_vector, vector))
+        return float(np.sum((query_vector - vector) ** 2))
+
+    @VECTOR_STORE_SECONDS.time(operation="hybrid_search")
+    def hybrid_search_with_relevance_scores(self, query: str, k: int = 5, fetch_k: int = HYBRID_FETCH_K):
+        """
+        Runs dense (FAISS) and lexical (BM25) search for `fetch_k` candidates each and merges
+        them with reciprocal rank fusion. Returns the top `k` as (Document, relevance) pairs in
+        fused order; the relevance is always the dense cosine score, so confidence thresholds
+        keep their meaning even for chunks that only matched lexically.
+        """
+        query_vector = np.array([self.db.embeddings.embed_query(query)], dtype=np.float32)
+        if self.db._normalize_L2:
+            faiss.normalize_L2(query_vector)
+        relevance = self.db._select_relevance_score_fn()
+
+        with self._lock:
+            distances, positions = self.db.index.search(query_vector, fetch_k)
+            dense = {self.db.index_to_docstore_id[int(position)]: float(distance)
+                     for distance, position in zip(distances[0], positions[0]) if position != -1}
+            lexical = [doc_id for doc_id, _ in self.lexical.search(query, fetch_k)]
+            fused = reciprocal_rank_fusion([list(dense), lexical])[:k]
+
+            results = []
+            for doc_id, _ in fused:
+                distance = dense[doc_id] if doc_id in dense else self._distance_to(query_vector[0], doc_id)
+                results.append((self.db.docstore.search(doc_id), relevance(distance)))
+            return results
+
+    def docs_for_symbols(self, symbols: list, limit: int = 5) -> list:
+        """Doc chunks that mention any of `symbols` (a dictionary lookup, no embedding query)."""
+        with self._lock:
+            return [self.db.docstore.search(doc_id) for doc_id in self.symbols.lookup(symbols, limit)]
+
+    def search_with_relevance_scores(self, query: str, k: int = 5):
+        """The agent's retrieval: hybrid when HYBRID_SEARCH_ENABLED, otherwise dense only."""
+        if HYBRID_SEARCH_ENABLED:
+            return self.hybrid_search_with_relevance_scores(query, k=k)
+        return self.similarity_search_with_relevance_scores(query, k=k)
+
+    async def asearch_with_relevance_scores(self, query: str, k: int = 5):
+        return await asyncio.to_thread(self.search_with_relevance_scores, query, k)
+
+    def size(self) -> int:
+        return self.db.index.ntotal
+
+    def memory_bytes(self) -> int:
+        """Estimated memory held: the index, plus the BM25 postings and per-chunk bookkeeping."""
+        with self._lock:
+            lexical = self.lexical.stats()["postings"] * _BYTES_PER_POSTING
+            return vector_index.estimate_bytes(self.db.index) + lexical + self.size() * _BYTES_PER_CHUNK
+
+    # --- Writes ---
+
+    def add_documents(self, docs: list, ids: list = None):
+        """Adds already-split chunks to the in-memory index and schedules a flush."""
+        if self._writer_lock is not None:
+            ids = ids or [str(uuid.uuid4()) for _ in docs]
+            self.db.docstore.add({doc_id: Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata)
+                                  for doc_id, doc in zip(ids, docs)})
+            self.sync()
+            return ids
+        with self._lock:
+            ids = _add_to_db(self.db, docs, ids=ids)
+            for doc_id, doc in zip(ids, docs):
+                self.lexical.add(doc_id, doc.page_content)
+                self.symbols.add(doc_id, doc)
+            self._positions = None
+            self._pending += len(docs)
+            pending = self._pending
+            VECTOR_STORE_CHUNKS.set(self.size(), namespace=self.namespace)
+        if pending >= VECTOR_FLUSH_THRESHOLD:
+            self._flush_requested.set()
+        return ids
+
+    def delete_kb_entry(self, entry_id: str) -> int:
+        """Removes the chunks of a KB store entry (e.g. one that was superseded)."""
+        if self._writer_lock is not None:
+            ids = self.db.docstore.ids_with_metadata("kb_entry_id", entry_id)
+            if ids:
+                self.db.docstore.delete(ids)
+                self.sync()
+            return len(ids)
+        with self._lock:
+            ids = self.db.docstore.ids_with_metadata("kb_entry_id", entry_id)
+            if ids:
+                _delete_from_db(self.db, ids)
+                for doc_id in ids:
+                    self.lexical.remove(doc_id)
+                    self.symbols.remove(doc_id)
+                self._positions = None
+                self._pending += len(ids)
+                VECTOR_STORE_CHUNKS.set(self.size(), namespace=self.namespace)
+        return len(ids)
+
+    # --- Multi-worker mode ---
+
+    def _load_snapshot(self, mmap: bool = True) -> int:
+        """Switches to the saved index and returns the docstore change it reflects."""
+        index, index_to_docstore_id, seq, version = _read_snapshot(self.index_path, mmap=mmap)
+        self.db.index, self.db.index_to_docstore_id = index, index_to_docstore_id
+        self._positions = None
+        self._snapshot_version = version
+        # Replaying a change twice is harmless, so resume from the older of the two points.
+        self._seq = min(self._seq, seq)
+        return seq
+
+    def sync(self) -> int:
+        """
+        Applies the docstore changes made (by any worker) since the index was last brought up
+        to date, after switching to a newer saved snapshot if this worker is not the writer.
+        Returns the number of chunks added to or removed from the index.
+        """
+        with self._lock:
+            if not self.is_writer and _snapshot_version(self.index_path) != self._snapshot_version:
+                self._load_snapshot()
+            changes, complete = self.db.docstore.changes_since(self._seq)
+            if not complete:
+                # The writer pruned changes this worker never saw: start over from its snapshot.
+                self._seq = self._load_snapshot()
+                self._rebuild_text_indexes()
+                changes, _ = self.db.docstore.changes_since(self._seq)
+            if not changes:
+                return 0
+
+            latest = {doc_id: op for _, op, doc_id in changes}
+            indexed = set(self.db.index_to_docstore_id.values())
+            removed = [doc_id for doc_id, op in latest.items() if op == "delete"]
+            # A chunk deleted after this read is missing here; its delete is in the next batch.
+            added = self.db.docstore.get_many([doc_id for doc_id, op in latest.items() if op == "add"])
+            to_remove = [doc_id for doc_id in removed if doc_id in indexed]
+            to_add = {doc_id: doc for doc_id, doc in added.items() if doc_id not in indexed}
+            if (to_remove or to_add) and vector_index.is_read_only(self.db.index):
+                if not self.is_writer:
+                    # Readers may not re-read the file (it can be a newer snapshot): load one fully and replay.
+                    self._load_snapshot(mmap=False)
+                    return self.sync()
+                _ensure_writable(self.db)
+
+            if to_remove:
+                _unindex(self.db, to_remove)
+            if to_add:
+                _index_vectors(self.db, list(to_add.values()), list(to_add))
+            for doc_id in removed:
+                self.lexical.remove(doc_id)
+                self.symbols.remove(doc_id)
+            for doc_id, doc in added.items():
+                self.lexical.add(doc_id, doc.page_content)
+                self.symbols.add(doc_id, doc)
+            self.db.docstore.forget(list(latest))
+            self._positions = None
+            self._seq = changes[-1][0]
+            applied = len(to_remove) + len(to_add)
+            if self.is_writer:
+                self._pending += applied
+            pending = self._pending
+            VECTOR_STORE_CHUNKS.set(self.size(), namespace=self.namespace)
+        if pending >= VECTOR_FLUSH_THRESHOLD:
+            self._flush_requested.set()
+        return applied
+
+    def _follow(self):
+        """One sync round: take over as writer if the lock is free, then replay new changes."""
+        try:
+            if not self._writer_lock.held and self._writer_lock.try_acquire():
+                print(f"Worker {os.getpid()} is now the index writer for namespace '{self.namespace}'.")
+                with self._lock:
+                    # The previous writer may have saved after this worker last loaded.
+                    self._load_snapshot()
+            self.sync()
+        except Exception as e:
+            print(f"🔥 Error syncing vector store '{self.namespace}': {e}")
+
+    # --- Persistence ---
+
+    def flush(self):
+        """Persists the index if there are unsaved additions. Safe to call from any thread."""
+        if not self.is_writer:
+            return
+        with self._flush_lock:
+            # Snapshot under the lock (in-memory copies only), then write outside it
+            # so searches are not blocked by disk I/O.
+            with self._lock:
+                if self._pending == 0:
+                    return
+                start = time.perf_counter()
+                seq = self._seq if self._writer_lock is not None else self.db.docstore.last_change()
+                index_bytes, ids_bytes = _serialize_db(self.db, seq)
+                flushed = self._pending
+                self._pending = 0
+
+            try:
+                _write_db(self.index_path, index_bytes, ids_bytes)
+                # Workers still following the previous snapshot may need the changes after it.
+                self.db.docstore.prune_changes(self._flushed_seq)
+                self._flushed_seq = seq
+                print(f"✅ Flushed {flushed} new chunks to '{self.index_path}'.")
+            except Exception as e:
+                with self._lock:
+                    self._pending += flushed
+                print(f"🔥 Error flushing vector store: {e}")
+            VECTOR_STORE_SECONDS.observe(time.perf_counter() - start, operation="flush")
+
+    def _flush_loop(self):
+        last_flush = time.monotonic()
+        while not self._closed:
+            following = self._writer_lock is not None
+            requested = self._flush_requested.wait(timeout=VECTOR_SYNC_SECONDS if following else VECTOR_FLUSH_SECONDS)
+            self._flush_requested.clear()
+            if following:
+                self._follow()
+                if not requested and time.monotonic() - last_flush < VECTOR_FLUSH_SECONDS:
+                    continue
+            self.flush()
+            last_flush = time.monotonic()
+
+    def start_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name=f"vector-store-flusher-{self.namespace}", daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def close(self):
+        """Flushes pending changes and stops the flusher (when the store is evicted)."""
+        self._closed = True
+        self._flush_requested.set()
+        atexit.unregister(self.flush)
+        self.flush()
+        if self._writer_lock is not None:
+            self._writer_lock.release()
+        VECTOR_STORE_CHUNKS.remove(namespace=self.namespace)
+
+    def as_retriever(self, **kwargs):
+        return self.db.as_retriever(**kwargs)
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# --- Loaded Namespaces ---
+
+# Rough per-item overheads of the Python-side indexes, for the memory-based LRU limit.
+_BYTES_PER_POSTING = 100
+_BYTES_PER_CHUNK = 500
+
+def _create_or_raise(namespace: str) -> FAISS:
+    print("No existing index found, creating a new one...")
+    db = create_vector_store(namespace)
     if db is None:
-        print("Warning: No vector store found to add to. Triggering a full rebuild.")
-        create_vector_store()
-        return
+        raise Exception("Failed to create vector store. Check errors above.")
+    return db
+
+def _open_followed_store(namespace: str, writer_lock: FileLock) -> ResidentVectorStore:
+    """
+    Multi-worker mode. The worker that wins the namespace's writer lock loads (or builds) the
+    index as a single worker would; the others open the snapshot it saves, waiting up to
+    VECTOR_WRITER_WAIT_SECONDS for the first one.
+    """
+    index_path = _index_path(namespace)
+    if writer_lock.try_acquire():
+        try:
+            docstore_path = os.path.join(index_path, DOCSTORE_FILE)
+            # Changes made by other workers while this one loads are replayed after it.
+            seq = SQLiteDocstore(docstore_path).last_change() if os.path.exists(docstore_path) else 0
+            db = load_vector_store(namespace)
+            if db is None:
+                db = _create_or_raise(namespace)
+                seq = db.docstore.last_change()
+        except Exception:
+            writer_lock.release()
+            raise
+        print(f"Worker {os.getpid()} is the index writer for namespace '{namespace}'.")
+        return ResidentVectorStore(db, index_path=index_path, namespace=namespace, writer_lock=writer_lock, seq=seq)
+
+    deadline = time.monotonic() + VECTOR_WRITER_WAIT_SECONDS
+    while _snapshot_version(index_path) is None:
+        if time.monotonic() > deadline:
+            raise Exception(f"No index saved at '{index_path}' yet. Another worker is still building it.")
+        time.sleep(1)
+    index, index_to_docstore_id, seq, version = _read_snapshot(index_path)
+    db = FAISS(get_embeddings(), index, SQLiteDocstore(os.path.join(index_path, DOCSTORE_FILE)), index_to_docstore_id,
+               distance_strategy="COSINE")
+    print(f"Following the index another worker writes for namespace '{namespace}'.")
+    return ResidentVectorStore(db, index_path=index_path, namespace=namespace, writer_lock=writer_lock,
+                               seq=seq, snapshot_version=version)
+
+def _open_store(namespace: str) -> ResidentVectorStore:
+    if MULTI_WORKER:
+        store = _open_followed_store(namespace, FileLock(os.path.join(_index_path(namespace), WRITER_LOCK_FILE)))
+    else:
+        db = load_vector_store(namespace) or _create_or_raise(namespace)
+        store = ResidentVectorStore(db, index_path=_index_path(namespace), namespace=namespace)
+    store.start_flusher()
+    return store
+
+class VectorStoreRegistry:
+    """
+    The loaded ResidentVectorStores, one per namespace, least recently used first.
+
+    A namespace is loaded (or built) on first use; loads of different namespaces run in
+    parallel. Past `max_loaded` stores or `max_memory_mb` of estimated memory the coldest
+    stores are flushed and evicted, and they reload from disk on their next use. The most
+    recently used store is never evicted, even if it alone exceeds the memory limit.
+    """
+
+    def __init__(self, max_loaded: int = VECTOR_STORE_MAX_LOADED, max_memory_mb: float = VECTOR_STORE_MAX_MEMORY_MB):
+        self.max_loaded = max_loaded
+        self.max_memory_mb = max_memory_mb
+        self._stores = OrderedDict()
+        self._load_locks = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def _lookup(self, namespace: str):
+        with self._lock:
+            store = self._stores.get(namespace)
+            if store is not None:
+                self._stores.move_to_end(namespace)
+            return store
+
+    def get(self, namespace: str = DEFAULT_NAMESPACE) -> ResidentVectorStore:
+        store = self._lookup(namespace)
+        if store is not None:
+            return store
+        with self._lock:
+            load_lock = self._load_locks.setdefault(namespace, threading.Lock())
+        with load_lock:
+            store = self._lookup(namespace)  # loaded by another thread meanwhile
+            if store is None:
+                store = _open_store(namespace)
+                self.put(namespace, store)
+            return store
+
+    def put(self, namespace: str, store: ResidentVectorStore):
+        """Makes `store` the loaded store for `namespace` and evicts cold stores over the limits."""
+        with self._lock:
+            replaced = self._stores.pop(namespace, None)
+            self._stores[namespace] = store
+            self.loads += 1
+            evicted = [replaced] if replaced is not None and replaced is not store else []
+            limit = self.max_memory_mb * 1024 * 1024
+            while len(self._stores) > 1 and (
+                    len(self._stores) > self.max_loaded
+                    or sum(s.memory_bytes() for s in self._stores.values()) > limit):
+                cold_namespace, cold_store = self._stores.popitem(last=False)
+                print(f"Evicting vector store '{cold_namespace}' from memory.")
+                evicted.append(cold_store)
+                self.evictions += 1
+        # Flushing writes to disk, so it happens outside the lock.
+        for cold_store in evicted:
+            cold_store.close()
+        VECTOR_STORE_CHUNKS.set(store.size(), namespace=namespace)
+
+    def loaded(self) -> list:
+        with self._lock:
+            return list(self._stores.values())
+
+    def flush_all(self):
+        for store in self.loaded():
+            store.flush()
+
+    def stats(self) -> dict:
+        stores = self.loaded()
+        namespaces = {store.namespace: {"chunks": store.size(), "memory_mb": round(store.memory_bytes() / 1024 / 1024, 1),
+                                        "writer": store.is_writer}
+                      for store in stores}
+        return {
+            "loaded": len(stores),
+            "max_loaded": self.max_loaded,
+            "memory_mb": round(sum(entry["memory_mb"] for entry in namespaces.values()), 1),
+            "max_memory_mb": self.max_memory_mb,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "namespaces": namespaces,
+        }
+
+_registry = VectorStoreRegistry()
+
+def get_vector_store(repo_name: str = None) -> ResidentVectorStore:
+    """
+    Returns the resident vector store for `repo_name`'s namespace (the default namespace if
+    None), loading (or creating) the index on first use. Blocks while it loads.
+    """
+    return _registry.get(namespace_for(repo_name))
 
+async def aget_vector_store(repo_name: str = None) -> ResidentVectorStore:
+    """get_vector_store() off the event loop, since a first use loads the index from disk."""
+    return await asyncio.to_thread(get_vector_store, repo_name)
+
+def vector_store_stats() -> dict:
+    """Loaded namespaces with their chunk counts and estimated memory, and the LRU limits."""
+    return _registry.stats()
+
+def flush_vector_store():
+    """Flushes pending additions of every loaded namespace to disk."""
+    _registry.flush_all()
+
+@VECTOR_STORE_SECONDS.time(operation="add_docs")
+def add_docs_to_store(new_docs: list, repo_name: str = None):
+    """
+    Incrementally adds new documents to `repo_name`'s resident vector store.
+    The change is searchable immediately and persisted by the write-behind flusher.
+    """
+    print(f"Incrementally adding {len(new_docs)} new documents to the vector store...")
     try:
+        store = get_vector_store(repo_name)
+
         # Split the new documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=100
-        )
-        docs_to_add = text_splitter.split_documents(new_docs)
-        
-        # Add the new chunks to the existing FAISS index
-        db.add_documents(docs_to_add)
-        
-        # Save the updated index back to disk
-        db.save_local(INDEX_PATH)
-        print("✅ Successfully added new documents and saved the updated index.")
+        docs_to_add = _get_text_splitter().split_documents(new_docs)
         
-        # Update the global retriever with the new db state
-        global retriever
-        retriever = db.as_retriever(search_type="mmr", search_kwargs={'k': 5, 'fetch_k': 20})
+        # Add the new chunks to the in-memory FAISS index
+        store.add_documents(docs_to_add)
+        print(f"✅ Added {len(docs_to_add)} chunks to the vector store.")
     except Exception as e:
         print(f"🔥 Error adding documents to vector store: {e}")
 
+@VECTOR_STORE_SECONDS.time(operation="add_kb_entry")
+def add_kb_entry_to_store(record: dict):
+    """
+    Indexes a new KB store entry (as returned by KnowledgeBaseStore.append) in the namespace
+    of the repository it was written for, and removes the chunks of the entry it superseded,
+    so the index only holds live entries.
+    """
+    try:
+        store = get_vector_store(record.get("metadata", {}).get("repo"))
+        chunks, chunk_ids = _split_kb_entry(record)
+        store.add_documents(chunks, ids=chunk_ids)
+        removed = store.delete_kb_entry(record["superseded"]) if record.get("superseded") else 0
+        print(f"✅ Added {len(chunks)} KB chunks to the vector store ({removed} superseded chunks removed).")
+    except Exception as e:
+        print(f"🔥 Error adding KB entry to vector store: {e}")
+
 # --- Main Retriever Function ---
 
-def get_retriever():
+class HybridRetriever(BaseRetriever):
+    """A LangChain retriever over ResidentVectorStore.hybrid_search_with_relevance_scores()."""
+
+    store: Any
+    k: int = 5
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> list:
+        return [doc for doc, _ in self.store.hybrid_search_with_relevance_scores(query, k=self.k)]
+
+def get_retriever(repo_name: str = None):
     """
-    The main function called by the agent.
-    Tries to load an existing index. If it fails,
-    it creates a new one.
-    Returns a LangChain retriever object.
+    Returns a LangChain retriever over `repo_name`'s resident vector store.
+    The index is loaded (or created) on first use.
     """
-    db = load_vector_store()
-    
-    if db is None:
-        print("No existing index found, creating a new one...")
-        db = create_vector_store()
-        if db is None:
-            raise Exception("Failed to create vector store. Check errors above.")
+    store = get_vector_store(repo_name)
+    if HYBRID_SEARCH_ENABLED:
+        return HybridRetriever(store=store, k=5)
 
     # Convert the vector store into a retriever
-    # This is what our agent will use to find relevant docs
     # --- THIS IS THE FIX ---
     # Switch to 'mmr' (Maximal Marginal Relevance) search type. It's more robust,
     # works correctly with COSINE distance, and provides more diverse results.
     # We remove the score_threshold here to let the agent logic handle confidence checking.
-    return db.as_retriever(
+    return store.as_retriever(
         search_type="mmr",
         search_kwargs={'k': 5, 'fetch_k': 20} # Always fetch the top 5 diverse results
     )
@@ -241,12 +1247,23 @@ if __name__ == "__main__":
     
     - To force a rebuild of the index (deletes the old one):
       python vector_store.py --rebuild
+
+    - To re-embed only the files that changed since the last build:
+      python vector_store.py --incremental
     """
     import sys
     import shutil
     
     print("--- Running Vector Store Self-Test ---")
 
+    # With MULTI_WORKER, only modify the index while no server worker is writing it.
+    writer_lock = None
+    if MULTI_WORKER and len(sys.argv) > 1 and sys.argv[1] in ('--rebuild', '--incremental'):
+        writer_lock = FileLock(os.path.join(INDEX_PATH, WRITER_LOCK_FILE))
+        if not writer_lock.try_acquire():
+            print(f"A server worker is writing the index at '{INDEX_PATH}'. Stop the server first.")
+            sys.exit(1)
+
     # --- ADDED: Command-line flag to force a rebuild ---
     if len(sys.argv) > 1 and sys.argv[1] == '--rebuild':
         if os.path.exists(INDEX_PATH):
@@ -271,7 +1288,22 @@ if __name__ == "__main__":
     if not os.listdir(DATA_PATH):
         print(f"Warning: The '{DATA_PATH}' directory is empty.")
         print("Please add your project's documentation (.md files) here for the agent to work correctly.")
+
+    # --- Incremental mode: only re-split and re-embed changed files ---
+    if len(sys.argv) > 1 and sys.argv[1] == '--incremental':
+        print("Found '--incremental' flag. Updating index from the manifest...")
+        start_time = time.perf_counter()
+        report = update_vector_store_incremental()
+        if report is None:
+            print("Incremental update failed. Check errors above.")
+            sys.exit(1)
+        print(f"Incremental update finished in {time.perf_counter() - start_time:.2f}s:")
+        for key, value in report.items():
+            print(f"  {key}: {value}")
         
+    if writer_lock is not None:
+        writer_lock.release()
+
     retriever = get_retriever()
     
     if retriever:
@@ -0,0 +1,84 @@
+import os
+import time
+import asyncio
+from pipeline import StageGraph
+
+# --- Configuration ---
+# Components that fail to initialize (e.g. the model download timed out) are retried this often.
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", 30))
+
+
+class WarmUp:
+    """
+    Initializes slow components (embedding model, vector index, LLM chains) in the background
+    after startup, and records each one's state and timing for the readiness endpoint.
+
+    Components are blocking functions registered with their dependencies. Each round runs
+    the ones that are not ready yet as a StageGraph, in worker threads, so independent
+    components load concurrently. Rounds repeat every `retry_seconds` until all are ready.
+    """
+
+    def __init__(self, retry_seconds: float = WARMUP_RETRY_SECONDS):
+        self.retry_seconds = retry_seconds
+        self._components = {}  # name -> (blocking function, dependency names)
+        self._status = {}
+        self.started_at = None
+        self.ready_at = None
+
+    def component(self, name: str, fn, deps: tuple = ()):
+        """Registers a component. Dependencies must be registered first."""
+        missing = [dep for dep in deps if dep not in self._components]
+        if missing:
+            raise ValueError(f"Component '{name}' depends on unknown components: {missing}")
+        self._components[name] = (fn, tuple(deps))
+        self._status[name] = {"state": "pending", "attempts": 0, "seconds": None, "error": None}
+
+    def is_ready(self) -> bool:
+        return all(status["state"] == "ready" for status in self._status.values())
+
+    async def _load(self, name: str, fn):
+        status = self._status[name]
+        status.update(state="loading", error=None)
+        status["attempts"] += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(fn)
+        except Exception as e:
+            status.update(state="failed", error=str(e), seconds=round(time.perf_counter() - start, 3))
+            raise
+        status.update(state="ready", seconds=round(time.perf_counter() - start, 3))
+
+    def _round(self) -> StageGraph:
+        # One component failing must not stop the others loading.
+        graph = StageGraph(cancel_on_error=False)
+        for name, (fn, deps) in self._components.items():
+            if self._status[name]["state"] == "ready":
+                continue
+
+            async def load(*_, name=name, fn=fn):
+                await self._load(name, fn)
+            graph.stage(name, deps=tuple(dep for dep in deps if self._status[dep]["state"] != "ready"))(load)
+        return graph
+
+    async def run(self):
+        """Loads every component, retrying failures, and returns once all of them are ready."""
+        self.started_at = time.time()
+        while True:
+            print("Warming up AI components...")
+            try:
+                await self._round().run()
+            except Exception as e:
+                print(f"🔥 Warm-up failed: {e}. Retrying in {self.retry_seconds:.0f}s.")
+            if self.is_ready():
+                self.ready_at = time.time()
+                print(f"✅ AI components are ready ({self.ready_at - self.started_at:.1f}s).")
+                return
+            await asyncio.sleep(self.retry_seconds)
+
+    def status(self) -> dict:
+        """Readiness, time to ready, and each component's state, attempts, load time and last error."""
+        return {
+            "ready": self.is_ready(),
+            "ready_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "components": {name: dict(status) for name, status in self._status.items()},
+        }
@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+# --- Configuration ---
+WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", 15))
+WEBHOOK_MAX_WAIT_SECONDS = float(os.getenv("WEBHOOK_MAX_WAIT_SECONDS", 120))
+WEBHOOK_SEEN_DELIVERIES = int(os.getenv("WEBHOOK_SEEN_DELIVERIES", 2000))
+WEBHOOK_SEEN_FILE_DIFFS = int(os.getenv("WEBHOOK_SEEN_FILE_DIFFS", 5000))
+
+
+class EventCoalescer:
+    """
+    Merges webhook events for the same (repo, branch) that arrive within a debounce window
+    into a single agent run.
+
+    Events go straight into the durable job queue: the first one for a key creates a job
+    that runs once the window closes, and each later one is merged into it and restarts
+    the window, up to WEBHOOK_MAX_WAIT_SECONDS after the first. Nothing is held in memory,
+    so pending events survive a restart. When the job runs, its events' file diffs are
+    merged (identical file diffs are kept once), file diffs a recent run already analyzed
+    are dropped, and `run` is called with one agent payload.
+    """
+
+    def __init__(self, queue, run, broadcaster, debounce_seconds: float = WEBHOOK_DEBOUNCE_SECONDS,
+                 max_wait_seconds: float = WEBHOOK_MAX_WAIT_SECONDS):
+        self.queue = queue
+        self.run = run
+        self.broadcaster = broadcaster
+        self.debounce_seconds = debounce_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.coalesced_events = 0
+        self.dropped_file_diffs = 0
+
+    async def add(self, key: tuple, files: list, pr_title: str, pr_number: str, user_name: str) -> tuple:
+        """
+        Queues an event's relevant FileDiffs under `key`, merging it into the run already
+        waiting for that key if there is one. Returns (job id, whether it was merged).
+        Raises QueueFullError if a new run is needed and the queue is full.
+        """
+        repo_name = key[0]
+        event = {
+            "files": [{
+                "fingerprint": hashlib.sha256(f"{repo_name}\0{f.to_concise()}".encode("utf-8")).hexdigest(),
+                "git_diff": "\n".join(f.raw_lines),
+                "concise_diff": f.to_concise(),
+            } for f in files],
+            "pr_title": pr_title, "pr_number": pr_number, "user_name": user_name,
+        }
+        job_id, merged = await self.queue.coalesce(
+            json.dumps(list(key)), {"key": list(key), "events": [event]},
+            self.debounce_seconds, self.max_wait_seconds,
+        )
+        if merged:
+            self.coalesced_events += 1
+        return job_id, merged
+
+    async def run_job(self, payload: dict, job_id: int):
+        """Runs the agent once for a coalesced job's events (the job queue handler for them)."""
+        repo_name, branch = payload["key"]
+        events = payload["events"]
+        merged = OrderedDict()
+        for event in events:
+            for file_diff in event["files"]:
+                merged.setdefault(file_diff["fingerprint"], file_diff)
+
+        # Recorded only now that the run is durably queued; a run that finally fails releases them.
+        already_seen = await self.queue.mark_seen("file_diff", list(merged), job_id, WEBHOOK_SEEN_FILE_DIFFS)
+        files = [file_diff for fingerprint, file_diff in merged.items() if fingerprint not in already_seen]
+        self.dropped_file_diffs += len(merged) - len(files)
+        if not files:
+            await self.broadcaster("log-skip", f"Changes on {branch} were already analyzed in a recent run. Skipping.")
+            return
+
+        last = events[-1]
+        pr_title = last["pr_title"]
+        if len(events) > 1:
+            pr_title = f"{pr_title} (+{len(events) - 1} coalesced events)"
+            await self.broadcaster("log-step", f"Coalesced {len(events)} events on '{branch}' into one run.")
+        if already_seen:
+            await self.broadcaster("log-step", f"Dropped {len(already_seen)} file diffs already analyzed in a recent run.")
+
+        user_names = list(dict.fromkeys(event["user_name"] for event in events))
+        await self.run(
+            git_diff="\n".join(f["git_diff"] for f in files),
+            concise_diff="\n".join(f["concise_diff"] for f in files),
+            pr_title=pr_title,
+            repo_name=repo_name,
+            pr_number=last["pr_number"],
+            user_name=", ".join(user_names),
+        )
+
+    def stats(self) -> dict:
+        return {
+            "coalesced_events": self.coalesced_events,
+            "dropped_file_diffs": self.dropped_file_diffs,
+        }
@@ -49,7 +49,7 @@ export default function App() {
         {errorMessage}
         <AnimatePresence>
           {logs.map(log => (
-            <LogCard key={log.timestamp} log={log} />
+            <LogCard key={log.id || log.timestamp} log={log} />
           ))}
         </AnimatePresence>
       </main>
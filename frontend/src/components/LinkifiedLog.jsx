@@ -1,6 +1,14 @@
 import React from 'react';
 
 export const LinkifiedLog = ({ log }) => {
+  if (log.type === 'log-draft') {
+    return (
+      <>
+        <div className="log-draft-label">{log.label}{log.done ? '' : ' (writing…)'}</div>
+        {log.data}
+      </>
+    );
+  }
   if (log.type !== 'log-action') return <>{log.data}</>;
 
   const urlRegex = /(https?:\/\/[^\s]+)/g;
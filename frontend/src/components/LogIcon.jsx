@@ -7,6 +7,7 @@ export const LogIcon = ({ type }) => {
     'log-skip': '⏭️',
     'log-action': '✅',
     'log-error': '🔥',
+    'log-draft': '✍️',
   };
   return (
     <span className="log-card-icon" aria-hidden="true">
@@ -8,6 +8,20 @@ export function useEventSource(url) {
     setLogs(prev => [{ type, data, timestamp: Date.now() }, ...prev]);
   }, []);
 
+  // Streamed LLM output arrives as 'log-delta' chunks, appended to one draft entry per stream.
+  const addDelta = useCallback((raw) => {
+    const { id, label, text, done } = JSON.parse(raw);
+    setLogs(prev => {
+      const index = prev.findIndex(log => log.id === id);
+      if (index === -1) {
+        return [{ type: 'log-draft', id, label, data: text, done, timestamp: Date.now() }, ...prev];
+      }
+      const next = [...prev];
+      next[index] = { ...prev[index], data: prev[index].data + text, done };
+      return next;
+    });
+  }, []);
+
   useEffect(() => {
     const eventSource = new EventSource(url);
 
@@ -17,6 +31,12 @@ export function useEventSource(url) {
     };
 
     const handleError = (err) => {
+      // While the browser is retrying, keep the connection open so it can resume
+      // with Last-Event-ID and the backend replays the events we missed.
+      if (eventSource.readyState === EventSource.CONNECTING) {
+        setStatus('connecting');
+        return;
+      }
       console.error('EventSource failed:', err);
       setStatus('error');
       eventSource.close();
@@ -27,12 +47,13 @@ export function useEventSource(url) {
     events.forEach(ev =>
       eventSource.addEventListener(ev, e => addLog(ev, e.data))
     );
+    eventSource.addEventListener('log-delta', e => addDelta(e.data));
 
     eventSource.onopen = handleOpen;
     eventSource.onerror = handleError;
 
     return () => eventSource.close();
-  }, [url, addLog]);
+  }, [url, addLog, addDelta]);
 
   return { logs, status };
 }
\ No newline at end of file